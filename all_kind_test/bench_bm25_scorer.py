@@ -0,0 +1,125 @@
+"""
+BM25打分性能对比：rank_bm25.BM25Okapi vs 基于CSR稀疏矩阵的SparseBM25Scorer
+用随机生成的已分词语料(词频服从Zipf分布)模拟知识库分块，分别统计
+1. 构建耗时
+2. 单次查询耗时(打分 + 归一化 + 取top_k)
+3. 两种实现返回的top_k是否一致
+
+运行: python all_kind_test/bench_bm25_scorer.py [分块数 ...]
+默认分块数: 10000 100000 1000000
+"""
+
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from app.utils.bm25_scorer import SparseBM25Scorer
+
+
+VOCAB_SIZE = 50000
+CHUNK_TOKENS = 60
+QUERY_TOKENS = 6
+QUERY_COUNT = 20
+TOP_K = 15
+
+
+def make_corpus(size, rng):
+    """
+    生成size个分块的分词结果，词的编号服从Zipf分布，模拟真实文本的长尾词频
+    """
+    lengths = rng.integers(CHUNK_TOKENS // 2, CHUNK_TOKENS * 3 // 2, size=size)
+    words = (rng.zipf(1.2, size=int(lengths.sum())) - 1) % VOCAB_SIZE
+    corpus = []
+    offset = 0
+    for length in lengths:
+        corpus.append([f"w{w}" for w in words[offset : offset + length]])
+        offset += length
+    return corpus
+
+
+def make_queries(rng):
+    return [
+        [f"w{w}" for w in rng.integers(0, 2000, size=QUERY_TOKENS)]
+        for _ in range(QUERY_COUNT)
+    ]
+
+
+def bm25okapi_search(bm25, query, k):
+    """
+    原来keyword_search中的写法：全量打分，列表推导归一化，np.argsort全排序
+    """
+    doc_scores = bm25.get_scores(query)
+    max_score = (
+        float(np.max(doc_scores))
+        if len(doc_scores) > 0 and np.max(doc_scores) > 0
+        else 1.0
+    )
+    normalized_scores = [score / max_score for score in doc_scores]
+    top_indices = np.argsort(normalized_scores)[::-1][:k]
+    return top_indices, [normalized_scores[idx] for idx in top_indices]
+
+
+def sparse_search(scorer, query, k):
+    top_indices, top_scores, max_score = scorer.top_k(query, k)
+    max_score = max_score if max_score > 0 else 1.0
+    return top_indices, top_scores / max_score
+
+
+def bench(size):
+    rng = np.random.default_rng(42)
+    corpus = make_corpus(size, rng)
+    queries = make_queries(rng)
+
+    print("=" * 60)
+    print(f"分块数={size}, 词表大小={VOCAB_SIZE}, 查询数={QUERY_COUNT}, top_k={TOP_K}")
+
+    start = time.perf_counter()
+    bm25 = BM25Okapi(corpus)
+    okapi_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    term_freqs = []
+    for tokens in corpus:
+        freqs = {}
+        for token in tokens:
+            freqs[token] = freqs.get(token, 0) + 1
+        term_freqs.append(freqs)
+    scorer = SparseBM25Scorer(term_freqs)
+    sparse_build = time.perf_counter() - start
+
+    okapi_times = []
+    sparse_times = []
+    mismatched = 0
+    for query in queries:
+        start = time.perf_counter()
+        okapi_indices, okapi_scores = bm25okapi_search(bm25, query, TOP_K)
+        okapi_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        sparse_indices, sparse_scores = sparse_search(scorer, query, TOP_K)
+        sparse_times.append(time.perf_counter() - start)
+
+        # 只比较分数不为0的结果，分数相同的分块顺序可能不同，所以按分数比较
+        okapi_scores = [score for score in okapi_scores if score != 0]
+        if not np.allclose(okapi_scores, sparse_scores[: len(okapi_scores)]):
+            mismatched += 1
+
+    okapi_ms = np.mean(okapi_times) * 1000
+    sparse_ms = np.mean(sparse_times) * 1000
+    print(f"构建耗时: BM25Okapi={okapi_build:.2f}s  SparseBM25Scorer={sparse_build:.2f}s")
+    print(
+        f"单次查询: BM25Okapi={okapi_ms:.2f}ms  SparseBM25Scorer={sparse_ms:.2f}ms  "
+        f"加速={okapi_ms / sparse_ms:.1f}x"
+    )
+    print(f"top_k分数不一致的查询数: {mismatched}/{QUERY_COUNT}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for size in sizes:
+        bench(size)
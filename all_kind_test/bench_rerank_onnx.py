@@ -0,0 +1,121 @@
+"""
+重排序后端性能对比：sentence_transformers.CrossEncoder(fp32) vs ONNX Runtime(int8动态量化)
+两个后端加载同一个本地 rerankerModel/ms-marco-MiniLM-L6-v2 模型，对相同的(问题, 文档)对打分，分别统计
+1. 每秒处理的文档对个数
+2. 每个问题下两个后端排序的一致性(Spearman相关系数、top_k重合率)
+
+直接调用两个后端的predict，不经过重排序分数缓存
+运行: python all_kind_test/bench_rerank_onnx.py [ONNX线程数 ...]
+默认线程数: 1 和 CPU核数
+"""
+
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from scipy.stats import spearmanr
+
+from app.utils.rerank_factory import LocalReranker, OnnxReranker
+
+
+QUERY_COUNT = 20
+DOCS_PER_QUERY = 45
+TOP_K = 15
+ROUNDS = 3
+
+TOPICS = [
+    "向量数据库",
+    "BM25关键词检索",
+    "交叉编码器重排序",
+    "文档分块",
+    "嵌入模型",
+    "知识库权限",
+    "混合检索",
+    "对象存储",
+]
+
+SENTENCES = [
+    "{topic}是知识库问答系统中的重要组成部分，负责在大量文档中找到和问题相关的内容。",
+    "使用{topic}之前需要先完成配置，配置项包括地址、端口以及超时时间等参数。",
+    "{topic}的性能会受到数据量和硬件的影响，数据量越大，单次请求的耗时越长。",
+    "The {topic} component can be tuned with batch size and thread count to improve throughput.",
+    "当{topic}出现异常时，系统会记录日志并返回降级后的结果，保证接口可用。",
+    "为了提高{topic}的准确率，可以先扩大候选集合，再用更精细的模型排序。",
+]
+
+
+def make_pairs(rng):
+    """
+    为每个问题生成DOCS_PER_QUERY个长短不一的文档，一部分和问题主题相关，一部分无关
+    """
+    queries = []
+    for i in range(QUERY_COUNT):
+        topic = TOPICS[i % len(TOPICS)]
+        question = f"如何提高{topic}的检索效果？"
+        docs = []
+        for _ in range(DOCS_PER_QUERY):
+            doc_topic = topic if rng.random() < 0.4 else rng.choice(TOPICS)
+            count = int(rng.integers(1, 8))
+            sentences = rng.choice(SENTENCES, size=count)
+            docs.append("".join(s.format(topic=doc_topic) for s in sentences))
+        queries.append((question, docs))
+    return queries
+
+
+def timed_predict(reranker, queries):
+    """
+    返回 (每个问题的分数列表, 每秒处理的文档对个数)，取多轮中最快的一轮
+    """
+    best = None
+    all_scores = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        scores = [
+            np.asarray(reranker.predict([[q, d] for d in docs]), dtype=np.float64)
+            for q, docs in queries
+        ]
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+            all_scores = scores
+    pairs = sum(len(docs) for _, docs in queries)
+    return all_scores, pairs / best
+
+
+def compare(local_scores, onnx_scores):
+    spearman = []
+    overlap = []
+    for a, b in zip(local_scores, onnx_scores):
+        spearman.append(spearmanr(a, b).statistic)
+        top_a = set(np.argsort(-a, kind="stable")[:TOP_K])
+        top_b = set(np.argsort(-b, kind="stable")[:TOP_K])
+        overlap.append(len(top_a & top_b) / TOP_K)
+    return float(np.mean(spearman)), float(np.mean(overlap))
+
+
+def bench(thread_counts):
+    rng = np.random.default_rng(42)
+    queries = make_pairs(rng)
+    print(f"问题数={QUERY_COUNT} 每个问题的文档数={DOCS_PER_QUERY}")
+
+    local = LocalReranker()
+    local_scores, local_rate = timed_predict(local, queries)
+    print(f"CrossEncoder(fp32): {local_rate:.1f} 对/秒")
+
+    for num_threads in thread_counts:
+        onnx = OnnxReranker(num_threads=num_threads)
+        onnx_scores, onnx_rate = timed_predict(onnx, queries)
+        spearman, overlap = compare(local_scores, onnx_scores)
+        print(
+            f"ONNX int8 线程数={num_threads}: {onnx_rate:.1f} 对/秒  "
+            f"加速={onnx_rate / local_rate:.1f}x  "
+            f"Spearman={spearman:.4f}  top{TOP_K}重合率={overlap:.2%}"
+        )
+
+
+if __name__ == "__main__":
+    threads = [int(arg) for arg in sys.argv[1:]] or sorted({1, os.cpu_count() or 1})
+    bench(threads)
@@ -0,0 +1,78 @@
+"""
+启动耗时统计：每一项都在新的子进程中测量，避免模块已经导入造成的误差
+1. import app 的耗时
+2. create_app() 的耗时（包括导入所有蓝图和服务模块）
+3. 第一个请求 /health/live 的耗时（不加载模型）
+4. warmup() 预热所有服务的耗时，以及每个服务是否预热成功
+
+运行: python all_kind_test/bench_startup.py [重复次数]
+默认重复次数: 3，取中位数
+"""
+
+import sys
+import os
+import json
+import subprocess
+import statistics
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_SCRIPT = r"""
+import json
+import time
+
+start = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+flask_app = app.create_app()
+create_app_ms = (time.perf_counter() - start) * 1000
+
+client = flask_app.test_client()
+start = time.perf_counter()
+client.get("/health/live")
+first_request_ms = (time.perf_counter() - start) * 1000
+
+from app.init import warmup_services
+
+start = time.perf_counter()
+warmup_results = warmup_services()
+warmup_ms = (time.perf_counter() - start) * 1000
+
+print(json.dumps({
+    "import_ms": import_ms,
+    "create_app_ms": create_app_ms,
+    "first_request_ms": first_request_ms,
+    "warmup_ms": warmup_ms,
+    "warmup": {name: result["ok"] for name, result in warmup_results.items()},
+}))
+"""
+
+
+def run_once():
+    env = dict(os.environ, LOG_ENABLE_CONSOLE="false", WARMUP_ON_STARTUP="false")
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # 只取最后一行的统计结果，前面可能有第三方库的输出
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench(rounds):
+    results = [run_once() for _ in range(rounds)]
+    for field in ("import_ms", "create_app_ms", "first_request_ms", "warmup_ms"):
+        values = [result[field] for result in results]
+        print(f"{field}: 中位数={statistics.median(values):.0f}ms  全部={[round(v) for v in values]}")
+    print(f"预热结果: {results[-1]['warmup']}")
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    bench(rounds)
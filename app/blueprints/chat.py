@@ -11,8 +11,11 @@ from flask import Blueprint, render_template, request, Response, stream_with_con
 # 导入日志获取方法（日志系统会在首次使用时自动从 Config 获取配置并初始化）
 from app.utils.logger import get_logger
 
+from app.config import Config
+
 from app.http.utils import error_response, success_response
 from app.services.chat_service import chat_service
+from app.services.rag_services import rag_service
 from app.services.knowledge_service import knowledge_service
 
 from app.utils.auth import get_current_user 
@@ -44,6 +47,43 @@ def llm_chat():
 
     return render_template("chat.html",knowledgebases=knowledgebase_list["items"])
 
+@bp.route("/batch_retrieve", methods=["POST"])
+def batch_retrieve():
+    """
+    对同一个知识库批量检索多个问题，只返回检索到的文档，不调用大模型
+    请求参数 {"kb_id": 知识库id, "questions": [问题1, 问题2], "retrieval_mode": vector|keyword|hybrid(可选)}
+    """
+    request_json_params = request.get_json() or {}
+    kb_id = request_json_params.get("kb_id")
+    questions_list = request_json_params.get("questions")
+    retrieval_mode = request_json_params.get("retrieval_mode")
+
+    if not kb_id:
+        return error_response("知识库ID不能为空", 400)
+
+    if not questions_list or not isinstance(questions_list, list):
+        return error_response("questions必须是非空的问题列表", 400)
+
+    if len(questions_list) > Config.BATCH_RETRIEVE_MAX_QUESTIONS:
+        return error_response(f"一次最多检索{Config.BATCH_RETRIEVE_MAX_QUESTIONS}个问题", 400)
+
+    current_user = get_current_user()
+
+    knowledgebase_model_dict = knowledge_service.get_by_id(kb_id)
+    if not knowledgebase_model_dict:
+        return error_response(f"知识库ID={kb_id}不存在", 400)
+
+    if knowledgebase_model_dict.get("user_id") != current_user.get("id"):
+        return error_response(f"知识库ID={kb_id}不属于当前用户", 400)
+
+    try:
+        results = rag_service.batch_retrieve(kb_id, questions_list, retrieval_mode=retrieval_mode)
+        return success_response(results)
+    except Exception as e:
+        logger.error(f"知识库ID={kb_id}批量检索失败:{str(e)}")
+        return error_response(f"批量检索失败,{str(e)}", 500)
+
+
 @bp.route("/llm", methods=["POST"])
 def chat_with_llm():
     request_json_params = request.get_json()
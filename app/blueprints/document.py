@@ -128,9 +128,22 @@ def get_document_chunks(document_id):
     kb_model_dict = knowledge_service.query_knowlege_by_id(kb_id)
     if not kb_model_dict:
         return error_response(f"知识库id={kb_id}不存在", 400)
+    # 获取分页参数
+    page, page_size = get_pagination_params(max_page_size=200)
     try:
         logger.info(f"查询到的知识库模型={kb_model_dict}" )
-        chunks = document_service.query_chunks(kb_id,document_id)
-        return  render_template("document_chunks.html",kb=kb_model_dict, chunks=chunks,document=doc_model_dict)
+        chunks = document_service.query_chunks(kb_id, document_id, page=page, page_size=page_size)
+        pagination = {
+            "page": page,
+            "page_size": page_size,
+            "total": doc_model_dict.get("chunk_count") or 0,
+        }
+        return render_template(
+            "document_chunks.html",
+            kb=kb_model_dict,
+            chunks=chunks,
+            document=doc_model_dict,
+            pagination=pagination,
+        )
     except Exception as e:
         return error_response(f"查询文档id={document_id}的分块失败,{str(e)}", 500)
@@ -0,0 +1,35 @@
+"""
+健康检查的路由
+/health/live 只表示进程存活，不加载任何模型
+/health/ready 预热嵌入模型、重排序模型、向量库客户端等服务，全部可用后返回成功，可以作为容器的就绪探针
+"""
+
+from flask import Blueprint
+
+from app.http.utils import error_response, success_response
+from app.services.service_registry import service_registry
+
+# 导入日志获取方法（日志系统会在首次使用时自动从 Config 获取配置并初始化）
+from app.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+bp = Blueprint("health", __name__, url_prefix="/health")
+
+
+@bp.route("/live", methods=["GET"])
+def live():
+    return success_response(service_registry.status())
+
+
+@bp.route("/ready", methods=["GET"])
+def ready():
+    """
+    已经创建过的服务直接返回，没有创建的服务并发创建
+    """
+    results = service_registry.warmup()
+    if all(result["ok"] for result in results.values()):
+        return success_response(results)
+    return error_response(message="服务未就绪", code=503, data=results)
@@ -0,0 +1,25 @@
+"""
+运行状态监控的路由
+"""
+
+from flask import Blueprint
+
+from app.http.utils import success_response
+from app.services.cache_service import get_cache_stats
+
+# 导入日志获取方法（日志系统会在首次使用时自动从 Config 获取配置并初始化）
+from app.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+bp = Blueprint("monitor", __name__, url_prefix="/monitor")
+
+
+@bp.route("/cache", methods=["GET"])
+def cache_stats():
+    """
+    查看各个缓存的容量、命中次数、未命中次数和命中率
+    """
+    return success_response(get_cache_stats())
@@ -60,7 +60,33 @@ class Config:
 
     # 无序鉴权的接口URL配置
     # ["/login", "/register"]  # 无需鉴权的白名单路径
-    NO_AUTH_URLS = ["/login", "/register", "/static"]
+    NO_AUTH_URLS = ["/login", "/register", "/static", "/health"]
+
+    # 服务启动后是否在后台线程中预热嵌入模型、重排序模型和向量库客户端
+    WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+    # 文档处理任务队列配置，任务保存在数据库document_job表中
+    # 是否在web进程内运行文档处理worker，单独部署worker(python worker.py)时设置为false
+    DOCUMENT_WORKER_IN_WEB = (
+        os.environ.get("DOCUMENT_WORKER_IN_WEB", "true").lower() == "true"
+    )
+    # 每个worker进程同时处理的任务数
+    DOCUMENT_WORKER_CONCURRENCY = int(os.environ.get("DOCUMENT_WORKER_CONCURRENCY", 2))
+    # 没有任务时轮询数据库的间隔(秒)
+    DOCUMENT_WORKER_POLL_INTERVAL = float(
+        os.environ.get("DOCUMENT_WORKER_POLL_INTERVAL", 2)
+    )
+    # 任务租约时长(秒)，worker崩溃后超过该时间任务会被其它worker重新领取
+    DOCUMENT_JOB_LEASE_SECONDS = int(os.environ.get("DOCUMENT_JOB_LEASE_SECONDS", 300))
+    # 每个任务最多处理的次数（包括第一次）
+    DOCUMENT_JOB_MAX_ATTEMPTS = int(os.environ.get("DOCUMENT_JOB_MAX_ATTEMPTS", 3))
+    # 失败重试的等待时间(秒)，每次失败后翻倍，不超过上限
+    DOCUMENT_JOB_RETRY_BACKOFF = float(os.environ.get("DOCUMENT_JOB_RETRY_BACKOFF", 30))
+    DOCUMENT_JOB_RETRY_BACKOFF_MAX = float(
+        os.environ.get("DOCUMENT_JOB_RETRY_BACKOFF_MAX", 600)
+    )
+    # 最多排队的任务数，超过后拒绝提交，0表示不限制
+    DOCUMENT_JOB_MAX_QUEUED = int(os.environ.get("DOCUMENT_JOB_MAX_QUEUED", 1000))
 
     # mysql数据库连接配置
     DB_HOST = os.environ.get("DB_HOST", "localhost")
@@ -100,10 +126,32 @@ class Config:
     OLLAMA_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 
     # 指定向量数据库的类型
-    VECTOR_DB_TYPE = os.environ.get("VECTOR_DB_TYPE", "milvus")  # chroma 或 milvus
+    VECTOR_DB_TYPE = os.environ.get("VECTOR_DB_TYPE", "milvus")  # chroma、milvus 或 local
     # 指定 chroma向量数据库的本地存储目录
     CHROMA_PERSIST_DIRECTORY = os.environ.get("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
 
+    # 内置本地向量数据库(VECTOR_DB_TYPE=local)的配置
+    # 数据保存目录，每个集合一个子目录
+    LOCAL_VECTOR_DIRECTORY = os.environ.get("LOCAL_VECTOR_DIRECTORY", "./local_vector_db")
+    # 向量的存储类型 float32 或 float16，float16占用一半的磁盘和内存，精度略有损失
+    LOCAL_VECTOR_DTYPE = os.environ.get("LOCAL_VECTOR_DTYPE", "float32")
+    # 每个段最多保存的分块个数，写满后新建段
+    LOCAL_SEGMENT_MAX_ROWS = int(os.environ.get("LOCAL_SEGMENT_MAX_ROWS", 50000))
+    # 已删除分块占比达到该值时自动压缩集合
+    LOCAL_COMPACT_TOMBSTONE_RATIO = float(
+        os.environ.get("LOCAL_COMPACT_TOMBSTONE_RATIO", 0.3)
+    )
+    # 新建集合默认的量化方式 none 或 int8，int8检索时只扫描量化向量，内存占用约为float32的1/4
+    LOCAL_VECTOR_QUANTIZATION = os.environ.get("LOCAL_VECTOR_QUANTIZATION", "none")
+    # 单独使用int8量化的知识库集合，多个集合用逗号分隔，例如 kb_1_collection,kb_2_collection
+    LOCAL_QUANTIZED_COLLECTIONS = [
+        name.strip()
+        for name in os.environ.get("LOCAL_QUANTIZED_COLLECTIONS", "").split(",")
+        if name.strip()
+    ]
+    # int8量化检索时取 top_k * 该值 个候选，再用原始向量精确计算分数
+    LOCAL_RESCORE_FACTOR = int(os.environ.get("LOCAL_RESCORE_FACTOR", 4))
+
     # 配置Milvus向量数据库的连接参数
     MILVUS_HOST = os.environ.get("MILVUS_HOST", "localhost")  # 这个是本地的ip地址
 
@@ -111,6 +159,102 @@ class Config:
 
     MILVUS_PORT = os.environ.get("MILVUS_PORT", "19530")
 
+    # Milvus集合加载配置
+    # 服务启动时预加载的常用集合，多个集合用逗号分隔，例如 kb_1_collection,kb_2_collection
+    MILVUS_PRELOAD_COLLECTIONS = [
+        name.strip()
+        for name in os.environ.get("MILVUS_PRELOAD_COLLECTIONS", "").split(",")
+        if name.strip()
+    ]
+    # 集合超过多少秒没有被检索就从Milvus内存中释放，0表示不释放
+    MILVUS_COLLECTION_IDLE_SECONDS = int(
+        os.environ.get("MILVUS_COLLECTION_IDLE_SECONDS", 1800)
+    )
+    # 最多同时加载的集合数，超过后释放最久没有使用的集合，0表示不限制
+    MILVUS_MAX_LOADED_COLLECTIONS = int(
+        os.environ.get("MILVUS_MAX_LOADED_COLLECTIONS", 0)
+    )
+    # 写入和删除后合并flush的时间窗口(秒)，0表示每次写入后立即flush
+    MILVUS_FLUSH_INTERVAL = float(os.environ.get("MILVUS_FLUSH_INTERVAL", 5))
+    # 未flush的行数达到该值时立即flush
+    MILVUS_FLUSH_MAX_PENDING_ROWS = int(
+        os.environ.get("MILVUS_FLUSH_MAX_PENDING_ROWS", 10000)
+    )
+
+    # pdf并行解析配置：页数多的pdf按页切分后交给多个进程同时解析
+    # 解析进程数，小于等于1时不并行，所有页在当前进程中解析
+    PDF_PARSE_WORKERS = int(os.environ.get("PDF_PARSE_WORKERS", 0))
+    # pdf页数达到该值才并行解析，页数少时启动进程的开销大于收益
+    PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 100))
+    # 每个进程一次解析的页数
+    PDF_PARSE_PAGES_PER_TASK = int(os.environ.get("PDF_PARSE_PAGES_PER_TASK", 16))
+
+    # 文档入库时每批向量化并写入向量数据库的分块个数
+    VECTOR_INSERT_BATCH_SIZE = int(os.environ.get("VECTOR_INSERT_BATCH_SIZE", 64))
+    # 流式入库时相邻两个阶段（解析、分割、向量化、写入）之间的队列最多缓存的页数或批数
+    INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 4))
+
+    # 分批扫描向量数据库集合时每批的分块个数
+    VECTOR_SCAN_PAGE_SIZE = int(os.environ.get("VECTOR_SCAN_PAGE_SIZE", 1000))
+
+    # BM25关键词检索的倒排索引保存目录，每个知识库集合对应一个索引文件
+    BM25_INDEX_DIRECTORY = os.environ.get("BM25_INDEX_DIRECTORY", "./bm25_index")
+    # BM25索引的修改日志超过基础索引大小的多少倍时压缩为新的基础索引
+    BM25_LOG_COMPACT_RATIO = float(os.environ.get("BM25_LOG_COMPACT_RATIO", 0.5))
+
+    # 混合检索配置
+    # 并发执行向量检索和全文检索的线程池大小
+    HYBRID_SEARCH_WORKERS = int(os.environ.get("HYBRID_SEARCH_WORKERS", 8))
+    # 向量检索一路的超时时间(秒)，超时后只使用全文检索的结果
+    HYBRID_VECTOR_TIMEOUT = float(os.environ.get("HYBRID_VECTOR_TIMEOUT", 10))
+    # 全文检索一路的超时时间(秒)，超时后只使用向量检索的结果
+    HYBRID_KEYWORD_TIMEOUT = float(os.environ.get("HYBRID_KEYWORD_TIMEOUT", 5))
+
+    # 批量检索接口一次最多检索的问题个数
+    BATCH_RETRIEVE_MAX_QUESTIONS = int(os.environ.get("BATCH_RETRIEVE_MAX_QUESTIONS", 50))
+
+    # 检索结果缓存配置，相同知识库的相同问题直接返回缓存的检索结果
+    # 最多缓存的检索结果条数，0表示关闭缓存
+    RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", 1024))
+    # 检索结果的缓存时间(秒)
+    RETRIEVAL_CACHE_TTL = int(os.environ.get("RETRIEVAL_CACHE_TTL", 300))
+    # 缓存版本号的保存目录，web服务的多个进程和worker进程通过这里的版本号让彼此的检索结果缓存失效
+    CACHE_VERSION_DIRECTORY = os.environ.get("CACHE_VERSION_DIRECTORY", "./cache_versions")
+
+    # 查询向量缓存配置，相同嵌入模型下相同的问题只做一次向量化
+    # 最多缓存的查询向量个数，0表示关闭缓存
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 2048))
+    # 查询向量的缓存时间(秒)，同一个模型对同一段文本的向量是固定的，默认不过期
+    QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", 0))
+
+    # 重排序分数缓存配置，相同问题和相同分块的相关性分数只用交叉编码器计算一次
+    # 最多缓存的(问题, 分块)分数个数，0表示关闭缓存
+    RERANK_SCORE_CACHE_SIZE = int(os.environ.get("RERANK_SCORE_CACHE_SIZE", 20000))
+    # 重排序分数的缓存时间(秒)
+    RERANK_SCORE_CACHE_TTL = int(os.environ.get("RERANK_SCORE_CACHE_TTL", 3600))
+
+    # 重排序模式配置
+    # full: 只对top_k个文档重排序；budget: 从更大的候选池中按时间预算分批重排序
+    RERANK_MODE = os.environ.get("RERANK_MODE", "full")
+    # budget模式下每次请求重排序的时间预算(毫秒)，预算用完后剩余的候选文档保持第一阶段检索的顺序
+    RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", 300))
+    # budget模式下每批交给交叉编码器打分的文档个数
+    RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", 8))
+    # budget模式下候选池大小为 top_k * RERANK_POOL_FACTOR
+    RERANK_POOL_FACTOR = int(os.environ.get("RERANK_POOL_FACTOR", 3))
+    # budget模式下第top_k名和第top_k+1名的第一阶段分数差占第1名分数的比例达到该值时，认为排序已经足够明确，跳过重排序
+    RERANK_SKIP_MARGIN = float(os.environ.get("RERANK_SKIP_MARGIN", 0.2))
+
+    # 重排序后端配置，用户设置中没有配置rerank_backend时使用
+    # local: sentence_transformers的CrossEncoder(fp32)；onnx: ONNX Runtime运行int8动态量化后的同一个模型
+    RERANK_BACKEND = os.environ.get("RERANK_BACKEND", "local")
+    # ONNX重排序模型的推理线程数，0表示由ONNX Runtime根据CPU核数决定
+    RERANK_ONNX_THREADS = int(os.environ.get("RERANK_ONNX_THREADS", 0))
+    # ONNX重排序每批推理的文档对个数
+    RERANK_ONNX_BATCH_SIZE = int(os.environ.get("RERANK_ONNX_BATCH_SIZE", 32))
+    # ONNX重排序输入的最大token数，超出部分截断
+    RERANK_ONNX_MAX_LENGTH = int(os.environ.get("RERANK_ONNX_MAX_LENGTH", 512))
+
 
 # config = Config()
 # print("config.LOG_DIR=", config.LOG_DIR)
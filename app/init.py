@@ -26,6 +26,29 @@ from app.utils.auth import get_current_user
 from app.http.utils import request_interceptor,response_interceptor
 
 
+def warmup_services():
+    """
+    并发创建服务注册表中所有懒加载的服务，返回每个服务的预热结果
+    """
+    # 导入服务模块，把服务注册到服务注册表中，导入本身不会加载模型
+    import app.services.chat_service  # noqa: F401
+    import app.services.knowledge_service  # noqa: F401
+    from app.services.service_registry import service_registry
+
+    return service_registry.warmup()
+
+
+def start_embedded_worker():
+    """
+    在web进程内以后台线程运行文档处理worker，单进程部署时不需要单独启动 python worker.py
+    """
+    from app.services.document_worker import DocumentWorker
+
+    worker = DocumentWorker()
+    worker.start()
+    return worker
+
+
 def create_app(config_class=Config):
 
     # 获取名称为当前模块的日志记录器
@@ -93,6 +116,14 @@ def create_app(config_class=Config):
     for blueprint in get_all_blueprints():
         app.register_blueprint(blueprint)
 
+    # 注册预热命令: flask --app main warmup
+    @app.cli.command("warmup")
+    def warmup_command():
+        """
+        预热嵌入模型、重排序模型、向量库客户端等服务
+        """
+        warmup_services()
+
 
     # 返回创建的Flask应用实例
     return app
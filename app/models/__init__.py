@@ -3,6 +3,7 @@ from app.models.user import User
 from app.models.knowledgebase import Knowledgebase
 from app.models.settings import Settings
 from app.models.document import DocumentModel
+from app.models.document_job import DocumentJobModel
 from app.models.chat_session import ChatSession
 from app.models.chat_message import ChatMessage
 
@@ -13,6 +14,7 @@ __all__ = [
     "Knowledgebase",
     "Settings",
     "DocumentModel",
+    "DocumentJobModel",
     "ChatSession",
     "ChatMessage",
 ]
@@ -0,0 +1,60 @@
+from sqlalchemy import (
+    Column,
+    String,
+    DateTime,
+    Integer,
+    Text,
+    ForeignKey,
+    Index,
+)
+from sqlalchemy.sql import func
+import uuid
+from app.models.base import BaseModel
+
+
+class DocumentJobModel(BaseModel):
+    """
+    文档处理任务，web服务只负责写入任务，由独立的worker进程领取并处理
+    状态: queued 等待处理 -> running 处理中 -> succeeded 处理成功 / failed 重试次数用完后失败
+    处理失败且还有重试次数时回到queued，available_at之后才能再次被领取
+    """
+
+    # 指定数据库表名为document_job
+    __tablename__ = "document_job"
+    # 指定__repr__显示的字段
+    __repr_fields__ = ["id", "doc_id", "status"]
+    id = Column(String(32), primary_key=True, default=lambda: uuid.uuid4().hex[:32])
+    # 要处理的文档，文档删除时级联删除任务
+    doc_id = Column(
+        String(32),
+        ForeignKey("document.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # 文档名称，用于日志
+    doc_name = Column(String(255), nullable=True)
+    # 任务状态
+    status = Column(String(32), nullable=False, default="queued")
+    # 优先级，数字越大越先处理
+    priority = Column(Integer, nullable=False, default=0)
+    # 已经领取的次数（包括正在进行的这一次）
+    attempts = Column(Integer, nullable=False, default=0)
+    # 最多领取的次数
+    max_attempts = Column(Integer, nullable=False, default=3)
+    # 在这个时间之后才能被领取，失败重试时用来实现退避
+    available_at = Column(DateTime, nullable=False)
+    # 领取任务的worker标识
+    lease_owner = Column(String(128), nullable=True)
+    # 租约到期时间，worker进程崩溃后租约到期，任务可以被其它worker重新领取
+    lease_expires_at = Column(DateTime, nullable=True)
+    # 最近一次失败的错误消息
+    last_error = Column(Text, nullable=True)
+    # 创建时间
+    created_at = Column(DateTime, default=func.now(), index=True)
+    # 更新时间
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    # 领取任务时按 状态、优先级、可领取时间 查询
+    __table_args__ = (
+        Index("idx_job_claim", "status", "priority", "available_at"),
+    )
@@ -0,0 +1,156 @@
+"""
+检索链路上的各种缓存
+只依赖配置和缓存工具，文档服务、知识库服务可以直接导入来做缓存失效，不会引入模型和向量库
+"""
+
+import copy
+import hashlib
+
+from app.config import Config
+from app.utils.cache import LRUTTLCache, SharedVersions
+from app.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def normalize_text(text, casefold=True):
+    """
+    归一化问题文本：去掉首尾空白，合并连续空白，英文统一小写
+    casefold=False时不改变大小写，用于大小写敏感的场景（比如有的嵌入模型区分大小写）
+    """
+    text = " ".join((text or "").split())
+    return text.casefold() if casefold else text
+
+
+class RetrievalCache:
+    """
+    知识库检索结果缓存，缓存 RagService._retrieve_knowledgebase_context 的结果
+    key = (kb_id, 知识库版本号, 归一化后的问题, 检索模式, top_k, 阈值, 权重)
+    问题只合并空白不改变大小写，和嵌入、重排序缓存的key一致，大小写敏感的模型不会命中其他写法的结果
+    知识库的文档有变化时版本号加1，正在进行中的检索即使在失效之后才写入缓存，也是写到旧版本号下，不会被读到
+    版本号保存在磁盘上由所有进程共享，worker进程处理完文档后加1，web服务的各个进程都会失效
+    """
+
+    def __init__(self):
+        self._cache = LRUTTLCache(
+            "retrieval",
+            maxsize=Config.RETRIEVAL_CACHE_SIZE,
+            ttl=Config.RETRIEVAL_CACHE_TTL,
+        )
+        # kb_id -> 版本号，多个进程共享
+        self._generations = SharedVersions(Config.CACHE_VERSION_DIRECTORY)
+
+    def _generation(self, kb_id):
+        return self._generations.get(kb_id)
+
+    def make_key(self, kb_id, questions, settings):
+        return (
+            kb_id,
+            self._generation(kb_id),
+            normalize_text(questions, casefold=False),
+            settings.get("retrieval_mode", "vector"),
+            settings.get("top_k"),
+            settings.get("vector_threshold"),
+            settings.get("keyword_threshold"),
+            settings.get("vector_weight"),
+        )
+
+    def get(self, key):
+        docs = self._cache.get(key)
+        # 返回文档的深拷贝，调用方修改文档的元数据（比如写入重排序分数）不影响缓存
+        return copy.deepcopy(docs) if docs is not None else None
+
+    def set(self, key, docs):
+        # 写入时也拷贝一份，写入缓存后调用方继续修改的文档不会改到缓存中的文档
+        self._cache.set(key, copy.deepcopy(list(docs)))
+
+    def invalidate_kb(self, kb_id):
+        """
+        知识库的文档新增、重新处理、删除后调用，使该知识库的所有缓存失效
+        """
+        self._generations.bump(kb_id)
+        removed = self._cache.invalidate(lambda key: key[0] == kb_id)
+        logger.info(f"知识库{kb_id}的检索结果缓存已失效,删除了{removed}条缓存")
+
+    def stats(self):
+        return self._cache.stats()
+
+
+retrieval_cache = RetrievalCache()
+
+
+# 查询向量缓存 key = (嵌入模型, 归一化后的问题) value = 查询向量
+query_embedding_cache = LRUTTLCache(
+    "query_embedding",
+    maxsize=Config.QUERY_EMBEDDING_CACHE_SIZE,
+    ttl=Config.QUERY_EMBEDDING_CACHE_TTL,
+)
+
+
+
+class RerankScoreCache:
+    """
+    交叉编码器重排序分数缓存，只有没见过的(问题, 分块)才交给模型计算
+    key = (问题, 文档id, 分块id, 分块内容hash, 重排序后端)，缓存的是模型输出的原始分数，归一化在每次重排序时重新计算
+    不同后端（比如量化后的ONNX模型）输出的分数有细微差别，按后端分开缓存
+    文档重新处理或删除时按文档id删除缓存；分块内容hash保证内容变化后不会用到旧分数
+    key中已经包含分块内容hash，其它进程重新处理文档后这里不会读到旧分数，所以不需要像检索结果缓存那样跨进程失效，
+    本进程内按文档id删除只是为了尽早释放空间
+    """
+
+    def __init__(self):
+        self._cache = LRUTTLCache(
+            "rerank_score",
+            maxsize=Config.RERANK_SCORE_CACHE_SIZE,
+            ttl=Config.RERANK_SCORE_CACHE_TTL,
+        )
+
+    def make_key(self, query, doc, backend="local"):
+        """
+        根据问题和langchain的Document生成缓存key，没有分块id的文档不缓存，返回None
+        """
+        chunk_id = doc.metadata.get("chunk_id") or doc.id
+        if not chunk_id:
+            return None
+        content_hash = hashlib.md5(doc.page_content.encode("utf-8")).hexdigest()
+        return (
+            normalize_text(query, casefold=False),
+            doc.metadata.get("doc_id", ""),
+            chunk_id,
+            content_hash,
+            backend,
+        )
+
+    def get(self, key):
+        if key is None:
+            return None
+        return self._cache.get(key)
+
+    def set(self, key, score):
+        if key is not None:
+            self._cache.set(key, score)
+
+    def invalidate_document(self, doc_id):
+        """
+        文档重新处理或删除后调用，删除该文档所有分块的重排序分数
+        """
+        removed = self._cache.invalidate(lambda key: key[1] == doc_id)
+        logger.info(f"文档{doc_id}的重排序分数缓存已失效,删除了{removed}条缓存")
+
+    def stats(self):
+        return self._cache.stats()
+
+
+rerank_score_cache = RerankScoreCache()
+
+
+def get_cache_stats():
+    """
+    汇总所有缓存的命中/未命中统计，用于监控
+    """
+    return [
+        retrieval_cache.stats(),
+        query_embedding_cache.stats(),
+        rerank_score_cache.stats(),
+    ]
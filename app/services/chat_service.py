@@ -7,6 +7,7 @@ from app.utils.llm_factory import LLMFactory
 from app.models.chat_session import ChatSession
 from app.models.chat_message import ChatMessage
 from app.services.rag_services import rag_service
+from app.services.service_registry import service_registry
 
 
 logger = get_logger(__name__)
@@ -257,4 +258,5 @@ class ChatService(BaseService):
             logger.info(f"获取会话消息成功,会话ID={session_id},用户ID={user_id},消息数量={len(chatMessages)}")
             return [chatMessage.to_dict() for chatMessage in chatMessages]
 
-chat_service = ChatService()
+# 数据库中的设置在第一次使用时才加载
+chat_service = service_registry.register("chat", ChatService)
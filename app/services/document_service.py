@@ -1,14 +1,15 @@
 import uuid
 from app.models.knowledgebase import Knowledgebase
 from app.models.document import DocumentModel
+from app.models.document_job import DocumentJobModel
 from app.services.base_service import BaseService
 from app.utils.logger import get_logger
 from app.utils.tool import get_file_extension
 
 from app.utils.text_splitter import TextSplitter
 
-# 导入线程池来优化并发问题,一般线程数的设置个数，推荐的原则是cpu的核数+4
-from concurrent.futures import ThreadPoolExecutor
+# 导入持久化的文档处理任务队列
+from app.services.job_queue_service import job_queue_service, LeaseLost
 
 
 # 导入文件上传的存储服务storage_service
@@ -20,7 +21,28 @@ from app.services.parse_service import parse_service
 # 导入将分块的文本进行向量化的服务
 from app.services.vector_db.vector_sevice import vector_db_service
 
-from langchain_core.documents import Document
+# 导入BM25关键词检索的倒排索引服务
+from app.services.keyword_index_service import keyword_index_service
+
+# 导入检索结果缓存和重排序分数缓存，文档变化时让相关的缓存失效
+from app.services.cache_service import retrieval_cache, rerank_score_cache
+
+from app.config import Config
+from app.utils.pipeline import StreamingPipeline
+
+
+# 文档状态机：当前状态 -> 允许切换到的状态
+# processing 是之前版本的处理中状态，兼容升级前停留在该状态的文档
+# parsing、embedding 也允许重新进入parsing：worker崩溃后任务被重新领取时重新处理
+# parsing、embedding 处理失败且任务还会重试时回到pending，重试次数用完后由任务队列标记为failed
+DOCUMENT_STATUS_TRANSITIONS = {
+    "pending": ("parsing", "failed"),
+    "parsing": ("pending", "parsing", "embedding", "failed"),
+    "embedding": ("pending", "parsing", "completed", "failed"),
+    "completed": ("parsing",),
+    "failed": ("parsing",),
+    "processing": ("parsing", "failed"),
+}
 
 
 class DocumentService(BaseService[DocumentModel]):
@@ -28,9 +50,6 @@ class DocumentService(BaseService[DocumentModel]):
     def __init__(self):
         self.logger = get_logger(self.__class__.__name__)
 
-        # 初始化线程池执行器
-        self.thread_pool_executor = ThreadPoolExecutor(max_workers=4)
-
     def upload(self, kb_id, file_data, file_name):
         self.logger.info(f"document_service====={file_name}")
         # 1.先查询知识库是否存在
@@ -110,7 +129,7 @@ class DocumentService(BaseService[DocumentModel]):
             self.logger.info(f"查询到的文档列表分页信息{query_data}")
             return query_data
 
-    def process(self, doc_id, doc_name):
+    def process(self, doc_id, doc_name, priority=0):
         with self.create_db_session() as session:
             document_model = (
                 session.query(DocumentModel).filter(DocumentModel.id == doc_id).first()
@@ -120,170 +139,275 @@ class DocumentService(BaseService[DocumentModel]):
                 raise ValueError(f"{doc_name}不存在")
 
         """
-        把self._process_document(doc_id, doc_name)
-        用下面的线程池来提交
-        利用线程池来优化前端并发 提交的文档处理,future类似promise
-        
+        把文档处理任务写入持久化的任务队列(document_job表)，由worker领取后调用self._process_document(doc_id, doc_name)
+        服务重启后排队中的任务不会丢失，worker可以和web服务分开部署
         """
+        return job_queue_service.enqueue(doc_id, doc_name, priority=priority)
 
-        future = self.thread_pool_executor.submit(
-            self._process_document, doc_id, doc_name
-        )
-
-        # 线程执行的回调函数
-        def get_thread_executor_result_callback(future):
-            try:
-                res = future.result()
-            except Exception as e:
-                raise ValueError(f"文档处理任务异常:{doc_id},原因:{str(e)}")
-
-        # 添加回调
-        future.add_done_callback(get_thread_executor_result_callback)
-
-    def _process_document(self, doc_id, doc_name):
-        try:
-            # 考虑到文件比较大，要利用多线程处理文档，
-            self.logger.info(f"开始利用多线程处理{doc_name}文档")
-            with self.create_db_transaction() as session:
-                doc_model = (
-                    session.query(DocumentModel)
-                    .filter(DocumentModel.id == doc_id)
-                    .first()
+    def _transition(self, doc_id, to_status, lease=None, **fields):
+        """
+        在一个短事务中把文档状态切换为to_status，同时更新fields中的字段
+        只有当前状态允许切换到to_status时才更新（UPDATE ... WHERE status IN (...)），返回是否切换成功
+        传入lease（任务租约）时还要求该任务仍然由这个worker持有，租约被其它worker接管后不会改写文档状态
+        """
+        from_statuses = [
+            status
+            for status, targets in DOCUMENT_STATUS_TRANSITIONS.items()
+            if to_status in targets
+        ]
+        values = {DocumentModel.status: to_status}
+        for key, value in fields.items():
+            values[getattr(DocumentModel, key)] = value
+
+        with self.create_db_transaction() as session:
+            query = session.query(DocumentModel).filter(
+                DocumentModel.id == doc_id,
+                DocumentModel.status.in_(from_statuses),
+            )
+            if lease is not None:
+                query = query.filter(
+                    session.query(DocumentJobModel.id)
+                    .filter(
+                        DocumentJobModel.id == lease.job_id,
+                        DocumentJobModel.status == "running",
+                        DocumentJobModel.lease_owner == lease.worker_id,
+                    )
+                    .exists()
                 )
+            updated = query.update(values, synchronize_session=False)
+        if updated:
+            self.logger.info(f"文档{doc_id}的状态已经更新为{to_status}")
+        else:
+            self.logger.warning(f"文档{doc_id}不存在或者当前状态不能切换为{to_status}")
+        return updated > 0
+
+    def _process_document(self, doc_id, doc_name, lease=None):
+        """
+        处理文档的状态机: pending -> parsing -> embedding -> completed
+        每次状态切换都是一个单独的短事务，下载、解析、向量化期间不占用数据库连接
+        处理失败时文档回到pending等待任务重试，重试次数用完后由任务队列标记为failed
+        lease是worker持有的任务租约，租约被其它worker接管后抛出LeaseLost，停止处理
+        """
 
-                if not doc_model:
-                    self.logger.error(f"未找到文档:{doc_id}")
-                    return
-
-                # 如果当前文档是之前处理失败或者处理成功的的，表示用户可能点击了重新处理按钮
-                need_cleaned = doc_model.status in ["completed", "failed"]
-                if need_cleaned:
-                    doc_model.error_message = ""
-                    doc_model.chunk_count = 0
-
-                # 如果是点击了处理，则文档状态由pending 设置为 processing
-                doc_model.status = "processing"
-                session.flush()  # flush  把本地缓存的操作推送到数据库（但不提交事务）
-
-                # 加载文档前，确认该该文档是属于哪个知识库,文档路径，文档类型(是pdf，word)
-                kb_id = doc_model.kb_id
-                file_path = doc_model.file_path
-                file_type = doc_model.file_type
+        def transition(to_status, **fields):
+            if self._transition(doc_id, to_status, lease=lease, **fields):
+                return True
+            # 切换失败可能是租约已经被接管，确认一次，接管了就停止处理
+            if lease is not None and not lease.renew():
+                lease.check()
+            return False
 
-                kb_model = (
-                    session.query(Knowledgebase)
-                    .filter(Knowledgebase.id == kb_id)
-                    .first()
-                )
-                if not kb_model:
-                    raise ValueError(f"该文档{doc_name}对应知识库不存在")
+        # 1.读取文档和知识库的信息，读完立即释放连接
+        with self.create_db_session() as session:
+            doc_model = (
+                session.query(DocumentModel).filter(DocumentModel.id == doc_id).first()
+            )
+            if not doc_model:
+                self.logger.error(f"未找到文档:{doc_id}")
+                return
+
+            # 加载文档前，确认该该文档是属于哪个知识库,文档路径，文档类型(是pdf，word)
+            kb_id = doc_model.kb_id
+            file_path = doc_model.file_path
+            file_type = doc_model.file_type
+
+            """
+            因为用langchain对文档进行分割时，需要chunk_size 和 chunk_overlap,
+            这两个参数都在知识库表的每个知识库行记录中
+            """
+            kb_model = (
+                session.query(Knowledgebase).filter(Knowledgebase.id == kb_id).first()
+            )
+            kb_chunk_size = kb_model.chunk_size if kb_model else None
+            kb_chunk_overlap = kb_model.chunk_overlap if kb_model else None
 
-                """
-                因为用langchain对文档进行分割时，需要chunk_size 和 chunk_overlap,
-                这两个参数都在知识库表的每个知识库行记录中
-                """
-                kb_chunk_size = kb_model.chunk_size
-                kb_chunk_overlap = kb_model.chunk_overlap
+        try:
+            if not kb_model:
+                raise ValueError(f"该文档{doc_name}对应知识库不存在")
 
-                self.logger.info(f"{doc_name}文档的状态已经更新为processing")
+            # 2.开始解析，重新处理的文档清空之前的错误消息和分块数
+            if not transition("parsing", error_message="", chunk_count=0):
+                return
 
-                # 1.根据file_path从本地磁盘或者云盘minio,s3或者其他云盘中下载文档
-                file_data = storage_service.download_file(file_path)
+            # 一个知识库在chromdb数据库对应一个集合
+            collection_name = f"kb_{kb_id}_collection"
 
-                # 2.根据文档的类型，按不同的方法得到的文件内容
-                langchain_docs_list = parse_service.parse(file_data, file_type)
+            # 3.流式入库：下载、逐页解析、分割、分批向量化、写入，前面的分块写入后马上可以被检索到
+            # 第一批分块开始向量化时切换为embedding
+            chunk_count = self._ingest_document_stream(
+                doc_id,
+                doc_name,
+                file_path=file_path,
+                file_type=file_type,
+                collection_name=collection_name,
+                chunk_size=kb_chunk_size,
+                chunk_overlap=kb_chunk_overlap,
+                on_embedding_start=lambda: transition("embedding"),
+                lease=lease,
+            )
+            if not chunk_count:
+                raise ValueError("分档切分为chunk失败")
 
-                self.logger.info(
-                    f"通过langchain的DocumentLoader工具，加载{doc_name}后，加载到了{len(langchain_docs_list)}个文档"
-                )
+            # 4.所有分块写入后，把文档记录的状态修改为completed
+            transition("completed", chunk_count=chunk_count)
+            self.logger.info(f"文档{doc_id}处理完成,分块数量为{chunk_count}")
 
-                # 3.创建文本分割器，根据chunk_size,chunk_overlap通过文本分割器对加载的文档进行分割,得到更细的文档分块
-                textSpliterObj = TextSplitter(
-                    chunk_size=kb_chunk_size, chunk_overlap=kb_chunk_overlap
-                )
-                chunks = textSpliterObj.split_document(
-                    langchain_docs_list, doc_id=doc_id
-                )
-                if not chunks:
-                    raise ValueError("分档切分为chunk失败")
+            # 知识库的内容变化了，之前缓存的检索结果和该文档分块的重排序分数失效
+            retrieval_cache.invalidate_kb(kb_id)
+            rerank_score_cache.invalidate_document(doc_id)
 
-                self.logger.info(f"{doc_name} 通过分割后，得到了{len(chunks)}个分块")
+        except LeaseLost:
+            # 文档已经由其它worker处理，不修改文档状态
+            self.logger.warning(f"处理{doc_name}的任务租约已经被其它worker接管,停止处理")
+            raise
+        except Exception as e:
+            self.logger.info(f"处理{doc_name}时发生异常,{str(e)}")
+            # 处理失败时已经写入的分块被删除了，之前缓存的检索结果可能包含这些分块
+            retrieval_cache.invalidate_kb(kb_id)
+            rerank_score_cache.invalidate_document(doc_id)
+            # 文档回到pending并记录错误消息，等待任务重试；是否最终失败由任务队列决定（重试次数用完后标记为failed）
+            self._transition(doc_id, "pending", lease=lease, error_message=str(e)[:500])
+            raise ValueError(f"处理{doc_name}时发生异常,{str(e)}")
 
-            # 4.对文档分块成功后，把文档记录的状态修改为completed
-            with self.create_db_transaction() as session:
-                doc_model = (
-                    session.query(DocumentModel)
-                    .filter(DocumentModel.id == doc_id)
-                    .first()
+    def _ingest_document_stream(
+        self,
+        doc_id,
+        doc_name,
+        file_path,
+        file_type,
+        collection_name,
+        chunk_size,
+        chunk_overlap,
+        on_embedding_start=None,
+        lease=None,
+    ):
+        """
+        流式入库：下载 -> 逐页解析 -> 分割 -> 分批向量化 -> 写入，相邻阶段之间用有界队列连接，各阶段同时运行
+        内存中同时存在的页和分块只和队列长度、批大小有关，和文档大小无关
+        每写入一批，这批分块就可以被向量检索和关键词检索到，不用等最后一页解析完
+        on_embedding_start() 在第一批分块开始向量化时调用一次
+        传入lease时每批向量化、写入前确认租约仍然有效，租约被接管后抛出LeaseLost
+        返回写入的分块总数
+        """
+        batch_size = Config.VECTOR_INSERT_BATCH_SIZE
+        text_splitter = TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        inserted_count = 0
+
+        def parse_pages(_):
+            # 根据file_path从本地磁盘或者云盘minio,s3中下载文档，解析器需要完整的文件内容
+            file_data = storage_service.download_file(file_path)
+            # 逐页解析，每解析完一页就交给分割阶段
+            yield from parse_service.iter_pages(file_data, file_type)
+
+        def split_batches(pages):
+            # 逐页分割，攒够一批分块交给向量化阶段
+            batch = []
+            for chunk in text_splitter.iter_split(pages, doc_id=doc_id):
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        def embed_batches(batches):
+            for idx, batch in enumerate(batches):
+                if lease is not None:
+                    lease.check()
+                if idx == 0 and on_embedding_start:
+                    on_embedding_start()
+                yield batch, vector_db_service.embed_documents(
+                    [chunk["text"] for chunk in batch]
                 )
-                if doc_model:
-                    doc_model.status = "completed"
-                    doc_model.chunk_count = len(chunks)
-
-            self.logger.info(f"文档{doc_id}处理完成,分块数量为{len(chunks)}")
 
-            if need_cleaned:
-                # TODO 要清理文档表的该文档的状态为pending
-                # TODO 要清理向量数据库改文档的所有的分块数据
-                pass
-
-            # 一个知识库在chromdb数据库对应一个集合
-            collection_name = f"kb_{kb_id}_collection"
-
-            # 5.开始对文档分块后的得到若干个分块信息进行向量化
-            if chunks:
-                langchain_documents = []
-                chunk_ids = []
-                for chunk in chunks:
-                    """
-                    #创建一个langchain的document对象,把chunk里面的字段拼接为Document需要的字段
-                    chunk= {
-                        "id": chunk_id,   f"{doc_id}_{idx}"
-                        "chunk_index": idx,
-                        "text": chunk.page_content,
-                        "metadata": chunk.metadata
+        def insert_batches(embedded_batches):
+            nonlocal inserted_count
+            for batch, embeddings in embedded_batches:
+                if lease is not None:
+                    lease.check()
+                """
+                chunk= {
+                    "id": chunk_id,   f"{doc_id}_{idx}"
+                    "chunk_index": idx,
+                    "text": chunk.page_content,
+                    "metadata": chunk.metadata,
+                    "tokens": 分词结果
+                }
+                """
+                metadatas = [
+                    {
+                        "doc_id": doc_id,  # 文档id
+                        "doc_name": doc_name,  # 文档名称
+                        "chunk_index": chunk["chunk_index"],  # 分块的索引
+                        "chunk_id": chunk["id"],  # 分块id
+                        "id": chunk["id"],  # 分块id
                     }
-                    """
-                    # 创建一个langchain的document对象,把chunk里面的字段拼接为Document需要的字段
-                    doc_obj = Document(
-                        # 分块内容
-                        page_content=chunk["text"],
-                        # 元数据
-                        metadata={
-                            "doc_id": doc_id,  # 文档id
-                            "doc_name": doc_name,  # 文档名称
-                            "chunk_index": chunk["chunk_index"],  # 分块的索引
-                            "chunk_id": chunk["id"],  # 分块id
-                            "id": chunk["id"],  # 分块id
-                        },
-                    )
-                    langchain_documents.append(doc_obj)
-                    chunk_ids.append(chunk["id"])
-
-                # 将数据插入到用户配置好的向量数据库chroma或者milvus中
-                vector_db_service.add_documents(
-                    collection_name=collection_name,
-                    documents=langchain_documents,
-                    ids=chunk_ids,
+                    for chunk in batch
+                ]
+                # 将数据写入到用户配置好的向量数据库chroma或者milvus中
+                vector_db_service.insert_embedded_batch(
+                    collection_name,
+                    texts=[chunk["text"] for chunk in batch],
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    ids=[chunk["id"] for chunk in batch],
                 )
-
-        except Exception as e:
-            self.logger.info(f"处理{doc_name}时发生异常,{str(e)}")
-            # 如果文档处理失败，把表中该文档的status=failed,error_message=str(e)
-            with self.create_db_transaction() as session:
-                doc_model = (
-                    session.query(DocumentModel)
-                    .filter(DocumentModel.id == doc_id)
-                    .first()
+                # 把分块增量写入该知识库的BM25倒排索引，分块在切分时已经完成分词，建索引时不再重复分词
+                # 第一批写入时删除该文档之前的分块（重新处理文档）
+                keyword_index_service.append_document_chunks(
+                    collection_name,
+                    doc_id,
+                    [
+                        {
+                            "id": chunk["id"],
+                            "text": chunk["text"],
+                            "metadata": metadata,
+                            "tokens": chunk["tokens"],
+                        }
+                        for chunk, metadata in zip(batch, metadatas)
+                    ],
+                    replace=inserted_count == 0,
                 )
-                if doc_model:
-                    doc_model.status = "failed"
-                    doc_model.error_message = str(e)[:500]
-                    session.flush()
-                    session.refresh(
-                        doc_model
-                    )  # refresh(doc_model) 表示从数据反向拉取数据，刷新doc_model
-            raise ValueError(f"处理{doc_name}时发生异常,{str(e)}")
+                inserted_count += len(batch)
+                self.logger.info(f"{doc_name}已写入{inserted_count}个分块")
+                yield len(batch)
+
+        pipeline = StreamingPipeline(f"ingest-{doc_id}", queue_size=Config.INGEST_QUEUE_SIZE)
+        pipeline.add_stage("parse", parse_pages)
+        pipeline.add_stage("split", split_batches)
+        pipeline.add_stage("embed", embed_batches)
+        pipeline.add_stage("insert", insert_batches)
+        try:
+            pipeline.run()
+        except LeaseLost:
+            # 接管任务的worker会用相同的分块id重新写入，这里不能删除，否则会删掉它已经写入的分块
+            # 只丢弃本进程BM25索引中还没有写入磁盘的分块，否则它们会一直叠加在从磁盘加载的索引上
+            keyword_index_service.discard_pending(collection_name, doc_id)
+            raise
+        except Exception:
+            # 处理失败的文档不能只有一部分分块可以被检索到，删除已经写入的分块，BM25索引中未写入磁盘的分块直接丢弃
+            self._discard_document_chunks(collection_name, doc_id)
+            raise
+
+        if inserted_count:
+            keyword_index_service.commit_document(collection_name, doc_id)
+
+        return inserted_count
+
+    def _discard_document_chunks(self, collection_name, doc_id):
+        """
+        删除文档在向量数据库和BM25索引中的所有分块，用于文档处理失败后的清理，清理出错只记录日志
+        """
+        try:
+            vector_db_service.delete_document_from_collection(
+                collection_name=collection_name, filter={"doc_id": doc_id}
+            )
+        except Exception as e:
+            self.logger.warning(f"清理文档{doc_id}在向量数据库中已经写入的分块失败:{e}")
+        try:
+            keyword_index_service.delete_document(collection_name, doc_id)
+        except Exception as e:
+            self.logger.warning(f"清理文档{doc_id}在BM25索引中的分块失败:{e}")
 
     def query_document_model_by_id(self, document_id):
         """
@@ -315,6 +439,16 @@ class DocumentService(BaseService[DocumentModel]):
             self.logger.info(f"已经删除文档{doc_id}的向量数据")
         except Exception as e:
             raise ValueError(f"删除文档{doc_id}在向量数据库中的数据失败,{str(e)}")
+
+        try:
+            # 同步删除BM25倒排索引中该文档的分块
+            keyword_index_service.delete_document(collection_name, doc_id)
+        except Exception as e:
+            raise ValueError(f"删除文档{doc_id}在BM25索引中的数据失败,{str(e)}")
+
+        # 知识库的内容变化了，之前缓存的检索结果和该文档分块的重排序分数失效
+        retrieval_cache.invalidate_kb(kb_id)
+        rerank_score_cache.invalidate_document(doc_id)
         
         # 2.删除上传的文件
         try:
@@ -339,56 +473,36 @@ class DocumentService(BaseService[DocumentModel]):
         except Exception as e:
             raise ValueError(f"删除文档{doc_id}的数据库数据失败,{str(e)}")
             
-    def query_chunks(self, kb_id,document_id):
+    def query_chunks(self, kb_id, document_id, page=1, page_size=None):
         """
-        根据文档id，查询文档的分块数据
-        filter = {"doc_id": document_id}
+        根据文档id，按chunk_index顺序分页查询文档的分块数据，只按元数据条件查询，不做向量检索
+        page_size为None时返回文档的全部分块
         chunk={
             "id": chunk_id,   f"{doc_id}_{idx}"
             "chunk_index": idx,
-            "text": chunk.page_content,
-            "metadata": chunk.metadata
+            "content": 分块内容,
+            "metadata": 分块元数据
         }
-        Document(
-            # 分块内容
-            page_content=chunk["text"],
-            # 元数据
-            metadata={
-                "doc_id": doc_id,  # 文档id
-                "doc_name": doc_name,  # 文档名称
-                "chunk_index": chunk["chunk_index"],  # 分块的索引
-                "chunk_id": chunk["id"],  # 分块id
-                "id": chunk["id"],  # 分块id
-            },
-        )
         """
         collection_name = f"kb_{kb_id}_collection"
-        results = vector_db_service.query_documents(
+        offset = (page - 1) * page_size if page_size else 0
+        langchain_documents = vector_db_service.get_chunks_by_filter(
             collection_name=collection_name,
-            document_id=document_id,
-            k=1000,
-            filter = {"doc_id": document_id}
-           
-        ) 
-        
-        self.logger.info(f"1------查询到的文档向量结果,results={results}")
-
-        if results:
-            langchain_documents = [doc for doc,score in results]
-            langchain_documents.sort(key=lambda doc: doc.metadata.get("chunk_index", 0))
-        chunks_data=[]
-        if langchain_documents:
-            for langchain_document in langchain_documents:
-               chunks_data.append({
-                    "id": langchain_document.metadata["id"],  # 分块id
-                    "content": langchain_document.page_content,  # 分块内容
-                    "chunk_index": langchain_document.metadata["chunk_index"],  # 分块在文档中的索引
-                    "metadata": langchain_document.metadata
-               })
-        self.logger.info(f"2------查询到的文档分块数据{chunks_data}")
+            filter={"doc_id": document_id},
+            offset=offset,
+            limit=page_size,
+        )
+
+        chunks_data = []
+        for langchain_document in langchain_documents:
+            chunks_data.append({
+                "id": langchain_document.metadata.get("id", langchain_document.id),  # 分块id
+                "content": langchain_document.page_content,  # 分块内容
+                "chunk_index": langchain_document.metadata["chunk_index"],  # 分块在文档中的索引
+                "metadata": langchain_document.metadata
+            })
+        self.logger.info(f"查询到文档{document_id}的分块数量={len(chunks_data)},offset={offset}")
         return chunks_data
-        
 
-        
 
 document_service = DocumentService()
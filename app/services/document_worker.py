@@ -0,0 +1,125 @@
+"""
+文档处理worker：从持久化任务队列领取任务并处理
+可以用 python worker.py 单独启动，和web服务分开扩容；也可以在web进程内以后台线程运行（DOCUMENT_WORKER_IN_WEB）
+"""
+
+import threading
+
+from app.config import Config
+from app.services.job_queue_service import (
+    JobLease,
+    LeaseLost,
+    job_queue_service,
+    default_worker_id,
+)
+from app.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class DocumentWorker:
+
+    def __init__(self, concurrency=None, poll_interval=None, lease_seconds=None, worker_id=None):
+        self.concurrency = concurrency or Config.DOCUMENT_WORKER_CONCURRENCY
+        self.poll_interval = poll_interval or Config.DOCUMENT_WORKER_POLL_INTERVAL
+        self.lease_seconds = lease_seconds or Config.DOCUMENT_JOB_LEASE_SECONDS
+        self.worker_id = worker_id or default_worker_id()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """
+        启动处理线程，立即返回
+        """
+        for idx in range(self.concurrency):
+            thread = threading.Thread(
+                target=self._run_loop,
+                args=(f"{self.worker_id}:{idx}",),
+                name=f"document-worker-{idx}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"文档处理worker{self.worker_id}已启动,并发数={self.concurrency}")
+
+    def request_stop(self):
+        """
+        通知worker停止，可以在信号处理函数中调用
+        """
+        self._stop_event.set()
+
+    def stop(self, timeout=None):
+        """
+        停止领取新任务，等待正在处理的任务结束
+        """
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        logger.info(f"文档处理worker{self.worker_id}已停止")
+
+    def run_forever(self):
+        """
+        启动处理线程并阻塞，直到 stop() 被调用（比如收到退出信号）
+        """
+        self.start()
+        while not self._stop_event.wait(1):
+            pass
+        self.stop()
+
+    def _run_loop(self, slot_id):
+        while not self._stop_event.is_set():
+            try:
+                job = job_queue_service.claim(slot_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"领取任务失败:{e}")
+                job = None
+            if job is None:
+                self._stop_event.wait(self.poll_interval)
+                continue
+            try:
+                self._run_job(slot_id, job)
+            except Exception as e:
+                # 更新任务状态失败时租约到期后任务会被重新领取
+                logger.error(f"任务{job['id']}处理后更新任务状态失败:{e}")
+
+    def _run_job(self, slot_id, job):
+        # 延迟导入，worker启动时不加载文档服务依赖的向量库和模型
+        from app.services.document_service import document_service
+
+        logger.info(f"开始处理任务{job['id']},文档={job['doc_name']},第{job['attempts']}次")
+
+        # 处理过程中定期续租，续租间隔为租约时长的1/3
+        # 续租失败时lease.lost被设置，处理流程在下一次写入分块或切换文档状态前停止
+        done = threading.Event()
+        lease = JobLease(job["id"], slot_id, self.lease_seconds)
+
+        def keep_lease():
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    if not lease.renew():
+                        logger.warning(f"任务{job['id']}续租失败,租约已经被其它worker接管,停止处理")
+                        return
+                except Exception as e:
+                    logger.error(f"任务{job['id']}续租出错:{e}")
+
+        heartbeat_thread = threading.Thread(
+            target=keep_lease, name=f"lease-{job['id']}", daemon=True
+        )
+        heartbeat_thread.start()
+        try:
+            document_service._process_document(job["doc_id"], job["doc_name"], lease=lease)
+        except LeaseLost as e:
+            # 任务已经属于其它worker，不再更新任务状态，也不清理已经写入的分块（新的worker会覆盖写入）
+            done.set()
+            logger.warning(f"任务{job['id']}放弃处理:{e}")
+        except Exception as e:
+            done.set()
+            job_queue_service.fail(job["id"], slot_id, e)
+        else:
+            done.set()
+            job_queue_service.complete(job["id"], slot_id)
+            logger.info(f"任务{job['id']}处理完成")
+        finally:
+            done.set()
+            heartbeat_thread.join()
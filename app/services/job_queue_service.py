@@ -0,0 +1,282 @@
+"""
+持久化的文档处理任务队列，任务保存在数据库的document_job表中
+web服务提交任务后立即返回，任务由worker进程（python worker.py）领取处理，worker可以和web服务分开部署、按需扩容
+领取任务用 SELECT ... FOR UPDATE SKIP LOCKED，多个worker同时领取时不会拿到同一个任务
+领取后持有一段时间的租约，处理过程中定期续租；worker崩溃后租约到期，任务会被重新领取
+处理失败时按指数退避重新排队，重试次数用完后任务和文档都标记为failed
+续租失败说明租约已经被其它worker接管，当前worker通过JobLease得知后停止处理，不再写入分块和修改文档状态
+"""
+
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, func
+
+from app.config import Config
+from app.models.document import DocumentModel
+from app.models.document_job import DocumentJobModel
+from app.services.base_service import BaseService
+from app.utils.logger import get_logger
+
+
+# 还没有结束的任务状态
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+
+class LeaseLost(Exception):
+    """
+    任务的租约已经被其它worker接管，当前worker应该立即停止处理
+    """
+
+
+def default_worker_id():
+    """
+    worker标识: 主机名:进程号
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueueService(BaseService[DocumentJobModel]):
+
+    def __init__(self):
+        self.logger = get_logger(self.__class__.__name__)
+
+    def enqueue(self, doc_id, doc_name=None, priority=0):
+        """
+        提交文档处理任务，返回任务id
+        该文档已经有排队中或处理中的任务时不重复提交，直接返回已有任务的id
+        先锁住文档行再检查，同一文档的并发提交排队执行，不会都看到没有任务而各插入一个
+        """
+        with self.create_db_transaction() as session:
+            document = (
+                session.query(DocumentModel.id)
+                .filter(DocumentModel.id == doc_id)
+                .with_for_update()
+                .first()
+            )
+            if document is None:
+                raise ValueError(f"文档{doc_id}不存在")
+
+            existing = (
+                session.query(DocumentJobModel)
+                .filter(
+                    DocumentJobModel.doc_id == doc_id,
+                    DocumentJobModel.status.in_(ACTIVE_JOB_STATUSES),
+                )
+                .first()
+            )
+            if existing:
+                self.logger.info(f"文档{doc_name}已经有未完成的处理任务{existing.id}")
+                return existing.id
+
+            if Config.DOCUMENT_JOB_MAX_QUEUED > 0:
+                queued = (
+                    session.query(func.count(DocumentJobModel.id))
+                    .filter(DocumentJobModel.status == "queued")
+                    .scalar()
+                )
+                if queued >= Config.DOCUMENT_JOB_MAX_QUEUED:
+                    raise ValueError(f"处理队列已满,当前排队的任务数为{queued},请稍后再试")
+
+            job = DocumentJobModel(
+                doc_id=doc_id,
+                doc_name=doc_name,
+                status="queued",
+                priority=priority,
+                attempts=0,
+                max_attempts=Config.DOCUMENT_JOB_MAX_ATTEMPTS,
+                available_at=datetime.now(),
+            )
+            session.add(job)
+            session.flush()
+            self.logger.info(f"文档{doc_name}的处理任务{job.id}已经提交,优先级={priority}")
+            return job.id
+
+    def claim(self, worker_id, lease_seconds=None):
+        """
+        领取一个任务，返回 {"id", "doc_id", "doc_name", "attempts"}，没有可以领取的任务时返回None
+        按优先级从高到低、可领取时间从早到晚领取；租约已经过期的running任务（worker崩溃）也可以被领取
+        """
+        lease_seconds = lease_seconds or Config.DOCUMENT_JOB_LEASE_SECONDS
+        while True:
+            now = datetime.now()
+            with self.create_db_transaction() as session:
+                job = (
+                    session.query(DocumentJobModel)
+                    .filter(
+                        or_(
+                            and_(
+                                DocumentJobModel.status == "queued",
+                                DocumentJobModel.available_at <= now,
+                            ),
+                            and_(
+                                DocumentJobModel.status == "running",
+                                DocumentJobModel.lease_expires_at < now,
+                            ),
+                        )
+                    )
+                    .order_by(
+                        DocumentJobModel.priority.desc(),
+                        DocumentJobModel.available_at,
+                        DocumentJobModel.created_at,
+                    )
+                    .with_for_update(skip_locked=True)
+                    .first()
+                )
+                if job is None:
+                    return None
+
+                if job.status == "running" and job.attempts >= job.max_attempts:
+                    # 租约过期且重试次数已经用完，不再领取，继续找下一个任务
+                    self.logger.error(f"任务{job.id}的租约已过期且重试次数已用完,标记为失败")
+                    self._mark_failed(session, job, job.last_error or "处理超时,worker可能已经退出")
+                    continue
+
+                if job.status == "running":
+                    self.logger.warning(f"任务{job.id}的租约已过期({job.lease_owner}),重新领取")
+                job.status = "running"
+                job.attempts += 1
+                job.lease_owner = worker_id
+                job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+                return {
+                    "id": job.id,
+                    "doc_id": job.doc_id,
+                    "doc_name": job.doc_name,
+                    "attempts": job.attempts,
+                }
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=None):
+        """
+        续租，返回是否续租成功；租约已经被其它worker接管时返回False
+        """
+        lease_seconds = lease_seconds or Config.DOCUMENT_JOB_LEASE_SECONDS
+        with self.create_db_transaction() as session:
+            updated = (
+                session.query(DocumentJobModel)
+                .filter(
+                    DocumentJobModel.id == job_id,
+                    DocumentJobModel.status == "running",
+                    DocumentJobModel.lease_owner == worker_id,
+                )
+                .update(
+                    {
+                        DocumentJobModel.lease_expires_at: datetime.now()
+                        + timedelta(seconds=lease_seconds)
+                    },
+                    synchronize_session=False,
+                )
+            )
+            return updated > 0
+
+    def complete(self, job_id, worker_id):
+        with self.create_db_transaction() as session:
+            session.query(DocumentJobModel).filter(
+                DocumentJobModel.id == job_id,
+                DocumentJobModel.lease_owner == worker_id,
+            ).update(
+                {
+                    DocumentJobModel.status: "succeeded",
+                    DocumentJobModel.lease_owner: None,
+                    DocumentJobModel.lease_expires_at: None,
+                },
+                synchronize_session=False,
+            )
+
+    def fail(self, job_id, worker_id, error):
+        """
+        任务处理失败，还有重试次数时按指数退避重新排队，返回是否会重试
+        """
+        error = str(error)[:500]
+        with self.create_db_transaction() as session:
+            job = (
+                session.query(DocumentJobModel)
+                .filter(
+                    DocumentJobModel.id == job_id,
+                    DocumentJobModel.lease_owner == worker_id,
+                )
+                .with_for_update()
+                .first()
+            )
+            if job is None:
+                return False
+
+            if job.attempts >= job.max_attempts:
+                self._mark_failed(session, job, error)
+                self.logger.error(f"任务{job_id}已经失败{job.attempts}次,不再重试:{error}")
+                return False
+
+            delay = self.retry_delay(job.attempts)
+            job.status = "queued"
+            job.last_error = error
+            job.available_at = datetime.now() + timedelta(seconds=delay)
+            job.lease_owner = None
+            job.lease_expires_at = None
+            self.logger.warning(f"任务{job_id}第{job.attempts}次处理失败,{delay:.0f}秒后重试:{error}")
+            return True
+
+    @staticmethod
+    def retry_delay(attempts):
+        """
+        第attempts次失败后的重试等待秒数: 基础时间 * 2^(attempts-1)，不超过上限
+        """
+        return min(
+            Config.DOCUMENT_JOB_RETRY_BACKOFF * (2 ** max(attempts - 1, 0)),
+            Config.DOCUMENT_JOB_RETRY_BACKOFF_MAX,
+        )
+
+    def _mark_failed(self, session, job, error):
+        """
+        任务最终失败，同时把文档标记为failed，避免文档一直停留在处理中
+        """
+        job.status = "failed"
+        job.last_error = error
+        job.lease_owner = None
+        job.lease_expires_at = None
+        doc_model = session.query(DocumentModel).filter(DocumentModel.id == job.doc_id).first()
+        if doc_model and doc_model.status != "failed":
+            doc_model.status = "failed"
+            doc_model.error_message = error
+
+    def stats(self):
+        """
+        各状态的任务数 {状态: 个数}，用于监控队列积压
+        """
+        with self.create_db_session() as session:
+            rows = (
+                session.query(DocumentJobModel.status, func.count(DocumentJobModel.id))
+                .group_by(DocumentJobModel.status)
+                .all()
+            )
+            return {status: count for status, count in rows}
+
+
+job_queue_service = JobQueueService()
+
+
+class JobLease:
+    """
+    worker持有的一个任务的租约，由续租线程调用renew()，处理流程中调用check()
+    续租失败后lost被设置，check()抛出LeaseLost；文档状态切换时也会用job_id、worker_id确认租约仍然属于自己
+    """
+
+    def __init__(self, job_id, worker_id, lease_seconds=None):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds or Config.DOCUMENT_JOB_LEASE_SECONDS
+        self.lost = threading.Event()
+
+    def renew(self):
+        """
+        续租，返回租约是否仍然属于自己
+        """
+        if not self.lost.is_set() and not job_queue_service.heartbeat(
+            self.job_id, self.worker_id, self.lease_seconds
+        ):
+            self.lost.set()
+        return not self.lost.is_set()
+
+    def check(self):
+        if self.lost.is_set():
+            raise LeaseLost(f"任务{self.job_id}的租约已经被其它worker接管")
@@ -0,0 +1,625 @@
+"""
+BM25关键词检索的持久化倒排索引
+每个知识库集合 kb_{id}_collection 对应一个索引，保存在本地磁盘上
+文档入库、删除时增量更新索引，查询时不再访问向量数据库，也不再对所有分块重新分词
+每个集合在磁盘上是一个基础索引 {collection}.pkl 加上一个只追加的日志 {collection}.{日志编号}.log：
+    文档入库、删除只在文件锁内向日志追加一条记录，不重写整个索引
+    日志超过基础索引大小的一定比例后压缩：把当前索引写成新的基础索引，换一个新的日志
+web服务的多个进程和文档处理worker进程共用磁盘上的索引：
+    查询前检查日志是否变长，只读取并应用新追加的记录；基础索引被替换（压缩）时才重新加载整个索引
+"""
+
+import glob
+import os
+import pickle
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import Config
+from app.utils.file_lock import file_lock
+from app.utils.logger import get_logger
+from app.utils.tokenizer import tokenize_chinese
+from app.utils.bm25_scorer import SparseBM25Scorer
+from app.services.vector_db.vector_sevice import vector_db_service
+
+
+logger = get_logger(__name__)
+
+
+class KeywordIndex:
+    """
+    单个集合的BM25倒排索引
+    计算公式和参数与 rank_bm25.BM25Okapi 保持一致，保证检索结果不变
+    """
+
+    # 索引文件格式版本，格式变化时旧索引会被重建
+    # 3: 分块的词频改为 (词的列号数组, 词频数组)，去掉了没有用到的倒排表
+    VERSION = 3
+    # 加载时可以转换为当前格式的旧版本
+    CONVERTIBLE_VERSIONS = (2,)
+
+    def __init__(self, k1=1.5, b=0.75, epsilon=0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        # 分块信息 chunk_id -> {"doc_id","text","metadata","length","terms","freqs"}
+        # terms是分块中每个词在vocab中的列号(int32数组)，freqs是对应的词频，构建打分矩阵时直接拼接
+        self.chunks = {}
+        # 词 -> 打分矩阵的列号，只增不减，删除分块后不再出现的词在打分时文档频率为0
+        self.vocab = {}
+        # 文档包含的分块 doc_id -> [chunk_id]
+        self.doc_chunks = {}
+        # 所有分块的总词数，用于计算平均长度avgdl
+        self.total_length = 0
+        # 索引每变化一次加1，用来判断缓存的打分矩阵是否过期
+        self.generation = 0
+
+        # BM25打分矩阵缓存 (版本号, 打分器, chunk_id列表, 分块信息列表)
+        self._scorer = None
+
+    def add_chunks(self, doc_id, chunks):
+        """
+        添加一个文档的分块，如果该文档之前已经入过索引（重新处理），先删除旧分块
+        chunks = [{"id": chunk_id, "text": 分块内容, "metadata": 元数据, "tokens": 分词结果}]
+        入库流程中分块已经分好词(tokens)，没有tokens的分块（比如从向量数据库重建）才在这里分词
+        """
+        self.remove_document(doc_id)
+        self.append_chunks(doc_id, chunks)
+
+    def append_chunks(self, doc_id, chunks):
+        """
+        追加文档的分块，不删除该文档已有的分块，用于从向量数据库分批重建索引
+        """
+        chunk_ids = []
+        for chunk in chunks:
+            chunk_id = chunk["id"]
+            tokens = chunk.get("tokens")
+            if tokens is None:
+                tokens = tokenize_chinese(chunk["text"])
+
+            term_freqs = {}
+            for token in tokens:
+                term_freqs[token] = term_freqs.get(token, 0) + 1
+
+            terms, freqs = self._to_arrays(term_freqs)
+            self.chunks[chunk_id] = {
+                "doc_id": doc_id,
+                "text": chunk["text"],
+                "metadata": chunk.get("metadata") or {},
+                "length": len(tokens),
+                "terms": terms,
+                "freqs": freqs,
+            }
+            self.total_length += len(tokens)
+            chunk_ids.append(chunk_id)
+
+        self.doc_chunks.setdefault(doc_id, []).extend(chunk_ids)
+        self.generation += 1
+
+    def _to_arrays(self, term_freqs):
+        """
+        把分块的词频字典转换为 (词的列号数组, 词频数组)，新出现的词加入vocab
+        """
+        vocab = self.vocab
+        terms = np.fromiter(
+            (vocab.setdefault(term, len(vocab)) for term in term_freqs),
+            dtype=np.int32,
+            count=len(term_freqs),
+        )
+        freqs = np.fromiter(term_freqs.values(), dtype=np.int32, count=len(term_freqs))
+        return terms, freqs
+
+    def remove_document(self, doc_id):
+        """
+        从索引中删除一个文档的所有分块
+        """
+        chunk_ids = self.doc_chunks.pop(doc_id, None)
+        if not chunk_ids:
+            return False
+
+        for chunk_id in chunk_ids:
+            chunk = self.chunks.pop(chunk_id, None)
+            if not chunk:
+                continue
+            self.total_length -= chunk["length"]
+
+        self.generation += 1
+        return True
+
+    def snapshot(self):
+        """
+        当前所有分块的快照 (版本号, chunk_id列表, 分块信息列表)，需要在集合锁内调用
+        分块信息写入索引后不再修改，快照可以在锁外用来构建打分矩阵和生成检索结果
+        """
+        chunk_ids = list(self.chunks)
+        return self.generation, chunk_ids, [self.chunks[chunk_id] for chunk_id in chunk_ids]
+
+    def build_scorer(self, snapshot):
+        """
+        根据快照构建基于CSR稀疏矩阵的BM25打分器，只读取快照，可以在锁外调用
+        每个分块的词已经是列号数组，构建时只做数组拼接和向量化计算，不逐个遍历词
+        返回 (版本号, 打分器, 矩阵行号对应的chunk_id列表, 分块信息列表)
+        """
+        generation, chunk_ids, entries = snapshot
+        scorer = SparseBM25Scorer.from_arrays(
+            [entry["terms"] for entry in entries],
+            [entry["freqs"] for entry in entries],
+            self.vocab,
+            doc_lengths=np.fromiter(
+                (entry["length"] for entry in entries), dtype=np.float64, count=len(entries)
+            ),
+            k1=self.k1,
+            b=self.b,
+            epsilon=self.epsilon,
+        )
+        return generation, scorer, chunk_ids, entries
+
+    def cached_scorer(self):
+        """
+        索引没有变化时返回缓存的打分器，否则返回None
+        """
+        if self._scorer is not None and self._scorer[0] == self.generation:
+            return self._scorer
+        return None
+
+    def store_scorer(self, built):
+        """
+        缓存构建好的打分器，构建期间索引又变化了就不缓存
+        """
+        if built[0] == self.generation:
+            self._scorer = built
+
+    def __getstate__(self):
+        # 打分矩阵可以从分块的词频重建，不写入磁盘
+        state = self.__dict__.copy()
+        state["_scorer"] = None
+        return state
+
+    def __setstate__(self, state):
+        # 兼容没有版本号字段的旧索引文件
+        state.pop("_scorer_chunk_ids", None)
+        state.setdefault("generation", 0)
+        # 版本2的索引：去掉倒排表，把每个分块的词频字典转换为数组
+        state.pop("postings", None)
+        self.__dict__.update(state)
+        if "vocab" not in state:
+            self.vocab = {}
+            for chunk in self.chunks.values():
+                chunk["terms"], chunk["freqs"] = self._to_arrays(chunk.pop("term_freqs"))
+
+
+class KeywordIndexService:
+    """
+    管理所有集合的BM25倒排索引：加载、增量更新、持久化和查询
+    """
+
+    def __init__(self):
+        self.index_dirtory = Config.BM25_INDEX_DIRECTORY
+        os.makedirs(self.index_dirtory, exist_ok=True)
+
+        # 已经加载到内存中的索引 collection_name -> KeywordIndex
+        self._indexes = {}
+        # 内存中的索引对应的磁盘位置 collection_name -> (基础索引文件签名, 日志编号, 日志已经读到的位置)
+        # 基础索引的签名 (inode, 修改时间, 大小) 变了说明其它进程压缩过索引，需要重新加载
+        self._positions = {}
+        # 本进程流式入库中、还没有写入磁盘的分块 collection_name -> {doc_id: {"replace": 是否先删除旧分块, "batches": [分块列表]}}
+        # 内存中的索引 = 磁盘上的索引 + 这些分块，重新加载磁盘上的索引后重新叠加
+        self._pending = {}
+        # 每个集合一把锁，保证同一个进程内同一个集合的更新是串行的
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+        logger.info(f"BM25倒排索引已经初始化,索引保存目录={self.index_dirtory}")
+
+    def _get_lock(self, collection_name):
+        with self._locks_guard:
+            if collection_name not in self._locks:
+                self._locks[collection_name] = threading.RLock()
+            return self._locks[collection_name]
+
+    def _index_path(self, collection_name):
+        return os.path.join(self.index_dirtory, f"{collection_name}.pkl")
+
+    def _log_path(self, collection_name, log_id):
+        return os.path.join(self.index_dirtory, f"{collection_name}.{log_id}.log")
+
+    @staticmethod
+    def _signature(stat_result):
+        # 写索引时先写临时文件再替换，替换后inode会变化
+        return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+    def _file_signature(self, collection_name):
+        try:
+            return self._signature(os.stat(self._index_path(collection_name)))
+        except FileNotFoundError:
+            return None
+
+    def _load_index(self, collection_name):
+        """
+        从磁盘加载基础索引，返回 (索引, 读取的索引文件的签名, 日志编号)，加载失败或者不存在返回 (None, None, None)
+        """
+        index_path = self._index_path(collection_name)
+        try:
+            with open(index_path, "rb") as f:
+                # 用打开的文件取签名，读取过程中文件被其它进程替换也不会和内容对不上
+                signature = self._signature(os.fstat(f.fileno()))
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None, None, None
+        except Exception as e:
+            logger.error(f"加载集合{collection_name}的BM25索引失败:{e}")
+            return None, None, None
+        if data.get("version") in KeywordIndex.CONVERTIBLE_VERSIONS:
+            # 旧格式在反序列化时已经转换，下次压缩时以新格式保存
+            logger.info(f"集合{collection_name}的BM25索引已从版本{data['version']}转换")
+        elif data.get("version") != KeywordIndex.VERSION:
+            logger.info(f"集合{collection_name}的BM25索引版本已变化，需要重建")
+            return None, None, None
+        # 没有日志编号的是改为追加日志之前写入的索引
+        return data["index"], signature, data.get("log_id", 0)
+
+    def _save_index(self, collection_name, index, log_id):
+        """
+        把基础索引写入磁盘，先写临时文件再替换，避免写到一半进程退出导致索引损坏
+        log_id 是之后的修改追加写入的日志编号，调用方需要持有集合的文件锁，返回写入后的文件签名
+        """
+        index_path = self._index_path(collection_name)
+        temp_path = f"{index_path}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(
+                {"version": KeywordIndex.VERSION, "index": index, "log_id": log_id},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(temp_path, index_path)
+        return self._file_signature(collection_name)
+
+    def _read_log(self, collection_name, log_id, offset):
+        """
+        从offset开始读取日志中完整的记录，返回 (记录列表, 读到的位置)
+        其它进程正在追加的、写了一半的记录不读取，下次再读；日志不存在时返回 (None, offset)
+        """
+        records = []
+        try:
+            with open(self._log_path(collection_name, log_id), "rb") as f:
+                f.seek(offset)
+                while True:
+                    try:
+                        record = pickle.load(f)
+                    except Exception:
+                        break
+                    records.append(record)
+                    offset = f.tell()
+        except FileNotFoundError:
+            return None, offset
+        return records, offset
+
+    def _build_from_vector_db(self, collection_name):
+        """
+        磁盘上还没有索引的集合（比如升级前已经入库的知识库），从向量数据库读取一次分块来重建
+        """
+        index = KeywordIndex()
+        total = 0
+        # 分批扫描集合，只需要分块文本和元数据(doc_id)，不读取向量
+        for batch in vector_db_service.scan_collection(
+            collection_name, include=["documents", "metadatas"]
+        ):
+            ids = batch.get("ids", [])
+            documents = batch.get("documents", [])
+            metadatas = batch.get("metadatas", [])
+
+            doc_chunks = {}
+            for idx, (chunk_id, text) in enumerate(zip(ids, documents)):
+                metadata = metadatas[idx] if idx < len(metadatas) else {}
+                metadata = metadata or {}
+                doc_id = metadata.get("doc_id", "")
+                doc_chunks.setdefault(doc_id, []).append(
+                    {"id": chunk_id, "text": text or "", "metadata": metadata}
+                )
+
+            # 同一个文档的分块可能分在多批中，追加而不是覆盖
+            for doc_id, chunks in doc_chunks.items():
+                index.append_chunks(doc_id, chunks)
+            total += len(ids)
+
+        logger.info(f"从向量数据库重建集合{collection_name}的BM25索引,分块数={total}")
+        return index
+
+    @staticmethod
+    def _apply_document(index, doc_id, pending):
+        if pending["replace"]:
+            index.remove_document(doc_id)
+        for chunks in pending["batches"]:
+            index.append_chunks(doc_id, chunks)
+
+    def _apply_pending(self, collection_name, index):
+        """
+        把本进程还没有写入磁盘的分块叠加到索引上
+        """
+        for doc_id, pending in self._pending.get(collection_name, {}).items():
+            self._apply_document(index, doc_id, pending)
+
+    def _apply_records(self, collection_name, index, records):
+        """
+        把日志记录应用到内存中的索引
+        记录 ("append", doc_id, 是否先删除旧分块, 分块列表) 或 ("remove", doc_id)
+        本进程正在入库的文档被其它进程修改后，重新叠加本进程未写入磁盘的分块
+        """
+        pending = self._pending.get(collection_name, {})
+        for record in records:
+            doc_id = record[1]
+            if record[0] == "remove":
+                index.remove_document(doc_id)
+            else:
+                self._apply_document(index, doc_id, {"replace": record[2], "batches": [record[3]]})
+            if doc_id in pending:
+                self._apply_document(index, doc_id, pending[doc_id])
+
+    def _load_latest(self, collection_name, locked=False):
+        """
+        从磁盘加载最新的索引：基础索引 + 日志中的所有记录，再叠加本进程未写入磁盘的分块
+        磁盘上没有索引时从向量数据库重建并写入磁盘；locked表示调用方已经持有文件锁（同一个进程重复加文件锁会死锁）
+        返回 (索引, (基础索引的签名, 日志编号, 日志读到的位置))
+        """
+        index, signature, log_id = self._load_index(collection_name)
+        if index is None:
+            if locked:
+                index, signature, log_id = self._rebuild(collection_name)
+            else:
+                with file_lock(self._index_path(collection_name)):
+                    index, signature, log_id = self._rebuild(collection_name)
+
+        records, offset = self._read_log(collection_name, log_id, 0)
+        self._apply_records(collection_name, index, records or [])
+        self._apply_pending(collection_name, index)
+        return index, (signature, log_id, offset)
+
+    def _rebuild(self, collection_name):
+        # 调用方持有文件锁，等锁的时候其它进程可能已经重建好了
+        index, signature, log_id = self._load_index(collection_name)
+        if index is None:
+            index = self._build_from_vector_db(collection_name)
+            # 索引文件损坏或者版本变化时，之前的日志对应的是旧索引，不能应用到重建的索引上
+            self._remove_logs(collection_name)
+            log_id = 1
+            signature = self._save_index(collection_name, index, log_id)
+        return index, signature, log_id
+
+    def _remove_logs(self, collection_name):
+        for path in glob.glob(self._log_path(glob.escape(collection_name), "*")):
+            os.remove(path)
+
+    def _sync(self, collection_name, locked=False):
+        """
+        让内存中的索引跟上磁盘：基础索引没有变化时只读取日志中新追加的记录，基础索引被替换（压缩）时重新加载
+        调用方需要持有集合锁，返回索引
+        """
+        index = self._indexes.get(collection_name)
+        position = self._positions.get(collection_name)
+        if index is not None and self._file_signature(collection_name) == position[0]:
+            signature, log_id, offset = position
+            try:
+                log_size = os.path.getsize(self._log_path(collection_name, log_id))
+            except FileNotFoundError:
+                log_size = 0
+            if log_size <= offset:
+                return index
+            records, new_offset = self._read_log(collection_name, log_id, offset)
+            if records is not None:
+                self._apply_records(collection_name, index, records)
+                self._positions[collection_name] = (signature, log_id, new_offset)
+                return index
+
+        if index is not None:
+            logger.info(f"集合{collection_name}的BM25索引已经被其它进程压缩,重新加载")
+        index, position = self._load_latest(collection_name, locked=locked)
+        self._indexes[collection_name] = index
+        self._positions[collection_name] = position
+        return index
+
+    def get_index(self, collection_name):
+        """
+        获取集合的索引，先读取其它进程追加到日志中的修改
+        磁盘上没有索引时从向量数据库重建
+        """
+        with self._get_lock(collection_name):
+            return self._sync(collection_name)
+
+    def _write_record(self, collection_name, make_record, apply=True):
+        """
+        在文件锁内把一条修改追加到集合的日志，每次写入只追加这一条记录，不重写整个索引
+        make_record(索引) 在读取了其它进程的修改之后调用，返回要写入的记录，返回None时不写入
+        apply为False表示内存中的索引已经包含这条修改（流式入库叠加的分块），只写日志
+        日志超过基础索引大小的一定比例后压缩
+        """
+        with self._get_lock(collection_name):
+            with file_lock(self._index_path(collection_name)):
+                index = self._sync(collection_name, locked=True)
+                record = make_record(index)
+                if record is None:
+                    return
+                signature, log_id, offset = self._positions[collection_name]
+                log_path = self._log_path(collection_name, log_id)
+                with open(log_path, "ab") as f:
+                    # 丢弃进程崩溃时写了一半的记录
+                    f.truncate(offset)
+                    f.write(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+                    offset = f.tell()
+                self._positions[collection_name] = (signature, log_id, offset)
+                if apply:
+                    self._apply_records(collection_name, index, [record])
+                self._compact_if_needed(collection_name, index)
+
+    def _compact_if_needed(self, collection_name, index):
+        """
+        日志大小超过基础索引的 BM25_LOG_COMPACT_RATIO 倍时，把当前索引写成新的基础索引，换一个新的日志
+        本进程有未写入磁盘的分块时内存中的索引不能直接写入，等下次写入时再压缩；调用方持有文件锁
+        """
+        signature, log_id, offset = self._positions[collection_name]
+        if self._pending.get(collection_name) or not signature:
+            return
+        if offset <= signature[2] * Config.BM25_LOG_COMPACT_RATIO:
+            return
+        new_log_id = log_id + 1
+        new_signature = self._save_index(collection_name, index, new_log_id)
+        os.remove(self._log_path(collection_name, log_id))
+        self._positions[collection_name] = (new_signature, new_log_id, 0)
+        logger.info(f"集合{collection_name}的BM25索引日志已经压缩,日志大小={offset}")
+
+    @staticmethod
+    def _tokenized(chunks):
+        """
+        写入日志前补全分块的分词结果，其它进程应用日志时不再重复分词
+        """
+        return [
+            chunk if chunk.get("tokens") is not None else {**chunk, "tokens": tokenize_chinese(chunk["text"])}
+            for chunk in chunks
+        ]
+
+    def add_document_chunks(self, collection_name, doc_id, chunks):
+        """
+        文档处理完成后，把文档的分块增量写入索引
+        """
+        record = ("append", doc_id, True, self._tokenized(chunks))
+        self._write_record(collection_name, lambda index: record)
+        logger.info(f"集合{collection_name}的BM25索引已添加文档{doc_id},分块数={len(chunks)}")
+
+    def append_document_chunks(self, collection_name, doc_id, chunks, replace=False):
+        """
+        流式入库时每写入一批分块就追加到内存中的索引，本进程马上可以检索到
+        replace=True 时先删除该文档已有的分块（重新处理文档的第一批）
+        所有批次追加完后调用 commit_document 写入磁盘，其它进程在这之后才能检索到；处理失败时调用 delete_document 丢弃
+        """
+        with self._get_lock(collection_name):
+            index = self.get_index(collection_name)
+            pending = self._pending.setdefault(collection_name, {})
+            if replace or doc_id not in pending:
+                pending[doc_id] = {"replace": replace, "batches": []}
+            pending[doc_id]["batches"].append(chunks)
+            if replace:
+                index.remove_document(doc_id)
+            index.append_chunks(doc_id, chunks)
+
+    def commit_document(self, collection_name, doc_id):
+        """
+        把流式入库追加的文档分块作为一条记录写入日志
+        内存中的索引已经叠加了这些分块，只写日志
+        """
+
+        def make_record(index):
+            # 读取其它进程的修改时还需要重新叠加，所以在读取之后才移除
+            pending = self._pending.get(collection_name, {}).pop(doc_id, None)
+            if pending is None:
+                return None
+            chunks = [chunk for batch in pending["batches"] for chunk in batch]
+            return ("append", doc_id, pending["replace"], self._tokenized(chunks))
+
+        self._write_record(collection_name, make_record, apply=False)
+
+    def discard_pending(self, collection_name, doc_id):
+        """
+        丢弃本进程流式入库中还没有写入磁盘的文档分块，不修改磁盘上的索引
+        用于任务租约被其它worker接管后停止处理：磁盘上的分块由新的worker写入，这里只清理本进程内存中的叠加
+        """
+        with self._get_lock(collection_name):
+            if self._pending.get(collection_name, {}).pop(doc_id, None) is None:
+                return
+            # 内存中的索引已经叠加了这些分块，丢掉后下次使用时从磁盘重新加载，再叠加其它文档未写入的分块
+            self._indexes.pop(collection_name, None)
+            self._positions.pop(collection_name, None)
+        logger.info(f"集合{collection_name}的BM25索引已丢弃文档{doc_id}未写入磁盘的分块")
+
+    def delete_document(self, collection_name, doc_id):
+        """
+        删除文档时，从索引中删除该文档的所有分块，包括流式入库中还没有写入磁盘的分块
+        """
+        with self._get_lock(collection_name):
+            had_pending = self._pending.get(collection_name, {}).pop(doc_id, None) is not None
+            if had_pending:
+                # 内存中叠加的分块可能只删掉一部分（replace=False），从磁盘重新加载
+                self._indexes.pop(collection_name, None)
+                self._positions.pop(collection_name, None)
+            self._write_record(
+                collection_name,
+                lambda index: ("remove", doc_id) if doc_id in index.doc_chunks else None,
+            )
+        logger.info(f"集合{collection_name}的BM25索引已删除文档{doc_id}")
+
+    def delete_collection(self, collection_name):
+        """
+        删除知识库时，删除整个集合的索引和日志
+        """
+        with self._get_lock(collection_name):
+            index_path = self._index_path(collection_name)
+            with file_lock(index_path):
+                self._indexes.pop(collection_name, None)
+                self._positions.pop(collection_name, None)
+                self._pending.pop(collection_name, None)
+                if os.path.exists(index_path):
+                    os.remove(index_path)
+                self._remove_logs(collection_name)
+        logger.info(f"已经删除集合{collection_name}的BM25索引")
+
+    def _get_scorer(self, collection_name):
+        """
+        获取集合的BM25打分器，索引变化后第一次查询时重新构建
+        构建打分矩阵在锁外进行，入库期间索引频繁变化时不会阻塞其它查询和写入
+        返回 (版本号, 打分器, 矩阵行号对应的chunk_id列表, 分块信息列表)
+        """
+        lock = self._get_lock(collection_name)
+        with lock:
+            index = self.get_index(collection_name)
+            built = index.cached_scorer()
+            if built is not None:
+                return built
+            snapshot = index.snapshot()
+
+        built = index.build_scorer(snapshot)
+        with lock:
+            index.store_scorer(built)
+        return built
+
+    def search(self, collection_name, query_tokens, k):
+        """
+        BM25检索，返回按分数从高到低排序的前k个 (Document, 归一化分数)
+        分数除以最高分归一化到[0,1]，与原来对全量分数归一化的结果一致
+        """
+        _, scorer, chunk_ids, entries = self._get_scorer(collection_name)
+
+        # 一次稀疏矩阵乘向量完成打分，argpartition选出前k个
+        top_rows, top_scores, max_score = scorer.top_k(query_tokens, k)
+        return self._to_documents(chunk_ids, entries, top_rows, top_scores, max_score)
+
+    def batch_search(self, collection_name, queries_tokens, k):
+        """
+        批量BM25检索，多个查询在一次稀疏矩阵乘法中完成打分
+        返回每个查询的 [(Document, 归一化分数)]，与逐个调用search的结果一致
+        """
+        _, scorer, chunk_ids, entries = self._get_scorer(collection_name)
+        return [
+            self._to_documents(chunk_ids, entries, top_rows, top_scores, max_score)
+            for top_rows, top_scores, max_score in scorer.top_k_batch(queries_tokens, k)
+        ]
+
+    def _to_documents(self, chunk_ids, entries, top_rows, top_scores, max_score):
+        """
+        把打分器返回的矩阵行号和分数转换为 [(Document, 归一化分数)]
+        """
+        max_score = max_score if max_score > 0 else 1.0
+
+        results = []
+        for row, score in zip(top_rows, top_scores):
+            chunk = entries[row]
+            doc = Document(
+                page_content=chunk["text"],
+                metadata=dict(chunk["metadata"]),
+                id=chunk_ids[row],
+            )
+            results.append((doc, float(score) / max_score))
+        return results
+
+
+keyword_index_service = KeywordIndexService()
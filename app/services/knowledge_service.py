@@ -12,6 +12,10 @@ from app.services.storage.storage_service import storage_service
 
 from app.services.vector_db.vector_sevice import vector_db_service
 
+from app.services.keyword_index_service import keyword_index_service
+
+from app.services.cache_service import retrieval_cache
+
 from app.config import Config
 
 
@@ -248,6 +252,8 @@ class KnowledgeService(BaseService[Knowledgebase]):
         collection_name = f"kb_{kb_id}_collection"
         try:
             vector_db_service.delete_collection(collection_name)
+            keyword_index_service.delete_collection(collection_name)
+            retrieval_cache.invalidate_kb(kb_id)
             kb_cover_file = kb_model_dict.get("cover_image")
             is_delete_knowledge = True
             storage_service.delete_file(kb_cover_file)
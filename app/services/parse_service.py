@@ -12,5 +12,11 @@ class ParseService:
         # 通过各种文档加载器，得到文本内容
         return DocumentLoader.loader(file_data, file_type)
 
+    def iter_pages(self, file_data, file_type):
+        """
+        逐页解析文件，返回langchain Document的生成器，流式入库时使用
+        """
+        return DocumentLoader.lazy_loader(file_data, file_type.lower())
+
 
 parse_service = ParseService()
@@ -4,6 +4,8 @@ from app.utils.logger import get_logger
 from app.utils.llm_factory import LLMFactory
 from app.services.vector_db.vector_sevice import vector_db_service
 from app.services.retriever_service import retriever_service
+from app.services.cache_service import retrieval_cache
+from app.services.service_registry import service_registry
 
 # 定义RAG聊天提示模板
 from langchain_core.prompts import ChatPromptTemplate
@@ -30,6 +32,13 @@ class RagService(BaseService):
         """
         从知识库中获取相关文档
         """
+        # 相同知识库的相同问题，直接返回缓存的检索结果，不再重复做嵌入、检索和重排序
+        cache_key = retrieval_cache.make_key(kb_id, questions, self.settings)
+        cached_docs = retrieval_cache.get(cache_key)
+        if cached_docs is not None:
+            logger.info(f"知识库检索命中缓存,知识库ID={kb_id},问题={questions},文档数量={len(cached_docs)}")
+            return cached_docs
+
         # 从知识库中获取集合
         collection_name = f"kb_{kb_id}_collection"
         collection = vector_db_service.get_or_create_collection(collection_name)
@@ -57,10 +66,32 @@ class RagService(BaseService):
             #默认走向量检索
             docs = retriever_service.vector_search(collection_name,questions)
 
+        docs = docs or []
         logger.info(f"知识库查询完成,知识库ID={kb_id},问题={questions},检索模式={retriever_mode},文档数量={len(docs)}")
-        
+
+        # 只缓存检索到文档的结果，避免向量库临时异常时把空结果缓存下来
+        if docs:
+            retrieval_cache.set(cache_key, docs)
+
         return docs
 
+    def batch_retrieve(self, kb_id, questions_list, retrieval_mode=None):
+        """
+        对同一个知识库批量检索多个问题，返回每个问题检索到的引用来源
+        """
+        collection_name = f"kb_{kb_id}_collection"
+        retrieval_mode = retrieval_mode or self.settings.get("retrieval_mode", "vector")
+
+        docs_list = retriever_service.batch_search(
+            collection_name, questions_list, retrieval_mode=retrieval_mode
+        )
+        logger.info(f"知识库批量检索完成,知识库ID={kb_id},问题数量={len(questions_list)},检索模式={retrieval_mode}")
+
+        return [
+            {"questions": questions, "sources": self._extract_citations(docs)}
+            for questions, docs in zip(questions_list, docs_list)
+        ]
+
     def ask_quetions_by_knowledgebase(self,kb_id,questions):
         # 从知识库中获取相关文档
         llm = LLMFactory.create_llm(self.settings)
@@ -140,7 +171,8 @@ class RagService(BaseService):
 
 
 
-rag_service = RagService()
+# 数据库中的设置在第一次使用时才加载
+rag_service = service_registry.register("rag", RagService)
 
 
 
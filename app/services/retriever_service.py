@@ -1,12 +1,17 @@
-from rank_bm25 import BM25Okapi
-from langchain_core.documents import Document
-import jieba
-import numpy as np
+import time
 
+# 导入线程池，用于并发执行混合检索的向量检索和全文检索
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from app.config import Config
 from app.services.base_service import BaseService
 from app.utils.logger import get_logger
+from app.utils.tokenizer import tokenize_chinese
 from app.services.vector_db.vector_sevice import vector_db_service
+from app.services.keyword_index_service import keyword_index_service
 from app.services.settings_service import settings_service
+from app.services.service_registry import service_registry
 
 # 引入重排序
 from app.utils.rerank_factory import RerankFactory
@@ -21,6 +26,11 @@ class RetrieverService(BaseService):
         self.settings = settings_service.get_user_settings()
         self.reranker = RerankFactory.create_reranker(self.settings)
 
+        # 混合检索时并发执行向量检索和全文检索的线程池，线程数有上限，避免请求多时无限创建线程
+        self.hybrid_executor = ThreadPoolExecutor(
+            max_workers=Config.HYBRID_SEARCH_WORKERS
+        )
+
     # 向量检索
     def vector_search(self, collection_name, questions,rerank=True):
         """
@@ -28,37 +38,20 @@ class RetrieverService(BaseService):
         """
         top_k = int(self.settings.get("top-k", 5))
 
+        # 先把问题向量化，相同的问题直接复用缓存中的查询向量
+        query_embedding = vector_db_service.embed_query(questions)
+
+        # 需要重排序时，budget模式下保留更大的候选池交给重排序
+        pool_size = self._candidate_pool_size(top_k, rerank)
+
         # 调用向量数据库进行相似度检索,这里先扩大top_k * 3倍进行搜索
-        results = vector_db_service.similarity_search_with_score(
-            collection_name=collection_name, query=questions, k=top_k * 3
+        results = vector_db_service.similarity_search_by_vector_with_score(
+            collection_name=collection_name,
+            embedding=query_embedding,
+            k=max(top_k * 3, pool_size),
         )
         if results:
-            docs_with_score = []
-            for doc, distance in results:
-                """
-                对查询出来的文档分数进行归一化处理并加入元数据
-                归一化公式：vector_score = 1.0 / (1.0 + distance)
-                距离越小，相似度越高，归一化后的值越接近1
-                """
-                vector_score = 1.0 / (1.0 + float(distance))
-                doc.metadata["vector_score"] = vector_score
-                doc.metadata["retrieval_type"] = "vector"
-                docs_with_score.append((doc, vector_score))
-
-            # 对文档列表按vector_score进行排序，score高的排在前面
-            docs_with_score.sort(key=lambda x: x[1], reverse=True)
-
-            # 获取在数据库中保存的向量阀值
-            vector_threshold = float(self.settings.get("vector_threshold", 0.1))
-            vector_threshold = max(0.1, min(vector_threshold, 1.0))
-
-            # 筛选出vector_score大于等于阀值的文档
-            filter_docs = [
-                doc for doc, score in docs_with_score if score >= vector_threshold
-            ]
-
-            # 只返回top_k个文档
-            filter_docs = filter_docs[:top_k]
+            filter_docs = self._filter_vector_results(results, pool_size)
 
             # 对文档列表进行重排序
             if self.reranker and rerank:
@@ -68,6 +61,38 @@ class RetrieverService(BaseService):
 
         return None
 
+    def _filter_vector_results(self, results, top_k):
+        """
+        对向量检索的 [(Document, 距离)] 结果计算分数、按阈值筛选并截取top_k个文档
+        单个问题检索和批量检索共用，保证两者结果一致
+        """
+        docs_with_score = []
+        for doc, distance in results:
+            """
+            对查询出来的文档分数进行归一化处理并加入元数据
+            归一化公式：vector_score = 1.0 / (1.0 + distance)
+            距离越小，相似度越高，归一化后的值越接近1
+            """
+            vector_score = 1.0 / (1.0 + float(distance))
+            doc.metadata["vector_score"] = vector_score
+            doc.metadata["retrieval_type"] = "vector"
+            docs_with_score.append((doc, vector_score))
+
+        # 对文档列表按vector_score进行排序，score高的排在前面
+        docs_with_score.sort(key=lambda x: x[1], reverse=True)
+
+        # 获取在数据库中保存的向量阀值
+        vector_threshold = float(self.settings.get("vector_threshold", 0.1))
+        vector_threshold = max(0.1, min(vector_threshold, 1.0))
+
+        # 筛选出vector_score大于等于阀值的文档
+        filter_docs = [
+            doc for doc, score in docs_with_score if score >= vector_threshold
+        ]
+
+        # 只返回top_k个文档
+        return filter_docs[:top_k]
+
     def _tokenize_chinese(self, text: str) -> list[str]:
         """
         中文分词（使用 jieba）
@@ -76,128 +101,64 @@ class RetrieverService(BaseService):
         Returns:
             分词后的词列表
         """
-        # 使用 jieba 分词
-        words = jieba.lcut(text)
-        # 去除停用词和单字
-        stopwords = set(
-            [
-                "的",
-                "了",
-                "在",
-                "是",
-                "和",
-                "有",
-                "与",
-                "对",
-                "等",
-                "为",
-                "也",
-                "就",
-                "都",
-                "要",
-                "可以",
-                "会",
-                "能",
-                "而",
-                "及",
-                "与",
-                "或",
-            ]
-        )
-        tokens = [
-            word.strip()
-            for word in words
-            if len(word.strip()) > 1 and word.strip() not in stopwords
-        ]
-        return tokens
+        return tokenize_chinese(text)
 
     # 关键词检索
     def keyword_search(self, collection_name, questions,rerank=True):
         """
         关键词检索
+        从集合的BM25倒排索引中检索，不再每次从向量数据库拉取全部分块重新分词建模
         """
         top_k = int(self.settings.get("top-k", 5))
 
-        # 获取在数据库中保存的关键词阀值
-        keyword_threshold = float(self.settings.get("keyword_threshold", 0.2))
-        keyword_threshold = max(0.1, min(keyword_threshold, 1.0))
-
-        # 初始化用于存储所有文档的列表
-        all_docs = []
-
-        # 从数据库中获取所有文档内容
-        results = vector_db_service.get_all_content_from_collection(collection_name)
-
-        if results:
-            ids = results.get("ids", [])
-            documents = results.get("documents", [])
-            metadatas = results.get("metadatas", [{}])
-            for _, (id, doc, metadata) in enumerate(zip(ids, documents, metadatas)):
-                doc = Document(
-                    page_content=doc,
-                    metadata=metadata,
-                    id=id,
-                )
-                all_docs.append(doc)
-
-            all_docs_content = [doc.page_content for doc in all_docs]
-
-            # 1. 对所有文档内容进行分词
-            tokenized_docs = [self._tokenize_chinese(doc) for doc in all_docs_content]
-
-            # 2. 把所有文档的分词结果传入 BM25 模型初始化
-            bm25 = BM25Okapi(tokenized_docs)
-
-            # 3. 对查询问题进行分词
+        try:
+            # 1. 对查询问题进行分词
             tokenized_query = self._tokenize_chinese(questions)
 
-            # 4. 计算查询问题与所有文档的 BM25 分数
-            doc_scores = bm25.get_scores(tokenized_query)
-
-            # 计算分数最大值，用于归一化分数到[0,1]范围
-            max_score = (
-                float(np.max(doc_scores))
-                if len(doc_scores) > 0 and np.max(doc_scores) > 0
-                else 1.0
+            # 2. 从倒排索引中获取top_k*3个BM25分数最高的文档，分数已经归一化到[0,1]范围
+            pool_size = self._candidate_pool_size(top_k, rerank)
+            results = keyword_index_service.search(
+                collection_name, tokenized_query, k=max(top_k * 3, pool_size)
             )
+        except Exception as e:
+            logger.error(f"从集合{collection_name}的BM25索引中检索失败:{e}")
+            return None
 
-            # 让每个文档的分数都除以最大值,归一化 BM25 分数到 [0, 1] 范围
-            normalized_scores = [score / max_score for score in doc_scores]
-
-            # 5.从归一化后的分数中获取top_k*3个分数高的文档的索引，便于后续的筛选
-            # 注意：这里获取的是索引，不是文档本身,np.argsort返回的是索引数组
-            top_incices = np.argsort(normalized_scores)[::-1][: top_k * 3]
-
-            # 6. 筛选出 BM25 分数大于等于阀值的文档
-            filter_docs = []
+        # 3. 按阀值筛选，并只保留top_k个文档（budget模式下保留候选池大小的文档）
+        final_docs_result = self._filter_keyword_results(results, pool_size)
 
-            # 根据筛选出来的bm25分数最高分排序索引，筛选出大于等于阀值的文档
-            for idx in top_incices:
-                if normalized_scores[idx] >= keyword_threshold:
-                    doc = all_docs[idx]
-                    doc.metadata["retrieval_type"] = (
-                        "keyword"  # 设置检索类型为关键词检索
-                    )
-                    doc.metadata["keyword_score"] = normalized_scores[idx]
-                    filter_docs.append((doc, normalized_scores[idx]))
+        # 4. 对文档列表进行重排序
+        if self.reranker and rerank:
+            final_docs_result = self.apply_rerank_results(questions, final_docs_result, top_k=top_k)
 
-            # 7. 对筛选出的文档根据bm25分数从高到低排序
-            filter_docs.sort(key=lambda x: x[1], reverse=True)
+        logger.info(f"bm25关键词检索成功,返回文档数={len(final_docs_result)}")
 
-            # 8. 只返回top_k个文档
-            final_docs_result = [doc for doc, _ in filter_docs[:top_k]]
+        return final_docs_result
 
-            # 9. 对文档列表进行重排序
-            if self.reranker and rerank:
-                final_docs_result = self.apply_rerank_results(questions, final_docs_result, top_k=top_k)
+    def _filter_keyword_results(self, results, top_k):
+        """
+        对BM25检索的 [(Document, 归一化分数)] 结果按阈值筛选、排序并截取top_k个文档
+        单个问题检索和批量检索共用，保证两者结果一致
+        """
+        # 获取在数据库中保存的关键词阀值
+        keyword_threshold = float(self.settings.get("keyword_threshold", 0.2))
+        keyword_threshold = max(0.1, min(keyword_threshold, 1.0))
 
-            logger.info(f"bm25关键词检索成功,返回文档数={len(final_docs_result)}")
+        # 筛选出 BM25 分数大于等于阀值的文档
+        filter_docs = []
+        for doc, score in results:
+            if score >= keyword_threshold:
+                doc.metadata["retrieval_type"] = (
+                    "keyword"  # 设置检索类型为关键词检索
+                )
+                doc.metadata["keyword_score"] = score
+                filter_docs.append((doc, score))
 
-            return final_docs_result
+        # 对筛选出的文档根据bm25分数从高到低排序
+        filter_docs.sort(key=lambda x: x[1], reverse=True)
 
-        else:
-            logger.error(f"从数据库中获取集合{collection_name}所有文档内容失败")
-            return None
+        # 只返回top_k个文档
+        return [doc for doc, _ in filter_docs[:top_k]]
 
     # 混合检索
     def hybrid_search(self, collection_name, questions, rff_k=60):
@@ -205,12 +166,43 @@ class RetrieverService(BaseService):
         混合检索,使用rff 融合向量检索和全文检索
         """
 
+        # 向量检索和全文检索并发执行，某一路超时或出错时只用另一路的结果
+        leg_results = self._run_hybrid_legs(collection_name, questions)
+
         # 向量检索的结果
-        vector_docs = self.vector_search(collection_name, questions,rerank=False)
+        vector_docs = leg_results.get("vector") or []
 
         # 全文检索的结果
-        keyword_docs = self.keyword_search(collection_name, questions,rerank=False)
+        keyword_docs = leg_results.get("keyword") or []
+
+        # 记录本次混合检索实际参与融合的检索方式
+        hybrid_legs = ",".join(leg for leg in ("vector", "keyword") if leg in leg_results)
+
+        top_k = int(self.settings.get("top_k", 5))
+        final_results = self._fuse_hybrid_results(
+            vector_docs,
+            keyword_docs,
+            hybrid_legs,
+            rff_k,
+            limit=self._candidate_pool_size(top_k, True),
+        )
 
+        # 对文档列表进行重排序
+        if self.reranker:
+            final_results = self.apply_rerank_results(questions, final_results, top_k=top_k)
+
+        logger.info(f"混合检索返回{len(final_results)}个文档,检索到文档为：{final_results}")
+
+        return final_results
+
+    def _fuse_hybrid_results(
+        self, vector_docs, keyword_docs, hybrid_legs, rff_k=60, limit=None
+    ):
+        """
+        用rff融合向量检索和全文检索的结果，返回融合分数最高的top_k个文档
+        limit不为空时返回limit个文档，用于给重排序保留更大的候选池
+        单个问题检索和批量检索共用，保证两者结果一致
+        """
         """
         创建字典用于存储文本及其排名信息
         doc_rankings = {
@@ -303,7 +295,7 @@ class RetrieverService(BaseService):
         combined_results.sort(key=lambda x: x[1].get("rff_score", 0.0), reverse=True)
 
         # 提取排序后的文档
-        top_k = int(self.settings.get("top_k", 5))
+        top_k = limit or int(self.settings.get("top_k", 5))
 
         # 提取前top_k个文档
         final_results = []
@@ -315,15 +307,199 @@ class RetrieverService(BaseService):
             doc.metadata["vector_rank"] = rank_info.get("vector_rank", 0)
             doc.metadata["keyword_rank"] = rank_info.get("keyword_rank", 0)
             doc.metadata["retrieval_type"] = "hybrid"
+            doc.metadata["hybrid_legs"] = hybrid_legs
             final_results.append(doc)
 
-        # 对文档列表进行重排序
-        if self.reranker:
-            final_results = self.apply_rerank_results(questions, final_results, top_k=top_k)
+        return final_results
 
-        logger.info(f"混合检索返回{len(final_results)}个文档,检索到文档为：{final_results}")
+    # 批量检索
+    def batch_search(self, collection_name, questions_list, retrieval_mode=None):
+        """
+        对同一个知识库批量检索多个问题，用于离线评测、批量生成FAQ等场景
+        所有问题在一次批量前向计算中完成向量化，一次请求完成向量检索，一次矩阵乘法完成BM25打分
+        返回与questions_list顺序一致的文档列表，每个问题的结果与单个问题检索一致
+        """
+        retrieval_mode = retrieval_mode or self.settings.get("retrieval_mode", "vector")
 
-        return final_results
+        if retrieval_mode == "keyword":
+            return self.batch_keyword_search(collection_name, questions_list)
+        elif retrieval_mode == "hybrid":
+            return self.batch_hybrid_search(collection_name, questions_list)
+        else:
+            return self.batch_vector_search(collection_name, questions_list)
+
+    def batch_vector_search(self, collection_name, questions_list, rerank=True):
+        """
+        批量向量检索
+        """
+        top_k = int(self.settings.get("top-k", 5))
+
+        pool_size = self._candidate_pool_size(top_k, rerank)
+
+        query_embeddings = vector_db_service.embed_queries(questions_list)
+        batch_results = vector_db_service.batch_similarity_search_by_vectors(
+            collection_name=collection_name,
+            embeddings=query_embeddings,
+            k=max(top_k * 3, pool_size),
+        )
+
+        docs_list = []
+        for questions, results in zip(questions_list, batch_results):
+            filter_docs = (
+                self._filter_vector_results(results, pool_size) if results else []
+            )
+            if self.reranker and rerank:
+                filter_docs = self.apply_rerank_results(questions, filter_docs, top_k=top_k)
+            docs_list.append(filter_docs)
+
+        logger.info(f"批量向量检索完成,问题数={len(questions_list)}")
+        return docs_list
+
+    def batch_keyword_search(self, collection_name, questions_list, rerank=True):
+        """
+        批量关键词检索
+        """
+        top_k = int(self.settings.get("top-k", 5))
+
+        pool_size = self._candidate_pool_size(top_k, rerank)
+
+        queries_tokens = [self._tokenize_chinese(questions) for questions in questions_list]
+        batch_results = keyword_index_service.batch_search(
+            collection_name, queries_tokens, k=max(top_k * 3, pool_size)
+        )
+
+        docs_list = []
+        for questions, results in zip(questions_list, batch_results):
+            filter_docs = self._filter_keyword_results(results, pool_size)
+            if self.reranker and rerank:
+                filter_docs = self.apply_rerank_results(questions, filter_docs, top_k=top_k)
+            docs_list.append(filter_docs)
+
+        logger.info(f"批量bm25关键词检索完成,问题数={len(questions_list)}")
+        return docs_list
+
+    def batch_hybrid_search(self, collection_name, questions_list, rff_k=60):
+        """
+        批量混合检索，批量向量检索和批量关键词检索并发执行后逐个问题做rff融合
+        和单个问题的混合检索一样，某一路超时或出错时只用另一路的结果，hybrid_legs记录实际参与融合的检索方式
+        """
+        leg_results = self._run_hybrid_legs(
+            collection_name,
+            questions_list,
+            vector_func=self.batch_vector_search,
+            keyword_func=self.batch_keyword_search,
+        )
+
+        # 超时或出错的一路每个问题都没有结果
+        empty_results = [[] for _ in questions_list]
+        vector_docs_list = leg_results.get("vector") or empty_results
+        keyword_docs_list = leg_results.get("keyword") or empty_results
+
+        hybrid_legs = ",".join(leg for leg in ("vector", "keyword") if leg in leg_results)
+
+        top_k = int(self.settings.get("top_k", 5))
+
+        docs_list = []
+        for questions, vector_docs, keyword_docs in zip(
+            questions_list, vector_docs_list, keyword_docs_list
+        ):
+            final_results = self._fuse_hybrid_results(
+                vector_docs,
+                keyword_docs,
+                hybrid_legs,
+                rff_k,
+                limit=self._candidate_pool_size(top_k, True),
+            )
+            if self.reranker:
+                final_results = self.apply_rerank_results(questions, final_results, top_k=top_k)
+            docs_list.append(final_results)
+
+        logger.info(f"批量混合检索完成,问题数={len(questions_list)},参与融合的检索方式={hybrid_legs}")
+        return docs_list
+
+    def _run_hybrid_legs(self, collection_name, questions, vector_func=None, keyword_func=None):
+        """
+        在线程池中同时提交向量检索和全文检索，每一路有各自的超时时间
+        向量检索主要耗在嵌入模型和网络上，全文检索主要耗在CPU上，并发后总耗时约等于较慢的一路
+        vector_func、keyword_func: 每一路的检索函数，默认为单个问题的检索，批量检索时传入批量检索函数
+        返回 {"vector": 检索结果, "keyword": 检索结果}，超时、出错或返回None的一路不在返回结果中
+        """
+        vector_func = vector_func or self.vector_search
+        keyword_func = keyword_func or self.keyword_search
+
+        start_time = time.monotonic()
+        futures = {
+            "vector": (
+                self.hybrid_executor.submit(
+                    vector_func, collection_name, questions, rerank=False
+                ),
+                Config.HYBRID_VECTOR_TIMEOUT,
+            ),
+            "keyword": (
+                self.hybrid_executor.submit(
+                    keyword_func, collection_name, questions, rerank=False
+                ),
+                Config.HYBRID_KEYWORD_TIMEOUT,
+            ),
+        }
+
+        leg_results = {}
+        for leg, (future, timeout) in futures.items():
+            # 每一路的超时时间都从提交时开始计算
+            remaining = max(0.0, timeout - (time.monotonic() - start_time))
+            try:
+                result = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                future.cancel()
+                logger.warning(f"混合检索的{leg}检索超过{timeout}秒未返回，降级为只使用另一路的结果")
+                continue
+            except Exception as e:
+                logger.error(f"混合检索的{leg}检索出错，降级为只使用另一路的结果:{e}")
+                continue
+            # 关键词检索出错时在内部记录日志并返回None，向量检索没有结果时也返回None，这一路不算参与了融合
+            if result is None:
+                logger.warning(f"混合检索的{leg}检索没有返回结果，只使用另一路的结果")
+                continue
+            leg_results[leg] = result
+
+        return leg_results
+
+    def _candidate_pool_size(self, top_k, rerank):
+        """
+        第一阶段检索保留的候选文档个数
+        budget模式并且需要重排序时为 top_k * RERANK_POOL_FACTOR，否则为top_k
+        """
+        if self.reranker and rerank and Config.RERANK_MODE == "budget":
+            return top_k * max(1, Config.RERANK_POOL_FACTOR)
+        return top_k
+
+    @staticmethod
+    def _first_stage_score(doc):
+        """
+        获取文档第一阶段检索的分数，混合检索用rff分数
+        """
+        score_field = {
+            "vector": "vector_score",
+            "keyword": "keyword_score",
+            "hybrid": "rff_score",
+        }.get(doc.metadata.get("retrieval_type"), "vector_score")
+        return float(doc.metadata.get(score_field, 0.0))
+
+    def _is_margin_decisive(self, documents, top_k):
+        """
+        判断第一阶段的排序是否已经足够明确
+        第top_k名和第top_k+1名的分数差占第1名分数的比例达到RERANK_SKIP_MARGIN时，重排序也很难改变前top_k个文档
+        """
+        if len(documents) <= top_k:
+            return False
+        top_score = self._first_stage_score(documents[0])
+        if top_score <= 0:
+            return False
+        margin = (
+            self._first_stage_score(documents[top_k - 1])
+            - self._first_stage_score(documents[top_k])
+        ) / top_score
+        return margin >= Config.RERANK_SKIP_MARGIN
 
     #对检索后的结果重排序
     def apply_rerank_results(self, query, documents, top_k=None):
@@ -333,6 +509,10 @@ class RetrieverService(BaseService):
         if not self.reranker or not documents:
             logger.warning("未配置重排序模型，无法对文档进行重排序")
             return documents
+
+        if Config.RERANK_MODE == "budget":
+            return self._apply_budget_rerank(query, documents, top_k)
+
         try:
             reranked_docs = self.reranker.rerank(query, documents, top_k=top_k)
             for doc,rerank_score in reranked_docs:
@@ -345,8 +525,49 @@ class RetrieverService(BaseService):
             logger.error(f"重排序文档时出错：{e}")
             return documents
 
+    def _apply_budget_rerank(self, query, documents, top_k=None):
+        """
+        有时间预算的重排序，documents是按第一阶段分数排好序的候选池
+        第一阶段分数差距已经足够明确时跳过重排序，否则在时间预算内分批打分
+        每个返回的文档元数据中记录 rerank_ms(重排序耗时毫秒)、rerank_pairs(模型计算的文档对数)、rerank_skipped(是否跳过)
+        """
+        top_k = top_k or len(documents)
+
+        if self._is_margin_decisive(documents, top_k):
+            final_docs = documents[:top_k]
+            for doc in final_docs:
+                doc.metadata["rerank_ms"] = 0.0
+                doc.metadata["rerank_pairs"] = 0
+                doc.metadata["rerank_skipped"] = True
+            logger.info(f"第一阶段检索分数差距足够明确，跳过重排序，返回{len(final_docs)}个文档")
+            return final_docs
+
+        try:
+            reranked_docs, stats = self.reranker.rerank_with_budget(
+                query,
+                documents,
+                top_k=top_k,
+                budget_ms=Config.RERANK_BUDGET_MS,
+                batch_size=max(1, Config.RERANK_BATCH_SIZE),
+            )
+        except Exception as e:
+            logger.error(f"按时间预算重排序文档时出错：{e}")
+            return documents[:top_k]
+
+        final_docs = []
+        for doc, rerank_score in reranked_docs:
+            # 没来得及打分的文档不设置rerank_score，保持第一阶段的顺序
+            if rerank_score is not None:
+                doc.metadata["rerank_score"] = rerank_score
+            doc.metadata["rerank_ms"] = stats["rerank_ms"]
+            doc.metadata["rerank_pairs"] = stats["rerank_pairs"]
+            doc.metadata["rerank_skipped"] = False
+            final_docs.append(doc)
+        return final_docs
+
 
-retriever_service = RetrieverService()
+# 重排序模型和数据库中的设置在第一次检索时才加载
+retriever_service = service_registry.register("retriever", RetrieverService)
 
 """
 文档的检索服务，包括bm25关键词检索、向量检索、混合检索等。返回检索到的文档列表。文档中包含的分数有
@@ -355,5 +576,7 @@ retriever_service = RetrieverService()
 3. 融合检索分数 rff_score
 4. 重排序分数 rerank_score
 5. 检索类型 retrieval_type （向量、bm25、混合）
+6. 混合检索实际参与融合的检索方式 hybrid_legs （vector,keyword；某一路超时或出错时只有另一路）
+7. budget重排序模式下的重排序耗时 rerank_ms、模型计算的文档对数 rerank_pairs、是否跳过重排序 rerank_skipped
 
 """
@@ -0,0 +1,122 @@
+"""
+服务注册表
+嵌入模型、重排序模型、向量库客户端以及依赖数据库设置的服务都在第一次使用时才创建，导入模块时不做任何加载
+调用方仍然像以前一样使用模块级的服务对象，例如 vector_db_service.add_documents(...)
+warmup() 可以在服务启动后并发地提前创建这些服务，避免第一个请求承担加载模型的耗时
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class LazyProxy:
+    """
+    服务对象的懒加载代理，第一次访问属性时调用factory创建真正的服务对象，之后所有属性访问都转发给它
+    创建过程加锁，多个线程同时第一次访问时只会创建一次
+    """
+
+    def __init__(self, name, factory):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self):
+        instance = object.__getattribute__(self, "_instance")
+        if instance is not None:
+            return instance
+        with object.__getattribute__(self, "_lock"):
+            instance = object.__getattribute__(self, "_instance")
+            if instance is None:
+                name = object.__getattribute__(self, "_name")
+                start_time = time.perf_counter()
+                instance = object.__getattribute__(self, "_factory")()
+                object.__setattr__(self, "_instance", instance)
+                logger.info(
+                    f"服务{name}创建完成,耗时{(time.perf_counter() - start_time) * 1000:.0f}ms"
+                )
+        return instance
+
+    def _is_loaded(self):
+        return object.__getattribute__(self, "_instance") is not None
+
+    def __getattr__(self, item):
+        return getattr(self._resolve(), item)
+
+    def __setattr__(self, key, value):
+        setattr(self._resolve(), key, value)
+
+    def __repr__(self):
+        name = object.__getattribute__(self, "_name")
+        state = "loaded" if self._is_loaded() else "lazy"
+        return f"<LazyProxy {name} ({state})>"
+
+
+class ServiceRegistry:
+
+    def __init__(self):
+        # 服务名称 -> LazyProxy，按注册顺序保存
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """
+        注册一个懒加载的服务，返回它的代理对象，模块中用代理对象替代原来直接创建的单例
+        """
+        proxy = LazyProxy(name, factory)
+        with self._lock:
+            self._services[name] = proxy
+        return proxy
+
+    def status(self):
+        """
+        返回每个服务是否已经创建 {服务名称: True/False}
+        """
+        with self._lock:
+            services = dict(self._services)
+        return {name: proxy._is_loaded() for name, proxy in services.items()}
+
+    def warmup(self, names=None, max_workers=None):
+        """
+        并发创建服务，返回 {服务名称: {"ok": 是否成功, "ms": 耗时, "error": 错误信息}}
+        已经创建过的服务直接返回成功，某个服务创建失败不影响其它服务
+        """
+        with self._lock:
+            services = {
+                name: proxy
+                for name, proxy in self._services.items()
+                if names is None or name in names
+            }
+        if not services:
+            return {}
+
+        def load(proxy):
+            start_time = time.perf_counter()
+            try:
+                proxy._resolve()
+                return {"ok": True, "ms": (time.perf_counter() - start_time) * 1000}
+            except Exception as e:
+                logger.error(f"预热服务失败:{e}")
+                return {
+                    "ok": False,
+                    "ms": (time.perf_counter() - start_time) * 1000,
+                    "error": str(e),
+                }
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers or len(services)) as executor:
+            futures = {name: executor.submit(load, proxy) for name, proxy in services.items()}
+            results = {name: future.result() for name, future in futures.items()}
+        logger.info(
+            f"服务预热完成,耗时{(time.perf_counter() - start_time) * 1000:.0f}ms,结果={results}"
+        )
+        return results
+
+
+service_registry = ServiceRegistry()
@@ -57,6 +57,7 @@ class SettingsService(BaseService[Settings]):
             "keyword_threshold": 0.2,  # 关键词检索阈值
             "vector_weight": 0.75,  # 检索混合权重
             "top_k": 15,  # 返回结果数量
+            "rerank_backend": Config.RERANK_BACKEND,  # 重排序后端 local | onnx
             "created_at": None,  # 创建时间
             "updated_at": None,  # 更新时间
         }
@@ -1,4 +1,5 @@
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from app.services.vector_db.vector_base import VectorBaseService
 from app.config import Config
 from app.utils.logger import get_logger
@@ -17,36 +18,45 @@ class ChromaVectorDB(VectorBaseService):
         # 创建数据库
         persistentClient = PersistentClient(path=Path(__file__).parent / "custom_store")
         """
+        super().__init__()
         self.persistent_dirtory = Config.CHROMA_PERSIST_DIRECTORY
         self.embeddings = EmbeddingFactory.create_embeddings()
 
-        logger.info("chroma_db已经初始化数据保存目录={self.persistent_dirtory}")
+        # 所有集合共用一个客户端，客户端是线程安全的
+        self.client = chromadb.PersistentClient(path=self.persistent_dirtory)
 
-    def get_or_create_collection(self, collection_name):
+        logger.info(f"chroma_db已经初始化数据保存目录={self.persistent_dirtory}")
 
-        logger.info(f"初始化chroma向量数据库，需要embeddings={self.embeddings}")
+    def _create_collection_handle(self, collection_name):
+
+        logger.info(f"初始化chroma集合{collection_name}，需要embeddings={self.embeddings}")
 
         vector_store_db = Chroma(
             collection_name=collection_name,  # 集合的名称
             embedding_function=self.embeddings,  # 嵌入向量
-            persist_directory=self.persistent_dirtory,  # 数据保存目录
+            client=self.client,  # 共用的客户端
             collection_metadata={"hnsw:space": "cosine"}, # 向量距离计算方式
         )
 
         return vector_store_db
 
-    def add_documents(self, collection_name, documents, ids):
+    def add_documents(self, collection_name, documents, ids, progress_callback=None):
         vector_store_db = self.get_or_create_collection(collection_name)
 
-        if ids:
-            results = vector_store_db.add_documents(documents=documents, ids=ids)
-        else:
-            results = vector_store_db.add_documents(documents=documents)
+        results = self._add_documents_in_batches(
+            vector_store_db, documents, ids, progress_callback=progress_callback
+        )
 
         logger.info(f"向chromadb中添加了{len(documents)}条记录")
 
         return results
 
+    def _insert_embedded_batch(self, vector_store_db, texts, embeddings, metadatas, ids):
+        vector_store_db._collection.upsert(
+            ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas
+        )
+        return ids
+
     def query_documents(self, collection_name, document_id, k=10, filter=None):
         """
         查询文档向量
@@ -64,13 +74,9 @@ class ChromaVectorDB(VectorBaseService):
         删除文档的时候，要删除向量数据库中的向量数据，上传的文件，删除数据库里的文档数据
         """
         vector_store_db = self.get_or_create_collection(collection_name)
-        # 直接使用ChromaDB客户端访问集合
-        client = chromadb.PersistentClient(path=self.persistent_dirtory)
-
-        # 通过客户端获得集合名称
-        collection = client.get_collection(name=collection_name)
         try:
-            results = collection.get(where=filter)
+            # 直接使用集合对象上的chromadb集合查询要删除的id，不返回向量和文本
+            results = vector_store_db._collection.get(where=filter, include=[])
             if results and "ids" in results and len(results["ids"]) > 0:
                 ids = results["ids"]
                 vector_store_db.delete(ids=ids)
@@ -85,13 +91,15 @@ class ChromaVectorDB(VectorBaseService):
         删除整个集合
         """
         try:
-            client = chromadb.PersistentClient(path=self.persistent_dirtory)
-            client.delete_collection(name=collection_name)
+            self.client.delete_collection(name=collection_name)
             logger.info(f"成功删除集合: {collection_name}")
             return True
         except Exception as e:
             logger.error(f"删除集合{collection_name}失败，错误信息={e}")
             return False
+        finally:
+            # 缓存的集合对象指向已经删除的集合，需要移除
+            self.evict_collection(collection_name)
 
 
     def similarity_search_with_score(self, collection_name, query, k=10, filter=None):
@@ -106,12 +114,114 @@ class ChromaVectorDB(VectorBaseService):
             return results
         return None
 
-    def get_all_content_from_collection(self, collection_name):
+    def similarity_search_by_vector_with_score(
+        self, collection_name, embedding, k=10, filter=None
+    ):
+        """
+        用查询向量做相似度检索，返回的分数和similarity_search_with_score一样是距离
+        """
+        vector_store_db = self.get_or_create_collection(collection_name)
+        results = vector_store_db.similarity_search_by_vector_with_relevance_scores(
+            embedding=embedding, filter=filter, k=k
+        )
+        if results:
+            return results
+        return None
+
+    def batch_similarity_search_by_vectors(
+        self, collection_name, embeddings, k=10, filter=None
+    ):
+        """
+        一次query请求检索多个查询向量，返回每个查询向量的 [(Document, 距离)]
+        """
+        if not embeddings:
+            return []
+        vector_store_db = self.get_or_create_collection(collection_name)
+        results = vector_store_db._collection.query(
+            query_embeddings=embeddings,
+            n_results=k,
+            where=filter,
+            include=["documents", "metadatas", "distances"],
+        )
+
+        batch_results = []
+        for idx in range(len(embeddings)):
+            batch_results.append(
+                [
+                    (Document(page_content=text, metadata=metadata or {}, id=chunk_id), distance)
+                    for chunk_id, text, metadata, distance in zip(
+                        results["ids"][idx],
+                        results["documents"][idx],
+                        results["metadatas"][idx],
+                        results["distances"][idx],
+                    )
+                ]
+            )
+        return batch_results
+
+    def _query_chunks_by_filter(self, collection_name, filter, start, end, fields):
+        vector_store_db = self.get_or_create_collection(collection_name)
+
+        conditions = [{key: value} for key, value in (filter or {}).items()]
+        conditions.append({"chunk_index": {"$gte": start}})
+        if end is not None:
+            conditions.append({"chunk_index": {"$lt": end}})
+        where = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+        # chroma只能按documents/metadatas整体投影，不需要分块内容时不返回documents
+        include = ["metadatas"]
+        if fields is None or "text" in fields:
+            include.append("documents")
+        results = vector_store_db._collection.get(where=where, include=include)
+
+        documents = results.get("documents") or [""] * len(results["ids"])
+        return [
+            Document(
+                page_content=text or "",
+                metadata=self._project_metadata(metadata or {}, fields),
+                id=chunk_id,
+            )
+            for chunk_id, text, metadata in zip(
+                results["ids"], documents, results["metadatas"]
+            )
+        ]
+
+    def get_all_content_from_collection(self, collection_name, include=None):
         """
         获取集合中的所有文档内容
+        include: 需要返回的字段，可选 documents、metadatas、embeddings，ids总是返回；None表示全部返回
         """
+        include = list(include) if include is not None else list(self.ALL_CONTENT_FIELDS)
         vector_store_db = self.get_or_create_collection(collection_name)
-        results = vector_store_db._collection.get(include=["documents","metadatas","embeddings"])
+        results = vector_store_db._collection.get(include=include)
         if results:
             return results
         return None
+
+    def scan_collection(self, collection_name, include=None, page_size=None):
+        """
+        用offset/limit分页扫描集合
+        """
+        include = list(include) if include is not None else list(self.ALL_CONTENT_FIELDS)
+        page_size = page_size or Config.VECTOR_SCAN_PAGE_SIZE
+        vector_store_db = self.get_or_create_collection(collection_name)
+
+        offset = 0
+        while True:
+            results = vector_store_db._collection.get(
+                include=include, limit=page_size, offset=offset
+            )
+            ids = results.get("ids") or []
+            if not ids:
+                break
+            yield {
+                "ids": ids,
+                "documents": results.get("documents") or [],
+                "metadatas": results.get("metadatas") or [],
+                "embeddings": results.get("embeddings")
+                if results.get("embeddings") is not None
+                else [],
+            }
+            if len(ids) < page_size:
+                break
+            offset += page_size
@@ -1,6 +1,4 @@
 from app.config import Config
-from app.services.vector_db.chroma_db import ChromaVectorDB
-from app.services.vector_db.milvus_db import MilvusVectorDB
 
 
 class VectorDBFactory:
@@ -10,10 +8,19 @@ class VectorDBFactory:
     def create_vector_db(cls):
         vector_db_type = Config.VECTOR_DB_TYPE
 
+        # 只导入用到的向量数据库客户端，避免启动时加载所有向量库依赖
         if vector_db_type == "chroma":
+            from app.services.vector_db.chroma_db import ChromaVectorDB
+
             return ChromaVectorDB()
         elif vector_db_type == "milvus":
+            from app.services.vector_db.milvus_db import MilvusVectorDB
+
             return MilvusVectorDB()
+        elif vector_db_type == "local":
+            from app.services.vector_db.local_db import LocalVectorDB
+
+            return LocalVectorDB()
         else:
             raise ValueError(f"不支持的向量数据类型{vector_db_type}")
 
@@ -23,6 +30,3 @@ class VectorDBFactory:
             cls._instance = cls.create_vector_db()
 
         return cls._instance
-
-
-vector_db_service = VectorDBFactory.get_instance()
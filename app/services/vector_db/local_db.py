@@ -0,0 +1,953 @@
+"""
+内置的本地向量数据库，适合部署不了Milvus、知识库规模不大（几十万分块以内）的场景
+每个集合是一个目录：
+    manifest.json      集合的维度、数据类型、量化方式和段列表
+    seg_000001.vec     段的向量矩阵，按行连续存储的float32/float16，查询时用np.memmap映射，不需要读入内存
+    seg_000001.jsonl   段的分块信息，每行一个 {"id", "text", "metadata"}
+    seg_000001.i8      量化方式为int8时，段的int8量化向量
+    seg_000001.scale   量化方式为int8时，每行的量化系数(float32)
+    tombstones.txt     已删除的行，每行一个 "段名 行号"
+写入只追加到最新的段，段达到行数上限后新建段；删除只记录墓碑；墓碑比例过高时压缩，把存活的行重写到新段
+向量写入前做L2归一化，检索时用矩阵乘法暴力计算余弦相似度，返回的分数和chroma一样是余弦距离(1 - 余弦相似度)
+int8量化的集合先扫描量化向量（占用约为float32的1/4）找出候选，再从磁盘读取候选的原始向量精确计算分数
+"""
+
+import contextlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import Config
+from app.services.vector_db.vector_base import VectorBaseService
+from app.utils.embedding_factory import EmbeddingFactory
+from app.utils.file_lock import file_lock
+from app.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+QUANTIZATION_MODES = ("none", "int8")
+
+
+class LocalSegment:
+    """
+    集合中的一个段，向量文件和分块信息文件都只追加
+    加载时只扫描.jsonl中每一行的位置，分块id和元数据在第一次需要时（写入、按条件过滤）才解析，
+    分块内容不常驻内存，返回检索结果时按行号从文件中读取
+    """
+
+    # 扫描.jsonl中行位置时每次读取的字节数
+    SCAN_BLOCK_BYTES = 1 << 20
+
+    def __init__(self, directory, name, dim, dtype, quantization="none"):
+        self.name = name
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.quantization = quantization
+        self.vec_path = os.path.join(directory, f"{name}.vec")
+        self.meta_path = os.path.join(directory, f"{name}.jsonl")
+        self.code_path = os.path.join(directory, f"{name}.i8")
+        self.scale_path = os.path.join(directory, f"{name}.scale")
+
+        # 每一行在.jsonl中的起始位置，最后一个元素是最后一行的结束位置，行数 = len(offsets) - 1
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self._ids = None
+        self._metadatas = None
+        self._matrix = None
+        self._codes = None
+        self._scales = None
+
+    @property
+    def rows(self):
+        return len(self.offsets) - 1
+
+    @property
+    def quantized(self):
+        return self.quantization == "int8"
+
+    def _file_parts(self):
+        """
+        段的二进制文件和每行占用的字节数
+        """
+        parts = [(self.vec_path, self.dim * self.dtype.itemsize)]
+        if self.quantized:
+            parts.append((self.code_path, self.dim))
+            parts.append((self.scale_path, 4))
+        return parts
+
+    def _scan_line_ends(self, position=0):
+        """
+        从position开始扫描.jsonl中以换行符结尾的完整行，返回每行的结束位置
+        """
+        if not os.path.exists(self.meta_path):
+            return np.zeros(0, dtype=np.int64)
+        line_ends = []
+        with open(self.meta_path, "rb") as f:
+            f.seek(position)
+            while True:
+                block = f.read(self.SCAN_BLOCK_BYTES)
+                if not block:
+                    break
+                newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+                line_ends.append(newlines.astype(np.int64) + position + 1)
+                position += len(block)
+        if not line_ends:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(line_ends)
+
+    def load(self):
+        """
+        从磁盘加载段，各个文件的行数不一致时（写入中途进程退出），截断到所有文件都完整的行数
+        已经加载过的段只扫描上次加载之后追加的部分（其它进程写入的行）
+        调用方需要持有集合的文件锁，没有进程正在写入时才能判断数据是否完整
+        """
+        loaded_offsets = self.offsets
+        meta_size = os.path.getsize(self.meta_path) if os.path.exists(self.meta_path) else 0
+        if meta_size < loaded_offsets[-1]:
+            loaded_offsets = np.zeros(1, dtype=np.int64)
+            self._ids = self._metadatas = None
+        loaded_rows = len(loaded_offsets) - 1
+        line_ends = np.concatenate(
+            [loaded_offsets[1:], self._scan_line_ends(int(loaded_offsets[-1]))]
+        )
+        file_rows = [
+            (path, row_bytes, os.path.getsize(path) // row_bytes if os.path.exists(path) else 0)
+            for path, row_bytes in self._file_parts()
+        ]
+        rows = min([len(line_ends)] + [count for _, _, count in file_rows])
+        offsets = np.concatenate([[0], line_ends[:rows]]).astype(np.int64)
+
+        if meta_size != offsets[-1] or any(count != rows for _, _, count in file_rows):
+            logger.warning(f"段{self.name}的数据不完整，截断到{rows}行")
+            for path, row_bytes, _ in file_rows:
+                with open(path, "ab") as f:
+                    f.truncate(rows * row_bytes)
+            with open(self.meta_path, "ab") as f:
+                f.truncate(int(offsets[-1]))
+
+        self.offsets = offsets
+        # 墓碑由集合重新读取，这里先全部标记为存活
+        self.alive = np.ones(rows, dtype=bool)
+        if rows != loaded_rows:
+            self._matrix = self._codes = self._scales = None
+            if self._ids is not None and rows > loaded_rows:
+                for chunk_id, _, metadata in self.iter_records(loaded_rows, rows):
+                    self._ids.append(chunk_id)
+                    self._metadatas.append(metadata)
+            elif self._ids is not None:
+                self._ids = self._metadatas = None
+
+    def _load_sidecar(self):
+        """
+        解析所有行的分块id和元数据，分块内容不保留
+        """
+        if self._ids is not None:
+            return
+        ids = []
+        metadatas = []
+        for chunk_id, _, metadata in self.iter_records():
+            ids.append(chunk_id)
+            metadatas.append(metadata)
+        self._ids, self._metadatas = ids, metadatas
+
+    @property
+    def ids(self):
+        self._load_sidecar()
+        return self._ids
+
+    @property
+    def metadatas(self):
+        self._load_sidecar()
+        return self._metadatas
+
+    @staticmethod
+    def _parse_line(line):
+        item = json.loads(line)
+        return item["id"], item.get("text", ""), item.get("metadata") or {}
+
+    def iter_records(self, start=0, end=None):
+        """
+        按顺序读取[start, end)行的 (分块id, 分块内容, 元数据)
+        """
+        end = self.rows if end is None else end
+        if start >= end:
+            return
+        with open(self.meta_path, "rb") as f:
+            f.seek(int(self.offsets[start]))
+            for _ in range(start, end):
+                yield self._parse_line(f.readline())
+
+    def read_records(self, rows):
+        """
+        按行号读取若干行的 (分块id, 分块内容, 元数据)，只读取需要的行
+        """
+        records = {}
+        with open(self.meta_path, "rb") as f:
+            for row in sorted({int(row) for row in rows}):
+                f.seek(int(self.offsets[row]))
+                records[row] = self._parse_line(f.readline())
+        return [records[int(row)] for row in rows]
+
+    @staticmethod
+    def quantize(vectors):
+        """
+        按行做对称int8量化：每行除以该行绝对值的最大值再乘127，返回 (int8向量, 每行的系数)
+        还原时 向量 ≈ int8向量 * 系数
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        max_abs = np.abs(vectors).max(axis=1)
+        max_abs[max_abs == 0] = 1.0
+        scales = (max_abs / 127.0).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+
+    def append(self, vectors, ids, texts, metadatas):
+        """
+        追加若干行，先写向量再写分块信息，加载时以所有文件都完整的行数为准
+        """
+        with open(self.vec_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        if self.quantized:
+            codes, scales = self.quantize(vectors)
+            with open(self.code_path, "ab") as f:
+                f.write(codes.tobytes())
+            with open(self.scale_path, "ab") as f:
+                f.write(scales.tobytes())
+        lines = [
+            (json.dumps({"id": chunk_id, "text": text, "metadata": metadata}, ensure_ascii=False) + "\n").encode("utf-8")
+            for chunk_id, text, metadata in zip(ids, texts, metadatas)
+        ]
+        with open(self.meta_path, "ab") as f:
+            f.write(b"".join(lines))
+
+        line_ends = self.offsets[-1] + np.cumsum([len(line) for line in lines], dtype=np.int64)
+        if self._ids is not None:
+            self._ids.extend(ids)
+            self._metadatas.extend(metadatas)
+        # 先扩展alive再扩展offsets，锁外按行数读取alive时不会越界
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+        self.offsets = np.concatenate([self.offsets, line_ends])
+        # 文件变长了，下次使用时重新映射
+        self._matrix = self._codes = self._scales = None
+
+    def _memmap(self, path, dtype, shape):
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def matrix(self):
+        """
+        用内存映射读取向量矩阵，不复制到内存，由操作系统按需加载和缓存
+        """
+        matrix = self._matrix
+        if matrix is None:
+            matrix = self._memmap(self.vec_path, self.dtype, (self.rows, self.dim))
+            self._matrix = matrix
+        return matrix
+
+    def codes(self):
+        """
+        int8量化向量和每行的量化系数，同样用内存映射读取
+        """
+        codes, scales = self._codes, self._scales
+        if codes is None or scales is None:
+            rows = self.rows
+            codes = self._memmap(self.code_path, np.int8, (rows, self.dim))
+            scales = self._memmap(self.scale_path, np.float32, (rows,))
+            self._codes, self._scales = codes, scales
+        return codes, scales
+
+    def remove_files(self):
+        self._matrix = self._codes = self._scales = None
+        for path in (self.vec_path, self.meta_path, self.code_path, self.scale_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class LocalCollection:
+    """
+    一个集合，写入、删除、压缩在集合锁内完成
+    检索只在锁内取各个段的快照，暴力扫描和读取分块内容在锁外进行，同一个集合的多个检索可以同时进行，也不会被写入阻塞
+    web服务的多个进程和文档处理worker进程会同时打开同一个集合：
+    写入、删除、压缩还要持有集合的文件锁，开始前先加载其它进程的修改；
+    检索前比较manifest、墓碑文件和最后一个段的文件签名，有变化时在文件锁内重新加载
+    """
+
+    MANIFEST_VERSION = 1
+
+    # 暴力检索时每次参与矩阵乘法的行数，控制float16转换为float32时的临时内存
+    SEARCH_BLOCK_ROWS = 65536
+    # int8向量每次转换为float32的行数，转换后的临时内存只有这么多行
+    QUANTIZED_CAST_ROWS = 4096
+
+    def __init__(
+        self,
+        directory,
+        dtype=None,
+        segment_max_rows=None,
+        compact_ratio=None,
+        quantization=None,
+        rescore_factor=None,
+    ):
+        self.directory = directory
+        self.dtype = dtype or Config.LOCAL_VECTOR_DTYPE
+        self.segment_max_rows = segment_max_rows or Config.LOCAL_SEGMENT_MAX_ROWS
+        self.compact_ratio = (
+            Config.LOCAL_COMPACT_TOMBSTONE_RATIO if compact_ratio is None else compact_ratio
+        )
+        # 新建集合时使用的量化方式，已经存在的集合以manifest中记录的为准
+        self.quantization = quantization or Config.LOCAL_VECTOR_QUANTIZATION
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"不支持的量化方式{self.quantization}")
+        # 量化检索时取 top_k * rescore_factor 个候选，用原始向量重新计算分数
+        self.rescore_factor = rescore_factor or Config.LOCAL_RESCORE_FACTOR
+
+        self.dim = None
+        self.segments = []
+        self.next_segment = 1
+        # 存活的分块 chunk_id -> (段下标, 行号)，第一次写入或按id删除时才建立
+        self._id_index = None
+        self.tombstone_count = 0
+        self._lock = threading.RLock()
+        # 正在锁外读取段文件的检索个数，压缩后被替换的旧段等没有检索在读取时再删除文件
+        self._readers = 0
+        self._retired = []
+        # 上次加载时磁盘文件的签名，和当前不一致说明其它进程修改过集合
+        self._signature = None
+
+        with self._lock:
+            self._refresh()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    @property
+    def tombstone_path(self):
+        return os.path.join(self.directory, "tombstones.txt")
+
+    @property
+    def quantized(self):
+        return self.quantization == "int8"
+
+    @property
+    def id_index(self):
+        with self._lock:
+            if self._id_index is None:
+                id_index = {}
+                for seg_idx, segment in enumerate(self.segments):
+                    ids = segment.ids
+                    for row in np.flatnonzero(segment.alive):
+                        id_index[ids[row]] = (seg_idx, int(row))
+                self._id_index = id_index
+            return self._id_index
+
+    @staticmethod
+    def _file_signature(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _disk_signature(self):
+        """
+        其它进程写入只追加到最后一个段，新建段、压缩会替换manifest，删除会追加或删除墓碑文件
+        """
+        last_meta = self.segments[-1].meta_path if self.segments else None
+        return (
+            self._file_signature(self.manifest_path),
+            self._file_signature(self.tombstone_path),
+            self._file_signature(last_meta) if last_meta else None,
+        )
+
+    def _refresh(self, locked=False):
+        """
+        磁盘上的集合被其它进程修改过时重新加载，调用方需要持有self._lock
+        locked为True表示调用方已经持有文件锁（同一个进程重复加文件锁会死锁）
+        """
+        if self._disk_signature() == self._signature:
+            return
+        if locked:
+            self._reload()
+        else:
+            with file_lock(self.directory):
+                self._reload()
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        """
+        写入、删除、压缩时持有集合锁和文件锁，开始前先加载其它进程的修改，结束后记录新的签名
+        """
+        with self._lock, file_lock(self.directory):
+            self._refresh(locked=True)
+            yield
+            self._signature = self._disk_signature()
+
+    def _reload(self):
+        """
+        按manifest加载段，已经加载过的段只读取新追加的行，然后重新读取墓碑
+        调用方持有文件锁，其它进程不会在加载过程中写入
+        """
+        self._id_index = None
+        self.tombstone_count = 0
+        if not os.path.exists(self.manifest_path):
+            # 集合还没有创建，或者已经被其它进程删除
+            self.dim = None
+            self.segments = []
+            self.next_segment = 1
+            self._signature = self._disk_signature()
+            return
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.dim = manifest["dim"]
+        self.dtype = manifest["dtype"]
+        self.quantization = manifest.get("quantization", "none")
+        self.next_segment = manifest["next_segment"]
+        loaded = {segment.name: segment for segment in self.segments}
+        segments = []
+        for name in manifest["segments"]:
+            segment = loaded.get(name) or self._make_segment(name)
+            segment.load()
+            segments.append(segment)
+        # 不在manifest中的段已经被其它进程压缩掉了
+        self.segments = segments
+
+        segment_positions = {segment.name: idx for idx, segment in enumerate(self.segments)}
+        if os.path.exists(self.tombstone_path):
+            with open(self.tombstone_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if not line.endswith("\n") or len(parts) != 2 or parts[0] not in segment_positions:
+                        continue
+                    segment = self.segments[segment_positions[parts[0]]]
+                    row = int(parts[1])
+                    if row < segment.rows and segment.alive[row]:
+                        segment.alive[row] = False
+                        self.tombstone_count += 1
+        self._signature = self._disk_signature()
+
+    def _write_manifest(self):
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = {
+            "version": self.MANIFEST_VERSION,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "quantization": self.quantization,
+            "segments": [segment.name for segment in self.segments],
+            "next_segment": self.next_segment,
+        }
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def _make_segment(self, name=None):
+        if name is None:
+            name = f"seg_{self.next_segment:06d}"
+            self.next_segment += 1
+        return LocalSegment(self.directory, name, self.dim, self.dtype, self.quantization)
+
+    def _new_segment(self):
+        segment = self._make_segment()
+        self.segments.append(segment)
+        self._write_manifest()
+        return segment
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, ids, embeddings, texts, metadatas):
+        """
+        写入分块，id已经存在时先删除旧的行（upsert）
+        """
+        vectors = self._normalize(embeddings)
+        with self._write_lock():
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                os.makedirs(self.directory, exist_ok=True)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度{vectors.shape[1]}和集合的维度{self.dim}不一致")
+
+            id_index = self.id_index
+            existing = [chunk_id for chunk_id in ids if chunk_id in id_index]
+            if existing:
+                self._tombstone(existing)
+
+            start = 0
+            while start < len(ids):
+                segment = self.segments[-1] if self.segments else None
+                if segment is None or segment.rows >= self.segment_max_rows:
+                    segment = self._new_segment()
+                end = min(len(ids), start + self.segment_max_rows - segment.rows)
+                seg_idx = len(self.segments) - 1
+                first_row = segment.rows
+                segment.append(
+                    vectors[start:end], ids[start:end], texts[start:end], metadatas[start:end]
+                )
+                for offset, chunk_id in enumerate(ids[start:end]):
+                    id_index[chunk_id] = (seg_idx, first_row + offset)
+                start = end
+        return list(ids)
+
+    def _tombstone(self, chunk_ids):
+        """
+        把分块标记为已删除，返回删除的个数
+        """
+        id_index = self.id_index
+        lines = []
+        for chunk_id in chunk_ids:
+            position = id_index.pop(chunk_id, None)
+            if position is None:
+                continue
+            seg_idx, row = position
+            segment = self.segments[seg_idx]
+            segment.alive[row] = False
+            lines.append(f"{segment.name} {row}\n")
+        if lines:
+            with open(self.tombstone_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+            self.tombstone_count += len(lines)
+        return len(lines)
+
+    def delete(self, ids=None, filter=None):
+        with self._write_lock():
+            if ids is None:
+                ids = []
+                for segment in self.segments:
+                    mask = segment.alive & self._filter_mask(segment, filter, segment.rows)
+                    segment_ids = segment.ids
+                    ids.extend(segment_ids[row] for row in np.flatnonzero(mask))
+            deleted = self._tombstone(ids)
+
+            total = len(self.id_index) + self.tombstone_count
+            if deleted and total and self.tombstone_count / total >= self.compact_ratio:
+                self._compact()
+            return deleted
+
+    def compact(self, quantization=None):
+        """
+        把存活的行重写到新的段，删除旧段和墓碑文件
+        传入quantization时同时切换集合的量化方式，例如把已有的集合转换为int8量化存储
+        """
+        if quantization is not None and quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"不支持的量化方式{quantization}")
+        with self._write_lock():
+            self._compact(quantization)
+
+    def _compact(self, quantization=None):
+        # 调用方已经持有集合锁和文件锁
+        if quantization is not None:
+            self.quantization = quantization
+        if not self.segments:
+            if self.dim is not None:
+                self._write_manifest()
+            return
+        old_segments = self.segments
+        self.segments = []
+        id_index = {}
+
+        new_segment = None
+        for segment in old_segments:
+            matrix = segment.matrix()
+            records = segment.iter_records()
+            for start in range(0, segment.rows, self.SEARCH_BLOCK_ROWS):
+                end = min(segment.rows, start + self.SEARCH_BLOCK_ROWS)
+                block_records = [next(records) for _ in range(start, end)]
+                live_rows = np.flatnonzero(segment.alive[start:end])
+                offset = 0
+                while offset < len(live_rows):
+                    if new_segment is None or new_segment.rows >= self.segment_max_rows:
+                        new_segment = self._make_segment()
+                        self.segments.append(new_segment)
+                    part = live_rows[offset : offset + self.segment_max_rows - new_segment.rows]
+                    seg_idx = len(self.segments) - 1
+                    first_row = new_segment.rows
+                    part_records = [block_records[row] for row in part]
+                    new_segment.append(
+                        matrix[part + start],
+                        [record[0] for record in part_records],
+                        [record[1] for record in part_records],
+                        [record[2] for record in part_records],
+                    )
+                    for idx, record in enumerate(part_records):
+                        id_index[record[0]] = (seg_idx, first_row + idx)
+                    offset += len(part)
+        self._id_index = id_index
+
+        # 新段写完后再切换manifest，切换前进程退出时仍然使用旧段
+        self._write_manifest()
+        if os.path.exists(self.tombstone_path):
+            os.remove(self.tombstone_path)
+        self.tombstone_count = 0
+        # 锁外可能还有检索在读取旧段，等这些检索结束后再删除旧段的文件
+        # 其它进程正在读取的旧段文件会被直接删除，那边的检索重新加载后重试
+        self._retired.extend(old_segments)
+        self._remove_retired()
+        logger.info(f"集合{self.directory}压缩完成,存活分块数={len(id_index)}")
+
+    def _remove_retired(self):
+        # 调用方已经持有self._lock
+        if self._readers == 0:
+            for segment in self._retired:
+                segment.remove_files()
+            self._retired = []
+
+    @staticmethod
+    def _filter_mask(segment, filter, rows):
+        if not filter:
+            return np.ones(rows, dtype=bool)
+        metadatas = segment.metadatas
+        return np.fromiter(
+            (
+                all(metadatas[row].get(key) == value for key, value in filter.items())
+                for row in range(rows)
+            ),
+            dtype=bool,
+            count=rows,
+        )
+
+    def _acquire_snapshot(self, filter=None):
+        """
+        在锁内取各个段的快照 [(段, 行数, 可以返回的行)]，之后可以在锁外读取这些段
+        用完后必须调用 _release_snapshot
+        """
+        with self._lock:
+            self._refresh()
+            snapshot = []
+            for segment in self.segments:
+                rows = segment.rows
+                if filter:
+                    # 第一次按条件过滤时在锁内解析元数据
+                    segment.metadatas
+                snapshot.append((segment, rows, segment.alive[:rows].copy()))
+            self._readers += 1
+        if filter:
+            # 元数据只追加不修改，锁外只读取快照行数以内的部分
+            snapshot = [
+                (segment, rows, mask & self._filter_mask(segment, filter, rows))
+                for segment, rows, mask in snapshot
+            ]
+        return snapshot
+
+    def _release_snapshot(self):
+        with self._lock:
+            self._readers -= 1
+            self._remove_retired()
+
+    def _scan(self, snapshot, queries, n_candidates):
+        """
+        暴力扫描快照中的所有段，返回每个查询向量分数最高的n_candidates个候选 (分数, 段下标, 行号)，形状都是(候选数 x 查询数)
+        量化的集合扫描int8向量，分数是近似值；没有候选时返回None
+        """
+        cand_scores = []
+        cand_segments = []
+        cand_rows = []
+        for seg_idx, (segment, rows, mask) in enumerate(snapshot):
+            if not mask.any():
+                continue
+            if segment.quantized:
+                codes, scales = segment.codes()
+            else:
+                matrix = segment.matrix()
+            for start in range(0, rows, self.SEARCH_BLOCK_ROWS):
+                end = min(rows, start + self.SEARCH_BLOCK_ROWS)
+                block_mask = mask[start:end]
+                if not block_mask.any():
+                    continue
+                # (行数 x 查询数)
+                if segment.quantized:
+                    scores = self._quantized_scores(codes, scales, start, end, queries)
+                else:
+                    block = np.asarray(matrix[start:end], dtype=np.float32)
+                    scores = block @ queries.T
+                scores[~block_mask] = -np.inf
+                kk = min(n_candidates, end - start)
+                part = np.argpartition(-scores, kk - 1, axis=0)[:kk]
+                cand_scores.append(np.take_along_axis(scores, part, axis=0))
+                cand_rows.append(part + start)
+                cand_segments.append(np.full(part.shape, seg_idx))
+
+        if not cand_scores:
+            return None
+        return (
+            np.concatenate(cand_scores, axis=0),
+            np.concatenate(cand_segments, axis=0),
+            np.concatenate(cand_rows, axis=0),
+        )
+
+    def _quantized_scores(self, codes, scales, start, end, queries):
+        """
+        计算int8向量 codes[start:end] 与查询向量的近似分数，形状是(行数 x 查询数)
+        int8向量按QUANTIZED_CAST_ROWS行一段转换到复用的float32缓冲区中再做矩阵乘法，不生成整个块的float32副本
+        量化系数在乘法之后按行乘到分数上
+        """
+        scores = np.empty((end - start, queries.shape[0]), dtype=np.float32)
+        buffer = np.empty((min(self.QUANTIZED_CAST_ROWS, end - start), queries.shape[1]), dtype=np.float32)
+        for chunk_start in range(start, end, self.QUANTIZED_CAST_ROWS):
+            chunk_end = min(end, chunk_start + self.QUANTIZED_CAST_ROWS)
+            chunk = buffer[: chunk_end - chunk_start]
+            np.copyto(chunk, codes[chunk_start:chunk_end], casting="unsafe")
+            np.matmul(chunk, queries.T, out=scores[chunk_start - start : chunk_end - start])
+        scores *= np.asarray(scales[start:end])[:, None]
+        return scores
+
+    def _rescore(self, snapshot, queries, scores, seg_ids, rows):
+        """
+        从磁盘读取候选的原始向量，用精确的余弦相似度替换量化得到的近似分数
+        只读取候选所在的行，不会把整个向量矩阵读入内存
+        """
+        exact = np.full(scores.shape, -np.inf, dtype=np.float32)
+        valid = np.isfinite(scores)
+        for seg_idx in np.unique(seg_ids[valid]):
+            positions = np.nonzero(valid & (seg_ids == seg_idx))
+            seg_rows = rows[positions]
+            unique_rows, inverse = np.unique(seg_rows, return_inverse=True)
+            vectors = np.asarray(snapshot[seg_idx][0].matrix()[unique_rows], dtype=np.float32)
+            exact[positions] = np.einsum(
+                "ij,ij->i", vectors[inverse], queries[positions[1]]
+            )
+        return exact
+
+    def search(self, embeddings, k, filter=None):
+        """
+        暴力计算余弦相似度，返回每个查询向量的 [(Document, 余弦距离)]
+        量化的集合先用int8向量取 k * rescore_factor 个候选，再用原始向量精确计算分数后取前k个
+        """
+        queries = self._normalize(embeddings)
+        if k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        try:
+            return self._search(queries, k, filter)
+        except FileNotFoundError as e:
+            # 取快照之后其它进程压缩了集合，删除了旧段的文件，重新加载后再检索一次
+            logger.info(f"集合{self.directory}的段文件已经被其它进程替换,重新加载后重试:{e}")
+            return self._search(queries, k, filter)
+
+    def _search(self, queries, k, filter):
+        query_count = queries.shape[0]
+        snapshot = self._acquire_snapshot(filter)
+        try:
+            quantized = any(segment.quantized for segment, _, _ in snapshot)
+            n_candidates = k * self.rescore_factor if quantized else k
+            candidates = self._scan(snapshot, queries, n_candidates)
+            if candidates is None:
+                return [[] for _ in range(query_count)]
+            scores, seg_ids, rows = candidates
+            if quantized:
+                scores = self._rescore(snapshot, queries, scores, seg_ids, rows)
+
+            hits = []
+            for col in range(query_count):
+                order = np.argsort(-scores[:, col], kind="stable")[:k]
+                hits.append(
+                    [
+                        (int(seg_ids[idx, col]), int(rows[idx, col]), float(scores[idx, col]))
+                        for idx in order
+                        if np.isfinite(scores[idx, col])
+                    ]
+                )
+
+            # 只读取结果所在行的分块信息
+            wanted = {}
+            for query_hits in hits:
+                for seg_idx, row, _ in query_hits:
+                    wanted.setdefault(seg_idx, set()).add(row)
+            records = {}
+            for seg_idx, seg_rows in wanted.items():
+                seg_rows = sorted(seg_rows)
+                for row, record in zip(seg_rows, snapshot[seg_idx][0].read_records(seg_rows)):
+                    records[(seg_idx, row)] = record
+
+            results = []
+            for query_hits in hits:
+                docs = []
+                for seg_idx, row, score in query_hits:
+                    chunk_id, text, metadata = records[(seg_idx, row)]
+                    docs.append(
+                        (
+                            Document(page_content=text, metadata=dict(metadata), id=chunk_id),
+                            float(1.0 - score),
+                        )
+                    )
+                results.append(docs)
+            return results
+        finally:
+            self._release_snapshot()
+
+    def iter_records(self, filter=None, with_vectors=False):
+        """
+        按写入顺序遍历存活的行，返回 (分块id, 分块内容, 元数据, 向量)，with_vectors为False时向量为None
+        """
+        snapshot = self._acquire_snapshot(filter)
+        try:
+            for segment, rows, mask in snapshot:
+                if not mask.any():
+                    continue
+                matrix = segment.matrix() if with_vectors else None
+                for row, (chunk_id, text, metadata) in enumerate(segment.iter_records(0, rows)):
+                    if not mask[row]:
+                        continue
+                    vector = np.asarray(matrix[row], dtype=np.float32) if with_vectors else None
+                    yield chunk_id, text, metadata, vector
+        finally:
+            self._release_snapshot()
+
+    def drop(self):
+        with self._write_lock():
+            for segment in self.segments + self._retired:
+                segment.remove_files()
+            self.segments = []
+            self._retired = []
+            self._id_index = {}
+            self.dim = None
+            if os.path.exists(self.directory):
+                shutil.rmtree(self.directory)
+
+
+class LocalVectorDB(VectorBaseService):
+
+    def __init__(self):
+        super().__init__()
+        self.persistent_dirtory = Config.LOCAL_VECTOR_DIRECTORY
+        os.makedirs(self.persistent_dirtory, exist_ok=True)
+        self.embeddings = EmbeddingFactory.create_embeddings()
+        logger.info(f"本地向量数据库已经初始化,数据保存目录={self.persistent_dirtory}")
+
+    def _create_collection_handle(self, collection_name):
+        quantization = None
+        if collection_name in Config.LOCAL_QUANTIZED_COLLECTIONS:
+            quantization = "int8"
+        return LocalCollection(
+            os.path.join(self.persistent_dirtory, collection_name), quantization=quantization
+        )
+
+    def add_documents(self, collection_name, documents, ids=None, progress_callback=None):
+        collection = self.get_or_create_collection(collection_name)
+        results = self._add_documents_in_batches(
+            collection, documents, ids, progress_callback=progress_callback
+        )
+        logger.info(f"向本地向量数据库的{collection_name}添加了{len(documents)}条记录")
+        return results
+
+    def _insert_embedded_batch(self, vector_store_db, texts, embeddings, metadatas, ids):
+        return vector_store_db.add(ids, embeddings, texts, metadatas)
+
+    def delete_document_from_collection(self, collection_name, ids=None, filter=None):
+        if not ids and not filter:
+            raise ValueError("ids 和 filter 都没有传，无法删除")
+        collection = self.get_or_create_collection(collection_name)
+        deleted = collection.delete(ids=ids or None, filter=filter)
+        logger.info(f"已经从本地向量数据库的{collection_name}删除了{deleted}条记录")
+
+    def delete_collection(self, collection_name):
+        try:
+            self.get_or_create_collection(collection_name).drop()
+            logger.info(f"成功删除集合: {collection_name}")
+            return True
+        except Exception as e:
+            logger.error(f"删除集合{collection_name}失败，错误信息={e}")
+            return False
+        finally:
+            self.evict_collection(collection_name)
+
+    def compact_collection(self, collection_name):
+        """
+        手动压缩集合，回收已删除分块占用的磁盘空间
+        """
+        self.get_or_create_collection(collection_name).compact()
+
+    def set_collection_quantization(self, collection_name, quantization):
+        """
+        切换已有集合的量化方式(none 或 int8)，会重写集合的所有段
+        """
+        self.get_or_create_collection(collection_name).compact(quantization=quantization)
+        logger.info(f"集合{collection_name}的量化方式已经切换为{quantization}")
+
+    def query_documents(self, collection_name, document_id, k=10, filter=None):
+        return self.similarity_search_with_score(collection_name, document_id, k=k, filter=filter)
+
+    def similarity_search_with_score(self, collection_name, query, k=10, filter=None):
+        return self.similarity_search_by_vector_with_score(
+            collection_name, self.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search_by_vector_with_score(
+        self, collection_name, embedding, k=10, filter=None
+    ):
+        results = self.get_or_create_collection(collection_name).search(
+            [embedding], k, filter=filter
+        )[0]
+        if results:
+            return results
+        return None
+
+    def batch_similarity_search_by_vectors(
+        self, collection_name, embeddings, k=10, filter=None
+    ):
+        if not embeddings:
+            return []
+        return self.get_or_create_collection(collection_name).search(
+            embeddings, k, filter=filter
+        )
+
+    def _query_chunks_by_filter(self, collection_name, filter, start, end, fields):
+        docs = []
+        collection = self.get_or_create_collection(collection_name)
+        for chunk_id, text, metadata, _ in collection.iter_records(filter):
+            chunk_index = metadata.get("chunk_index", 0)
+            if chunk_index < start or (end is not None and chunk_index >= end):
+                continue
+            docs.append(
+                Document(
+                    page_content=text if fields is None or "text" in fields else "",
+                    metadata=self._project_metadata(dict(metadata), fields),
+                    id=chunk_id,
+                )
+            )
+        return docs
+
+    def get_all_content_from_collection(self, collection_name, include=None):
+        results = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        for batch in self.scan_collection(collection_name, include=include):
+            for key, values in batch.items():
+                results[key].extend(values)
+        if results["ids"]:
+            return results
+        return None
+
+    def scan_collection(self, collection_name, include=None, page_size=None):
+        include = list(include) if include is not None else list(self.ALL_CONTENT_FIELDS)
+        page_size = page_size or Config.VECTOR_SCAN_PAGE_SIZE
+
+        def new_batch():
+            return {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+
+        batch = new_batch()
+        collection = self.get_or_create_collection(collection_name)
+        records = collection.iter_records(with_vectors="embeddings" in include)
+        for chunk_id, text, metadata, vector in records:
+            batch["ids"].append(chunk_id)
+            if "documents" in include:
+                batch["documents"].append(text)
+            if "metadatas" in include:
+                batch["metadatas"].append(dict(metadata))
+            if "embeddings" in include:
+                batch["embeddings"].append(vector.tolist())
+            if len(batch["ids"]) >= page_size:
+                yield batch
+                batch = new_batch()
+        if batch["ids"]:
+            yield batch
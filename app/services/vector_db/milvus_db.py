@@ -1,5 +1,11 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+
 from langchain_milvus import Milvus
 from pymilvus import MilvusClient
+from langchain_core.documents import Document
 from app.services.vector_db.vector_base import VectorBaseService
 from app.config import Config
 from app.utils.logger import get_logger
@@ -9,12 +15,278 @@ from app.utils.embedding_factory import EmbeddingFactory
 logger = get_logger(__name__)
 
 
+class CollectionLoadRegistry:
+    """
+    记录哪些集合已经加载到Milvus的内存中，集合只在第一次使用时加载一次，不再每次检索前都调用load
+    超过空闲时间没有使用的集合由后台线程释放；加载的集合数超过上限时释放最久没有使用的集合，控制Milvus的内存占用
+    记录只在本进程内有效，其它进程释放集合后本进程的检索会报集合未加载，由调用方invalidate后重新加载
+    """
+
+    def __init__(self, get_client, idle_seconds=0, max_loaded=0):
+        """
+        get_client: 返回MilvusClient的函数
+        idle_seconds: 集合空闲多少秒后释放，小于等于0表示不释放
+        max_loaded: 最多同时加载的集合数，小于等于0表示不限制
+        """
+        self._get_client = get_client
+        self.idle_seconds = idle_seconds
+        self.max_loaded = max_loaded
+
+        # 已经加载的集合 collection_name -> 最后使用时间，按最后使用时间从旧到新排列
+        self._last_used = OrderedDict()
+        self._lock = threading.Lock()
+        # 每个集合一把锁，同一个集合只会有一个线程调用load
+        self._collection_locks = {}
+        self._reaper = None
+
+    def _touch(self, collection_name):
+        """
+        集合已经加载时更新最后使用时间并返回True，否则返回False
+        """
+        with self._lock:
+            if collection_name not in self._last_used:
+                return False
+            self._last_used[collection_name] = time.monotonic()
+            self._last_used.move_to_end(collection_name)
+            return True
+
+    def ensure_loaded(self, collection_name):
+        if self._touch(collection_name):
+            return
+
+        with self._lock:
+            collection_lock = self._collection_locks.setdefault(
+                collection_name, threading.Lock()
+            )
+        with collection_lock:
+            # 等锁的时候其它线程可能已经加载好了
+            if self._touch(collection_name):
+                return
+            start_time = time.perf_counter()
+            self._get_client().load_collection(collection_name)
+            logger.info(
+                f"已经加载集合{collection_name},耗时{(time.perf_counter() - start_time) * 1000:.0f}ms"
+            )
+            evicted = self.mark_loaded(collection_name)
+
+        for name in evicted:
+            self.release(name)
+
+    def mark_loaded(self, collection_name):
+        """
+        记录集合已经加载，返回因为超过加载上限需要释放的集合
+        """
+        with self._lock:
+            self._last_used[collection_name] = time.monotonic()
+            self._last_used.move_to_end(collection_name)
+            evicted = []
+            if self.max_loaded > 0:
+                while len(self._last_used) - len(evicted) > self.max_loaded:
+                    name = next(
+                        name for name in self._last_used if name not in evicted
+                    )
+                    evicted.append(name)
+            return evicted
+
+    def is_loaded(self, collection_name):
+        with self._lock:
+            return collection_name in self._last_used
+
+    def release(self, collection_name, idle_before=None):
+        """
+        释放集合占用的Milvus内存
+        idle_before不为空时，只有最后使用时间早于idle_before的集合才释放，避免释放刚刚被使用的集合
+        """
+        with self._lock:
+            collection_lock = self._collection_locks.setdefault(
+                collection_name, threading.Lock()
+            )
+        with collection_lock:
+            with self._lock:
+                last_used = self._last_used.get(collection_name)
+                if last_used is None:
+                    return False
+                if idle_before is not None and last_used >= idle_before:
+                    return False
+                self._last_used.pop(collection_name, None)
+            try:
+                self._get_client().release_collection(collection_name)
+                logger.info(f"已经释放集合{collection_name}")
+                return True
+            except Exception as e:
+                logger.error(f"释放集合{collection_name}失败:{e}")
+                return False
+
+    def invalidate(self, collection_name):
+        """
+        只移除集合已加载的记录，下次使用时重新load
+        其它进程（每个进程有自己的空闲释放线程）释放了集合时，本进程的记录已经过期
+        """
+        with self._lock:
+            self._last_used.pop(collection_name, None)
+
+    def forget(self, collection_name):
+        """
+        集合被删除后调用，只移除记录，不再调用release
+        """
+        with self._lock:
+            self._last_used.pop(collection_name, None)
+            self._collection_locks.pop(collection_name, None)
+
+    def release_idle(self):
+        """
+        释放所有超过空闲时间没有使用的集合
+        """
+        if self.idle_seconds <= 0:
+            return []
+        idle_before = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle_names = [
+                name for name, last_used in self._last_used.items() if last_used < idle_before
+            ]
+        return [name for name in idle_names if self.release(name, idle_before=idle_before)]
+
+    def start_reaper(self):
+        """
+        启动后台线程，定期释放空闲的集合
+        """
+        if self.idle_seconds <= 0 or self._reaper is not None:
+            return
+        interval = max(1.0, min(self.idle_seconds / 4, 60.0))
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.release_idle()
+                except Exception as e:
+                    logger.error(f"释放空闲集合出错:{e}")
+
+        self._reaper = threading.Thread(
+            target=run, name="milvus-collection-reaper", daemon=True
+        )
+        self._reaper.start()
+
+
+class FlushScheduler:
+    """
+    合并Milvus的flush操作，写入和删除后只记录集合有未flush的数据，不立即flush
+    集合第一次有未flush的数据后超过interval秒，或者未flush的行数达到max_pending_rows时，由后台线程flush一次
+    需要马上落盘的调用方可以调用flush_now
+    """
+
+    def __init__(self, get_client, interval=5.0, max_pending_rows=10000):
+        """
+        get_client: 返回MilvusClient的函数
+        interval: 合并flush的时间窗口(秒)，小于等于0表示每次写入后立即flush
+        max_pending_rows: 未flush的行数达到该值时立即flush
+        """
+        self._get_client = get_client
+        self.interval = interval
+        self.max_pending_rows = max_pending_rows
+
+        # 有未flush数据的集合 collection_name -> [未flush的行数, 第一次有未flush数据的时间]
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def mark_dirty(self, collection_name, rows=1):
+        """
+        记录集合有rows行数据写入或删除后还没有flush
+        """
+        if self.interval <= 0:
+            self.flush_now(collection_name)
+            return
+
+        with self._lock:
+            pending = self._pending.setdefault(collection_name, [0, time.monotonic()])
+            pending[0] += rows
+            reach_limit = pending[0] >= self.max_pending_rows
+            self._start_worker()
+        if reach_limit:
+            self._wakeup.set()
+
+    def flush_now(self, collection_name):
+        """
+        立即flush集合，用于需要马上读到刚写入数据的场景
+        flush失败时恢复未flush的记录，由后台线程下次重试，不会丢失
+        """
+        with self._lock:
+            pending = self._pending.pop(collection_name, None)
+        start_time = time.perf_counter()
+        try:
+            self._get_client().flush(collection_name)
+        except Exception:
+            if pending is not None:
+                with self._lock:
+                    # flush期间又有新的写入时合并行数，保留更早的第一次写入时间
+                    current = self._pending.get(collection_name)
+                    if current is None:
+                        self._pending[collection_name] = pending
+                    else:
+                        current[0] += pending[0]
+                        current[1] = min(current[1], pending[1])
+            raise
+        logger.info(
+            f"集合{collection_name}已经flush,耗时{(time.perf_counter() - start_time) * 1000:.0f}ms"
+        )
+
+    def flush_all(self):
+        """
+        flush所有有未flush数据的集合，进程退出前调用
+        """
+        with self._lock:
+            names = list(self._pending)
+        for name in names:
+            try:
+                self.flush_now(name)
+            except Exception as e:
+                logger.error(f"flush集合{name}失败:{e}")
+
+    def forget(self, collection_name):
+        """
+        集合被删除后调用，不再flush
+        """
+        with self._lock:
+            self._pending.pop(collection_name, None)
+
+    def _due_collections(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                name
+                for name, (rows, first_dirty) in self._pending.items()
+                if rows >= self.max_pending_rows or now - first_dirty >= self.interval
+            ]
+
+    def _start_worker(self):
+        # 调用方已经持有self._lock
+        if self._worker is not None:
+            return
+
+        def run():
+            while True:
+                self._wakeup.wait(timeout=max(0.5, self.interval / 2))
+                self._wakeup.clear()
+                for name in self._due_collections():
+                    try:
+                        self.flush_now(name)
+                    except Exception as e:
+                        logger.error(f"flush集合{name}失败:{e}")
+
+        self._worker = threading.Thread(target=run, name="milvus-flush", daemon=True)
+        self._worker.start()
+        atexit.register(self.flush_all)
+
+
 class MilvusVectorDB(VectorBaseService):
 
     def __init__(self):
         """
         对Milvus向量数据库进行初始化
         """
+        super().__init__()
 
         # 处理Milvus连接参数, 如果是localhost或127.0.0.1, 则使用host和port, 否则使用uri
         if Config.MILVUS_HOST in ["localhost", "127.0.0.1"]:
@@ -28,52 +300,155 @@ class MilvusVectorDB(VectorBaseService):
                 "uri": f"http://{Config.MILVUS_HOST}:{Config.MILVUS_PORT}"
             }
         self.embeddings = EmbeddingFactory.create_embeddings()
+
+        # 批量检索、查询全部内容等直接调用Milvus接口的操作共用一个客户端，第一次使用时创建
+        self._client = None
+        self._client_lock = threading.Lock()
+
+        # 已经加载到内存中的集合
+        self.load_registry = CollectionLoadRegistry(
+            lambda: self.client,
+            idle_seconds=Config.MILVUS_COLLECTION_IDLE_SECONDS,
+            max_loaded=Config.MILVUS_MAX_LOADED_COLLECTIONS,
+        )
+        self.load_registry.start_reaper()
+
+        # 合并写入和删除后的flush
+        self.flush_scheduler = FlushScheduler(
+            lambda: self.client,
+            interval=Config.MILVUS_FLUSH_INTERVAL,
+            max_pending_rows=Config.MILVUS_FLUSH_MAX_PENDING_ROWS,
+        )
+
+        # 后台预加载常用的集合，不阻塞服务创建
+        threading.Thread(
+            target=self.preload_collections, name="milvus-preload", daemon=True
+        ).start()
+
         logger.info(f"Milvus已经初始化，连接参数{self.connection_args}")
 
-    def get_or_create_collection(self, collection_name):
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = MilvusClient(**self.connection_args)
+        return self._client
+
+    def _create_collection_handle(self, collection_name):
         vector_store_db = Milvus(
             collection_name=collection_name,  # 集合的名称
             embedding_function=self.embeddings,  # 嵌入向量
             connection_args=self.connection_args,  # 连接参数
         )
-        if hasattr(vector_store_db, "_collection"):
-            try:
-                vector_store_db._collection.load()
-                logger.info(f"已经加载集合{collection_name}")
-            except Exception as e:
-                logger.info(f"集合可能不存在：{e}")
         return vector_store_db
 
-    def add_documents(self, collection_name, documents, ids=None):
+    def flush_collection(self, collection_name):
+        """
+        立即flush集合中还没有flush的写入和删除
+        """
+        self.flush_scheduler.flush_now(collection_name)
+
+    def _ensure_loaded(self, collection_name, vector_store_db):
+        if getattr(vector_store_db, "_collection", None) is None:
+            raise Exception(f"集合可能不存在：{collection_name}")
+        try:
+            self.load_registry.ensure_loaded(collection_name)
+        except Exception as e:
+            raise Exception(f"集合可能不存在：{e}")
+
+    @staticmethod
+    def _is_not_loaded_error(error):
+        """
+        判断是不是集合未加载的错误，Milvus的错误码为101
+        """
+        return getattr(error, "code", None) == 101 or "not loaded" in str(error).lower()
+
+    def _call_loaded(self, collection_name, vector_store_db, func):
+        """
+        确保集合已经加载后调用func
+        本进程记录为已加载、但集合已经被其它进程释放时，移除本进程的记录、重新加载后再重试一次
+        """
+        self._ensure_loaded(collection_name, vector_store_db)
+        try:
+            return func()
+        except Exception as e:
+            if not self._is_not_loaded_error(e):
+                raise
+            logger.warning(f"集合{collection_name}已经被释放，重新加载后重试:{e}")
+            self.load_registry.invalidate(collection_name)
+            self._ensure_loaded(collection_name, vector_store_db)
+            return func()
+
+    def preload_collections(self):
+        """
+        服务启动时调用
+        1. Milvus服务端已经加载的集合（比如应用重启前加载的）直接登记为已加载，不再重复load
+        2. 加载配置中指定的常用集合
+        """
+        try:
+            client = self.client
+            for collection_name in client.list_collections():
+                state = client.get_load_state(collection_name).get("state")
+                if str(state).endswith("Loaded"):
+                    for name in self.load_registry.mark_loaded(collection_name):
+                        self.load_registry.release(name)
+            for collection_name in Config.MILVUS_PRELOAD_COLLECTIONS:
+                if client.has_collection(collection_name):
+                    self.load_registry.ensure_loaded(collection_name)
+            logger.info("Milvus常用集合预加载完成")
+        except Exception as e:
+            logger.error(f"Milvus预加载集合失败:{e}")
+
+    def _is_handle_cacheable(self, handle):
+        # 集合不存在时langchain的Milvus对象没有_collection，第一次写入时才创建集合
+        # 这时不缓存，避免其它进程创建集合后这里一直用着没有集合的对象
+        return getattr(handle, "_collection", None) is not None
+
+    def add_documents(self, collection_name, documents, ids=None, progress_callback=None):
         logger.info(f"开始向Milvus中的{collection_name}添加{len(documents)}条记录")
+        # 所有批次用同一个集合对象，集合不存在时由第一批写入创建
         vector_store_db = self.get_or_create_collection(collection_name)
 
-        if ids:
-            results = vector_store_db.add_documents(documents=documents, ids=ids)
-        else:
-            results = vector_store_db.add_documents(documents=documents)
+        results = self._add_documents_in_batches(
+            vector_store_db, documents, ids, progress_callback=progress_callback
+        )
 
-        if hasattr(vector_store_db, "_collection"):
-            # 刷新内存中的数据到Milvus数据库
-            vector_store_db._collection.flush()
+        if getattr(vector_store_db, "_collection", None) is not None:
+            # 所有批次写入后由flush调度器合并刷新内存中的数据到Milvus数据库
+            self.flush_scheduler.mark_dirty(collection_name, len(documents))
 
         logger.info(f"向Milvus中添加了{len(documents)}条记录")
 
         return results
 
+    def insert_embedded_batch(self, collection_name, texts, embeddings, metadatas, ids):
+        results = super().insert_embedded_batch(
+            collection_name, texts, embeddings, metadatas, ids
+        )
+        # 流式入库每写入一批就交给flush调度器，前面的分块不用等整个文档写完就能被检索到
+        self.flush_scheduler.mark_dirty(collection_name, len(ids))
+        return results
+
+    def _insert_embedded_batch(self, vector_store_db, texts, embeddings, metadatas, ids):
+        return vector_store_db.add_embeddings(
+            texts=texts, embeddings=embeddings, metadatas=metadatas, ids=ids
+        )
+
     def delete_document_from_collection(self, collection_name, ids=None, filter=None):
         vector_store_db = self.get_or_create_collection(collection_name)
         if ids:
-            vector_store_db.delete(ids=ids)
+            delete = lambda: vector_store_db.delete(ids=ids)
         elif filter:
             expr = f"doc_id == '{filter["doc_id"]}'"
-            vector_store_db.delete(expr=expr)
+            delete = lambda: vector_store_db.delete(expr=expr)
         else:
             raise ValueError("ids 和 filter 都没有传，无法删除")
+        # 按条件删除需要先在已加载的集合中查询出主键
+        self._call_loaded(collection_name, vector_store_db, delete)
 
-        if hasattr(vector_store_db, "_collection"):
-            # 刷新内存中的数据到Milvus数据库
-            vector_store_db._collection.flush()
+        # 由flush调度器合并刷新内存中的数据到Milvus数据库
+        self.flush_scheduler.mark_dirty(collection_name, len(ids) if ids else 1)
 
         logger.info(f"已经从Milvus中的{collection_name}删除了{ids}")
 
@@ -83,20 +458,15 @@ class MilvusVectorDB(VectorBaseService):
         """
         vector_store_db = self.get_or_create_collection(collection_name)
 
-        # Milvus默认是懒加载，需要手动加载集合
-        if hasattr(vector_store_db, "_collection"):
-            try:
-                vector_store_db._collection.load()
-                logger.info(f"已经加载集合{collection_name}")
-            except Exception as e:
-                raise Exception(f"集合可能不存在：{e}")
-
         expr = None
         if filter:
             expr = f"doc_id == '{filter["doc_id"]}'"
 
-        results = vector_store_db.similarity_search_with_score(
-            query=document_id, expr=expr, k=k
+        # Milvus默认是懒加载，集合第一次使用时加载，之后不再重复调用load
+        results = self._call_loaded(
+            collection_name,
+            vector_store_db,
+            lambda: vector_store_db.similarity_search_with_score(query=document_id, expr=expr, k=k),
         )
         if results:
             return results
@@ -108,7 +478,7 @@ class MilvusVectorDB(VectorBaseService):
         """
         try:
             vector_store_db = self.get_or_create_collection(collection_name)
-            if hasattr(vector_store_db, "_collection"):
+            if getattr(vector_store_db, "_collection", None) is not None:
                 vector_store_db._collection.drop()
                 logger.info(f"成功删除Milvus集合: {collection_name}")
                 return True
@@ -118,6 +488,11 @@ class MilvusVectorDB(VectorBaseService):
         except Exception as e:
             logger.error(f"删除Milvus集合{collection_name}失败，错误信息={e}")
             return False
+        finally:
+            # 缓存的集合对象指向已经删除的集合，需要移除
+            self.evict_collection(collection_name)
+            self.load_registry.forget(collection_name)
+            self.flush_scheduler.forget(collection_name)
 
     def similarity_search_with_score(self, collection_name, query, k=10, filter=None):
         """
@@ -125,60 +500,237 @@ class MilvusVectorDB(VectorBaseService):
         """
         vector_store_db = self.get_or_create_collection(collection_name)
 
-        # Milvus默认是懒加载，需要手动加载集合
-        if hasattr(vector_store_db, "_collection"):
-            try:
-                vector_store_db._collection.load()
-                logger.info(f"已经加载集合{collection_name}")
-            except Exception as e:
-                raise Exception(f"集合可能不存在：{e}")
-
         expr = None
         if filter:
             expr = f"doc_id == '{filter["doc_id"]}'"
 
-        results = vector_store_db.similarity_search_with_score(
-            query=query, expr=expr, k=k
+        # Milvus默认是懒加载，集合第一次使用时加载，之后不再重复调用load
+        results = self._call_loaded(
+            collection_name,
+            vector_store_db,
+            lambda: vector_store_db.similarity_search_with_score(query=query, expr=expr, k=k),
         )
         if results:
             return results
         return None
     
-    def get_all_content_from_collection(self, collection_name):
+    def similarity_search_by_vector_with_score(
+        self, collection_name, embedding, k=10, filter=None
+    ):
         """
-        获取集合中的所有文档内容
+        用查询向量做向量检索
         """
-        try:
-            client = MilvusClient(**self.connection_args)
-            
-            if not client.has_collection(collection_name):
-                logger.error(f"集合 {collection_name} 不存在")
-                return None
-            
-            results = client.query(
+        vector_store_db = self.get_or_create_collection(collection_name)
+
+        expr = None
+        if filter:
+            expr = f"doc_id == '{filter["doc_id"]}'"
+
+        # Milvus默认是懒加载，集合第一次使用时加载，之后不再重复调用load
+        results = self._call_loaded(
+            collection_name,
+            vector_store_db,
+            lambda: vector_store_db.similarity_search_with_score_by_vector(embedding=embedding, expr=expr, k=k),
+        )
+        if results:
+            return results
+        return None
+
+    def batch_similarity_search_by_vectors(
+        self, collection_name, embeddings, k=10, filter=None
+    ):
+        """
+        一次search请求检索多个查询向量，返回每个查询向量的 [(Document, 距离)]
+        """
+        if not embeddings:
+            return []
+        vector_store_db = self.get_or_create_collection(collection_name)
+
+        # 输出字段、检索参数和结果解析都用langchain Milvus集合对象的方法，返回的元数据和单个向量检索完全一致
+        search_params = vector_store_db._as_list(vector_store_db.search_params)[0]
+
+        expr = ""
+        if filter:
+            expr = f"doc_id == '{filter["doc_id"]}'"
+
+        results = self._call_loaded(
+            collection_name,
+            vector_store_db,
+            lambda: self.client.search(
                 collection_name=collection_name,
-                filter="",
-                output_fields=["*"],
-                limit=10000
+                data=embeddings,
+                anns_field=vector_store_db._vector_field,
+                limit=k,
+                filter=expr,
+                output_fields=self._search_output_fields(vector_store_db),
+                search_params=search_params,
+            ),
+        )
+
+        return [
+            vector_store_db._parse_documents_from_search_results([hits])
+            for hits in results
+        ]
+
+    @staticmethod
+    def _search_output_fields(vector_store_db):
+        """
+        和langchain Milvus单个向量检索相同的输出字段，不同版本的langchain-milvus计算方式不同
+        """
+        if hasattr(vector_store_db, "_get_output_fields"):
+            return vector_store_db._get_output_fields()
+        if vector_store_db.enable_dynamic_field:
+            return ["*"]
+        return vector_store_db._remove_forbidden_fields(vector_store_db.fields[:])
+
+    def _query_chunks_by_filter(self, collection_name, filter, start, end, fields):
+        vector_store_db = self.get_or_create_collection(collection_name)
+
+        text_field = getattr(vector_store_db, "_text_field", "text")
+        vector_field = getattr(vector_store_db, "_vector_field", "vector")
+        primary_field = getattr(vector_store_db, "_primary_field", "pk")
+
+        conditions = [f"{key} == {value!r}" for key, value in (filter or {}).items()]
+        conditions.append(f"chunk_index >= {int(start)}")
+        if end is not None:
+            conditions.append(f"chunk_index < {int(end)}")
+
+        if fields is None:
+            # 返回全部标量字段和动态字段，不拉取向量
+            output_fields = self._output_fields(collection_name, ["documents", "metadatas"])
+        else:
+            output_fields = [text_field if field == "text" else field for field in fields]
+            output_fields = list(dict.fromkeys(output_fields + ["chunk_index"]))
+
+        results = self._call_loaded(
+            collection_name,
+            vector_store_db,
+            lambda: self.client.query(
+                collection_name=collection_name,
+                filter=" and ".join(conditions),
+                output_fields=output_fields,
+            ),
+        )
+
+        docs = []
+        for item in results:
+            item = dict(item)
+            text = item.pop(text_field, "")
+            item.pop(vector_field, None)
+            chunk_pk = item.pop(primary_field, None)
+            docs.append(
+                Document(
+                    page_content=text,
+                    metadata=self._project_metadata(item, fields),
+                    id=str(chunk_pk),
+                )
             )
-            
-            if results:
-                formatted_results = {
-                    "ids": [],
-                    "documents": [],
-                    "metadatas": [],
-                    "embeddings": []
-                }
-                for item in results:
-                    formatted_results["ids"].append(str(item.get("id", "")))
-                    formatted_results["documents"].append(item.get("text", ""))
-                    metadata = {k: v for k, v in item.items() if k not in ["id", "text", "vector"]}
-                    formatted_results["metadatas"].append(metadata)
-                    if "vector" in item:
-                        formatted_results["embeddings"].append(item["vector"])
-                
+        return docs
+
+    def _output_fields(self, collection_name, include):
+        """
+        根据需要返回的内容计算query的output_fields，不需要向量时只查询标量字段
+        """
+        include = set(include)
+        if "metadatas" not in include:
+            # 只需要分块id和文本
+            fields = ["id"]
+            if "documents" in include:
+                fields.append("text")
+            if "embeddings" in include:
+                fields.append("vector")
+            return fields
+
+        if "embeddings" in include:
+            return ["*"]
+
+        # 需要全部元数据但不需要向量：列出集合中所有非向量字段，动态字段用$meta一起返回
+        description = self.client.describe_collection(collection_name)
+        fields = [
+            field["name"]
+            for field in description.get("fields", [])
+            if "VECTOR" not in str(field.get("type", "")).upper()
+        ]
+        if description.get("enable_dynamic_field"):
+            fields.append("$meta")
+        return fields
+
+    def _format_query_results(self, items, include):
+        """
+        把query返回的实体列表转换为 {"ids", "documents", "metadatas", "embeddings"}
+        """
+        formatted_results = {
+            "ids": [],
+            "documents": [],
+            "metadatas": [],
+            "embeddings": []
+        }
+        for item in items:
+            formatted_results["ids"].append(str(item.get("id", "")))
+            if "documents" in include:
+                formatted_results["documents"].append(item.get("text", ""))
+            if "metadatas" in include:
+                metadata = {k: v for k, v in item.items() if k not in ["id", "text", "vector"]}
+                formatted_results["metadatas"].append(metadata)
+            if "vector" in item:
+                formatted_results["embeddings"].append(item["vector"])
+        return formatted_results
+
+    def get_all_content_from_collection(self, collection_name, include=None):
+        """
+        获取集合中的所有文档内容，分批扫描后合并，不再受单次query最多返回条数的限制
+        include: 需要返回的字段，可选 documents、metadatas、embeddings，ids总是返回；None表示全部返回
+        """
+        try:
+            formatted_results = {
+                "ids": [],
+                "documents": [],
+                "metadatas": [],
+                "embeddings": []
+            }
+            for batch in self.scan_collection(collection_name, include=include):
+                for key, values in batch.items():
+                    formatted_results[key].extend(values)
+            if formatted_results["ids"]:
                 return formatted_results
             return None
         except Exception as e:
             logger.error(f"获取集合 {collection_name} 的所有内容失败: {e}")
             return None
+
+    def scan_collection(self, collection_name, include=None, page_size=None):
+        """
+        用query_iterator分批扫描集合，服务端按主键游标翻页，不受query最多返回16384条的限制
+        """
+        include = list(include) if include is not None else list(self.ALL_CONTENT_FIELDS)
+        page_size = page_size or Config.VECTOR_SCAN_PAGE_SIZE
+
+        client = self.client
+        if not client.has_collection(collection_name):
+            logger.error(f"集合 {collection_name} 不存在")
+            return
+        def create_iterator():
+            self.load_registry.ensure_loaded(collection_name)
+            return client.query_iterator(
+                collection_name=collection_name,
+                batch_size=page_size,
+                filter="",
+                output_fields=self._output_fields(collection_name, include),
+            )
+
+        try:
+            iterator = create_iterator()
+        except Exception as e:
+            if not self._is_not_loaded_error(e):
+                raise
+            logger.warning(f"集合{collection_name}已经被释放，重新加载后重试:{e}")
+            self.load_registry.invalidate(collection_name)
+            iterator = create_iterator()
+        try:
+            while True:
+                items = iterator.next()
+                if not items:
+                    break
+                yield self._format_query_results(items, include)
+        finally:
+            iterator.close()
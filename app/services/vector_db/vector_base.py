@@ -1,7 +1,18 @@
+import threading
+import time
+import uuid
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 from langchain_core.documents import Document
 
+from app.config import Config
+from app.services.cache_service import normalize_text, query_embedding_cache
+from app.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
 
 class VectorBaseService(ABC):
     """
@@ -9,17 +20,136 @@ class VectorBaseService(ABC):
     向量数据库的增删
     """
 
+    def __init__(self):
+        # 集合对象缓存 collection_name -> langchain的向量库对象，同一个集合的所有请求共用一个对象
+        self._collection_handles = {}
+        self._collection_handles_lock = threading.Lock()
+
+    def get_or_create_collection(self, collection_name):
+        """
+        获取集合对象，第一次使用时创建并缓存，之后直接复用
+        """
+        handle = self._collection_handles.get(collection_name)
+        if handle is not None:
+            return handle
+        with self._collection_handles_lock:
+            handle = self._collection_handles.get(collection_name)
+            if handle is None:
+                handle = self._create_collection_handle(collection_name)
+                if self._is_handle_cacheable(handle):
+                    self._collection_handles[collection_name] = handle
+        return handle
+
+    def _is_handle_cacheable(self, handle):
+        """
+        集合对象是否可以缓存，集合还没有在数据库中创建时的对象不缓存，等集合创建后再缓存
+        """
+        return True
+
+    def evict_collection(self, collection_name):
+        """
+        删除集合后调用，把集合对象从缓存中移除，之后再使用同名集合会重新创建
+        """
+        with self._collection_handles_lock:
+            self._collection_handles.pop(collection_name, None)
+
     @abstractmethod
-    def get_or_create_collection(self):
+    def _create_collection_handle(self, collection_name):
+        """
+        创建集合对象，集合不存在时由向量数据库在第一次写入时创建
+        """
         pass
 
     @abstractmethod
-    def add_documents(self, collection_name, documents, ids):
+    def add_documents(self, collection_name, documents, ids, progress_callback=None):
         """
         添加文档到向量数据库中的集合
+        progress_callback(已写入的分块数, 总分块数) 每写入一批后调用一次
+        """
+        pass
+
+    def flush_collection(self, collection_name):
+        """
+        把集合中还没有落盘的写入和删除立即落盘，需要马上读到写入结果的调用方使用
+        默认写入后立即可见，不需要处理
+        """
+        pass
+
+    @abstractmethod
+    def _insert_embedded_batch(self, vector_store_db, texts, embeddings, metadatas, ids):
+        """
+        把已经向量化的一批分块写入集合，返回写入的id列表
         """
         pass
 
+    def _add_documents_in_batches(
+        self, vector_store_db, documents, ids=None, batch_size=None, progress_callback=None
+    ):
+        """
+        分批向量化并写入集合，第N批写入数据库的同时在后台线程中向量化第N+1批
+        内存中最多同时有两批分块的向量，不会因为文档很大一次性向量化全部分块
+        """
+        batch_size = batch_size or Config.VECTOR_INSERT_BATCH_SIZE
+        if ids:
+            ids = list(ids)
+        else:
+            ids = [str(uuid.uuid4()) for _ in documents]
+
+        batches = [
+            (documents[start : start + batch_size], ids[start : start + batch_size])
+            for start in range(0, len(documents), batch_size)
+        ]
+        if not batches:
+            return []
+
+        def embed(batch_documents):
+            return self.embeddings.embed_documents(
+                [doc.page_content for doc in batch_documents]
+            )
+
+        start_time = time.perf_counter()
+        inserted_ids = []
+        with ThreadPoolExecutor(max_workers=1) as embed_executor:
+            embed_future = embed_executor.submit(embed, batches[0][0])
+            for batch_index, (batch_documents, batch_ids) in enumerate(batches):
+                embeddings = embed_future.result()
+                # 提交下一批的向量化，和这一批的写入同时进行
+                if batch_index + 1 < len(batches):
+                    embed_future = embed_executor.submit(embed, batches[batch_index + 1][0])
+
+                inserted_ids.extend(
+                    self._insert_embedded_batch(
+                        vector_store_db,
+                        texts=[doc.page_content for doc in batch_documents],
+                        embeddings=embeddings,
+                        metadatas=[doc.metadata for doc in batch_documents],
+                        ids=batch_ids,
+                    )
+                )
+                if progress_callback:
+                    progress_callback(len(inserted_ids), len(documents))
+
+        logger.info(
+            f"分{len(batches)}批写入了{len(documents)}个分块,耗时{time.perf_counter() - start_time:.2f}s"
+        )
+        return inserted_ids
+
+    def embed_documents(self, texts):
+        """
+        把一批分块文本向量化，流式入库时由向量化阶段单独调用
+        """
+        return self.embeddings.embed_documents(texts)
+
+    def insert_embedded_batch(self, collection_name, texts, embeddings, metadatas, ids):
+        """
+        把已经向量化的一批分块写入集合，流式入库时由写入阶段调用，返回写入的id列表
+        写入后分块立即可以被检索到（需要flush的数据库由flush调度器处理）
+        """
+        vector_store_db = self.get_or_create_collection(collection_name)
+        return self._insert_embedded_batch(
+            vector_store_db, texts=texts, embeddings=embeddings, metadatas=metadatas, ids=ids
+        )
+
     @abstractmethod
     def delete_document_from_collection(self, collection_name, ids=None, filter=None):
         """
@@ -33,3 +163,176 @@ class VectorBaseService(ABC):
         删除整个集合
         """
         pass
+
+    @abstractmethod
+    def similarity_search_by_vector_with_score(
+        self, collection_name, embedding, k=10, filter=None
+    ):
+        """
+        用已经计算好的查询向量做相似度检索，返回 [(Document, 距离)]
+        """
+        pass
+
+    @abstractmethod
+    def _query_chunks_by_filter(self, collection_name, filter, start, end, fields):
+        """
+        按元数据条件查询chunk_index在[start, end)范围内的分块，不做向量检索
+        end为None表示不限制上界，返回 [Document]，顺序不保证
+        """
+        pass
+
+    # get_all_content_from_collection 可以返回的字段
+    ALL_CONTENT_FIELDS = ("documents", "metadatas", "embeddings")
+
+    @abstractmethod
+    def get_all_content_from_collection(self, collection_name, include=None):
+        """
+        获取集合中的所有分块，返回 {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        include: 需要返回的字段，可选 documents、metadatas、embeddings，ids总是返回；None表示全部返回
+        只需要文本的调用方不要请求embeddings，向量占了返回数据的大部分
+        """
+        pass
+
+    @abstractmethod
+    def scan_collection(self, collection_name, include=None, page_size=None):
+        """
+        分批扫描集合中的所有分块，每次yield一批 {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        内存中只保留一批数据，用于重建索引、导出等需要遍历整个知识库的场景
+        include: 同get_all_content_from_collection
+        page_size: 每批的分块个数，默认为Config.VECTOR_SCAN_PAGE_SIZE
+        """
+        pass
+
+    # 没有指定limit时，每次按chunk_index范围查询的分块个数
+    CHUNK_QUERY_PAGE_SIZE = 1000
+    # 第一个分块的chunk_index，TextSplitter从1开始编号
+    FIRST_CHUNK_INDEX = 1
+
+    def get_chunks_by_filter(
+        self, collection_name, filter, offset=0, limit=None, fields=None
+    ):
+        """
+        按元数据条件列出分块，例如 filter={"doc_id": 文档id} 列出一个文档的所有分块
+        同一个文档的分块chunk_index从1开始连续编号，第offset个分块（从0开始）的chunk_index为offset+1，
+        分页转换为chunk_index的范围条件在数据库端完成，每次只返回一页的分块，不会因为分块数多被截断
+        offset: 跳过前面多少个分块，从0开始
+        limit: 返回多少个分块，None表示返回全部
+        fields: 需要返回的字段，比如 ["text", "chunk_index"]，text表示分块内容，其它为元数据字段；None表示返回全部字段
+        返回按chunk_index排序的 [Document]
+        """
+        first = self.FIRST_CHUNK_INDEX + offset
+        if limit is not None:
+            docs = self._query_chunks_by_filter(
+                collection_name, filter, first, first + limit, fields
+            )
+        else:
+            docs = []
+            start = first
+            while True:
+                page = self._query_chunks_by_filter(
+                    collection_name,
+                    filter,
+                    start,
+                    start + self.CHUNK_QUERY_PAGE_SIZE,
+                    fields,
+                )
+                if not page:
+                    break
+                docs.extend(page)
+                start += self.CHUNK_QUERY_PAGE_SIZE
+
+        docs.sort(key=lambda doc: doc.metadata.get("chunk_index", 0))
+        return docs
+
+    @staticmethod
+    def _project_metadata(metadata, fields):
+        """
+        只保留需要返回的元数据字段，chunk_index用于排序始终保留
+        """
+        if fields is None:
+            return metadata
+        return {
+            key: value
+            for key, value in metadata.items()
+            if key in fields or key == "chunk_index"
+        }
+
+    def embed_query(self, text):
+        """
+        把查询问题向量化，相同嵌入模型下相同的问题直接从缓存中获取向量
+        检索服务先调用这个方法得到查询向量，再用向量去检索，向量检索、混合检索都复用同一个向量
+        """
+        text = normalize_text(text, casefold=False)
+        cache_key = (self._embedding_model_name(), text)
+        embedding = query_embedding_cache.get(cache_key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            query_embedding_cache.set(cache_key, embedding)
+        return embedding
+
+    def _embedding_model_name(self):
+        """
+        嵌入模型的标识，作为查询向量缓存key的一部分，切换模型后不会用到旧模型的向量
+        """
+        return (
+            getattr(self.embeddings, "model_name", None)
+            or getattr(self.embeddings, "model", None)
+            or self.embeddings.__class__.__name__
+        )
+
+    def batch_similarity_search_by_vectors(
+        self, collection_name, embeddings, k=10, filter=None
+    ):
+        """
+        多个查询向量的相似度检索，返回每个查询向量的 [(Document, 距离)]
+        默认逐个检索，支持一次请求检索多个向量的数据库需要重写这个方法
+        """
+        return [
+            self.similarity_search_by_vector_with_score(
+                collection_name, embedding, k=k, filter=filter
+            )
+            or []
+            for embedding in embeddings
+        ]
+
+    # embed_query 和 embed_documents 对文本的处理方式相同的嵌入模型，批量向量化时可以直接用embed_documents
+    BATCH_QUERY_EMBEDDING_CLASSES = ("HuggingFaceEmbeddings", "OpenAIEmbeddings")
+
+    def embed_queries(self, texts):
+        """
+        批量把多个查询问题向量化，缓存中没有的问题在一次前向计算中完成向量化
+        返回与texts顺序一致的向量列表，结果与逐个调用embed_query一致
+        """
+        texts = [normalize_text(text, casefold=False) for text in texts]
+        model_name = self._embedding_model_name()
+
+        embeddings = [query_embedding_cache.get((model_name, text)) for text in texts]
+
+        # 去重后的未命中缓存的问题
+        missing_texts = list(
+            dict.fromkeys(
+                text for text, embedding in zip(texts, embeddings) if embedding is None
+            )
+        )
+        if missing_texts:
+            if self._supports_batch_query_embedding():
+                missing_embeddings = self.embeddings.embed_documents(missing_texts)
+            else:
+                # 有的模型查询和文档的向量化方式不同(比如加了不同的指令前缀)，只能逐个向量化
+                missing_embeddings = [
+                    self.embeddings.embed_query(text) for text in missing_texts
+                ]
+            computed = dict(zip(missing_texts, missing_embeddings))
+            for text, embedding in computed.items():
+                query_embedding_cache.set((model_name, text), embedding)
+            embeddings = [
+                embedding if embedding is not None else computed[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
+
+        return embeddings
+
+    def _supports_batch_query_embedding(self):
+        return self.embeddings.__class__.__name__ in self.BATCH_QUERY_EMBEDDING_CLASSES and not getattr(
+            self.embeddings, "query_encode_kwargs", None
+        )
@@ -1,4 +1,6 @@
 from app.services.vector_db.factory import VectorDBFactory
+from app.services.service_registry import service_registry
 
 
-vector_db_service = VectorDBFactory.get_instance()
+# 向量数据库客户端和嵌入模型在第一次使用时才创建
+vector_db_service = service_registry.register("vector_db", VectorDBFactory.get_instance)
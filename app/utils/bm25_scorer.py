@@ -0,0 +1,212 @@
+"""
+基于稀疏矩阵的BM25打分器
+预先把每个(分块, 词)的BM25权重计算好存成CSR矩阵，查询打分只需要一次稀疏矩阵乘向量
+计算公式和参数与 rank_bm25.BM25Okapi 保持一致
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+class SparseBM25Scorer:
+
+    def __init__(self, corpus_term_freqs, k1=1.5, b=0.75, epsilon=0.25):
+        """
+        corpus_term_freqs: 每个分块的词频字典列表 [{term: 词频}]，列表下标就是矩阵的行号
+        """
+        term_ids = {}
+        rows_terms = []
+        rows_freqs = []
+        for term_freqs in corpus_term_freqs:
+            rows_terms.append(
+                np.fromiter(
+                    (term_ids.setdefault(term, len(term_ids)) for term in term_freqs),
+                    dtype=np.int32,
+                    count=len(term_freqs),
+                )
+            )
+            rows_freqs.append(np.fromiter(term_freqs.values(), dtype=np.int32, count=len(term_freqs)))
+        self._build(rows_terms, rows_freqs, None, term_ids, len(term_ids), k1, b, epsilon)
+
+    @classmethod
+    def from_arrays(
+        cls, rows_terms, rows_freqs, term_ids, doc_lengths=None, k1=1.5, b=0.75, epsilon=0.25
+    ):
+        """
+        用每个分块的 (词的列号数组, 词频数组) 构建打分器，不需要逐个遍历词频字典，构建过程全部向量化
+        term_ids: 词 -> 列号，可以和索引共用同一个字典，构建之后新增的词查询时忽略
+        doc_lengths: 每个分块的总词数，不传时用词频求和
+        """
+        scorer = cls.__new__(cls)
+        scorer._build(rows_terms, rows_freqs, doc_lengths, term_ids, len(term_ids), k1, b, epsilon)
+        return scorer
+
+    def _build(self, rows_terms, rows_freqs, doc_lengths, term_ids, n_terms, k1, b, epsilon):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        # 词 -> 矩阵列号
+        self.term_ids = term_ids
+        self.n_terms = n_terms
+        self.corpus_size = len(rows_terms)
+
+        sizes = np.fromiter((len(terms) for terms in rows_terms), dtype=np.int64, count=self.corpus_size)
+        indptr = np.zeros(self.corpus_size + 1, dtype=np.int64)
+        np.cumsum(sizes, out=indptr[1:])
+        if self.corpus_size:
+            indices = np.concatenate(rows_terms).astype(np.int32, copy=False)
+            freqs = np.concatenate(rows_freqs).astype(np.float64)
+        else:
+            indices = np.zeros(0, dtype=np.int32)
+            freqs = np.zeros(0, dtype=np.float64)
+        if doc_lengths is None:
+            # 分块长度 = 词频之和
+            doc_lengths = np.bincount(
+                np.repeat(np.arange(self.corpus_size), sizes),
+                weights=freqs,
+                minlength=self.corpus_size,
+            )
+        doc_lengths = np.asarray(doc_lengths, dtype=np.float64)
+
+        # 每个词出现在多少个分块中
+        doc_freqs = np.bincount(indices, minlength=n_terms)
+        self.idf = self._compute_idf(doc_freqs)
+
+        # 预先计算 idf * tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl))
+        # 分母中和词无关的部分按行计算后再展开，避免在所有非零元素上重复计算
+        avgdl = doc_lengths.mean() if self.corpus_size else 0.0
+        if avgdl:
+            row_norm = k1 * (1 - b + b * doc_lengths / avgdl)
+        else:
+            row_norm = np.full(self.corpus_size, k1, dtype=np.float64)
+        denominator = np.repeat(row_norm, sizes)
+        denominator += freqs
+        weights = freqs * (k1 + 1)
+        weights /= denominator
+        weights *= self.idf[indices]
+
+        self.matrix = sparse.csr_matrix(
+            (weights, indices, indptr),
+            shape=(self.corpus_size, n_terms),
+        )
+
+    def _compute_idf(self, doc_freqs):
+        """
+        idf = log(N - df + 0.5) - log(df + 0.5)，负数idf替换为 epsilon * 平均idf
+        平均idf只统计语料中出现过的词，索引中已经删除的分块留下的词不参与
+        """
+        present = doc_freqs > 0
+        if not present.any():
+            return np.zeros(len(doc_freqs), dtype=np.float64)
+        idf = np.log(self.corpus_size - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+        eps = self.epsilon * idf[present].mean()
+        idf[idf < 0] = eps
+        return idf
+
+    def _query_vector(self, query_tokens):
+        """
+        把查询分词转换为词频向量，重复出现的查询词按次数累加，语料中没有的词忽略
+        """
+        vector = np.zeros(self.n_terms, dtype=np.float64)
+        for token in query_tokens:
+            col = self.term_ids.get(token)
+            if col is not None and col < self.n_terms:
+                vector[col] += 1.0
+        return vector
+
+    def get_scores(self, query_tokens):
+        """
+        计算查询与所有分块的BM25分数，返回长度为分块数的数组
+        """
+        if self.corpus_size == 0:
+            return np.zeros(0, dtype=np.float64)
+        return self.matrix @ self._query_vector(query_tokens)
+
+    def get_batch_scores(self, queries_tokens):
+        """
+        一次稀疏矩阵乘法计算多个查询的BM25分数
+        返回 (分块数 x 查询数) 的CSC稀疏矩阵，每一列是一个查询的分数，没有命中的分块不占空间
+        """
+        rows = []
+        cols = []
+        data = []
+        for col, query_tokens in enumerate(queries_tokens):
+            for token in query_tokens:
+                term_id = self.term_ids.get(token)
+                if term_id is not None and term_id < self.n_terms:
+                    rows.append(term_id)
+                    cols.append(col)
+                    data.append(1.0)
+        # 重复的(词, 查询)在转换时会累加，和单个查询时重复词按次数累加一致
+        query_matrix = sparse.csc_matrix(
+            (data, (rows, cols)),
+            shape=(self.n_terms, len(queries_tokens)),
+            dtype=np.float64,
+        )
+        return (self.matrix @ query_matrix).tocsc()
+
+    @staticmethod
+    def _select_top(rows, scores, k):
+        """
+        从候选分块中选出分数最高的k个，分数相同时行号小的排在前面，保证结果稳定
+        rows需要是升序的
+        """
+        if k < len(scores):
+            kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+            greater = scores > kth_score
+            # 分数等于第k名分数的分块，按行号顺序补足k个
+            equal_positions = np.flatnonzero(scores == kth_score)
+            keep = np.flatnonzero(greater)
+            keep = np.concatenate([keep, equal_positions[: k - len(keep)]])
+            rows = rows[keep]
+            scores = scores[keep]
+
+        order = np.lexsort((rows, -scores))
+        return rows[order], scores[order]
+
+    def top_k(self, query_tokens, k):
+        """
+        获取分数最高的k个分块，用partition避免对全部分数排序
+        返回 (行号数组, 分数数组, 最高分)，只包含分数不为0的分块，按分数从高到低排列
+        """
+        scores = self.get_scores(query_tokens)
+        if len(scores) == 0 or k <= 0:
+            return np.zeros(0, dtype=np.int64), scores[:0], 0.0
+
+        max_score = float(scores.max())
+        rows = np.flatnonzero(scores)
+        top_rows, top_scores = self._select_top(rows, scores[rows], k)
+        return top_rows, top_scores, max_score
+
+    def top_k_batch(self, queries_tokens, k):
+        """
+        批量获取多个查询分数最高的k个分块，结果与逐个调用top_k一致
+        返回 [(行号数组, 分数数组, 最高分)]
+        """
+        if self.corpus_size == 0 or k <= 0 or not queries_tokens:
+            empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64), 0.0)
+            return [empty for _ in queries_tokens]
+
+        score_matrix = self.get_batch_scores(queries_tokens)
+        score_matrix.sort_indices()
+
+        results = []
+        for col in range(score_matrix.shape[1]):
+            start, end = score_matrix.indptr[col], score_matrix.indptr[col + 1]
+            rows = score_matrix.indices[start:end].astype(np.int64)
+            scores = score_matrix.data[start:end]
+
+            # 去掉乘法结果中值为0的元素，和单个查询时只保留不为0的分数一致
+            nonzero = scores != 0
+            rows = rows[nonzero]
+            scores = scores[nonzero]
+
+            # 没有命中的分块分数为0，也参与最高分的计算
+            max_score = float(scores.max()) if len(scores) else 0.0
+            if len(rows) < self.corpus_size:
+                max_score = max(max_score, 0.0)
+
+            top_rows, top_scores = self._select_top(rows, scores, k)
+            results.append((top_rows, top_scores, max_score))
+        return results
@@ -0,0 +1,153 @@
+"""
+线程安全的 LRU + TTL 缓存
+超过容量时淘汰最久未使用的条目，超过存活时间的条目在读取时失效
+记录命中/未命中次数，便于监控缓存效果
+SharedVersions 是多个进程共享的版本号，用来让其它进程的缓存失效
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.utils.file_lock import file_lock
+
+
+class LRUTTLCache:
+
+    def __init__(self, name, maxsize=1024, ttl=300):
+        """
+        name: 缓存名称，用于监控展示
+        maxsize: 最多缓存的条目数
+        ttl: 每个条目的存活时间(秒)，小于等于0表示不过期
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        # key -> (过期时间, value)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expire_at, value = item
+                if expire_at is None or expire_at > time.monotonic():
+                    # 命中后移动到末尾，表示最近使用过
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                # 已经过期，删除
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expire_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            # 超出容量，淘汰最久未使用的条目
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, predicate):
+        """
+        删除所有 predicate(key) 为True的条目，返回删除的条目数
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class SharedVersions:
+    """
+    多个进程共享的版本号，每个key的版本号保存在目录下的一个文件中
+    web服务的多个进程、文档处理worker进程各自有一份进程内缓存，缓存key中带上版本号，
+    任意一个进程加1之后，其它进程读到新的版本号，旧版本号下的缓存不会再被读到，等LRU淘汰或过期
+    读取时按文件的修改时间和大小判断是否需要重新读取；加1在文件锁内完成，写临时文件后替换，读取时不会读到写了一半的文件
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # key -> (文件签名, 版本号)
+        self._cached = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        name = hashlib.md5(str(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.version")
+
+    @staticmethod
+    def _read(path):
+        """
+        返回 (文件签名, 版本号)，文件不存在时版本号为0
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                stat = os.fstat(f.fileno())
+                content = f.read().strip()
+        except FileNotFoundError:
+            return None, 0
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size), int(content or 0)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        with self._lock:
+            cached = self._cached.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        signature, version = self._read(path)
+        with self._lock:
+            self._cached[key] = (signature, version)
+        return version
+
+    def bump(self, key):
+        """
+        版本号加1，返回新的版本号
+        """
+        path = self._path(key)
+        os.makedirs(self.directory, exist_ok=True)
+        with file_lock(path):
+            _, version = self._read(path)
+            version += 1
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(str(version))
+            os.replace(temp_path, path)
+            signature, _ = self._read(path)
+        with self._lock:
+            self._cached[key] = (signature, version)
+        return version
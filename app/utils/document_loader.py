@@ -1,4 +1,11 @@
+import io
 import os
+import codecs
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # 核心，导入langchain
 from langchain_community.document_loaders import (
@@ -11,14 +18,174 @@ from langchain_community.document_loaders import (
 # 导入创建具有名称临时文件的工具，结合with可自动清理
 from tempfile import NamedTemporaryFile
 
+from langchain_core.documents import Document
+
+from app.config import Config
+
 # 导入日志工具
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 
+# 并行解析pdf的进程池，第一次使用时创建，所有文档共用
+_pdf_process_pool = None
+_pdf_process_pool_lock = threading.Lock()
+
+
+def _get_pdf_process_pool():
+    global _pdf_process_pool
+    with _pdf_process_pool_lock:
+        if _pdf_process_pool is None:
+            # web进程和worker进程里有很多线程，用spawn创建子进程，避免fork后子进程中的锁处于错误状态
+            _pdf_process_pool = ProcessPoolExecutor(
+                max_workers=Config.PDF_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"pdf并行解析进程池已创建,进程数={Config.PDF_PARSE_WORKERS}")
+        return _pdf_process_pool
+
+
+def _reset_pdf_process_pool():
+    """
+    子进程异常退出后进程池不能再使用，丢弃它，下次使用时重新创建
+    """
+    global _pdf_process_pool
+    with _pdf_process_pool_lock:
+        if _pdf_process_pool is not None:
+            _pdf_process_pool.shutdown(wait=False, cancel_futures=True)
+            _pdf_process_pool = None
+
+
+def _pdf_document_metadata(doc, file_path):
+    """
+    和PyMuPDFLoader相同规则的文档级元数据：键名转小写、去掉首尾空白，创建/修改时间转换为ISO格式
+    """
+    metadata = {
+        "producer": "PyMuPDF",
+        "creator": "PyMuPDF",
+        "creationdate": "",
+        "source": file_path,
+        "file_path": file_path,
+        "total_pages": doc.page_count,
+    }
+    raw_metadata = doc.metadata or {}
+    for key, value in raw_metadata.items():
+        if not isinstance(value, (str, int)):
+            continue
+        key = key.lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                value = datetime.strptime(
+                    value.replace("'", ""), "D:%Y%m%d%H%M%S%z"
+                ).isoformat("T")
+            except ValueError:
+                pass
+        elif isinstance(value, str):
+            value = value.strip()
+        metadata[key] = value
+    for key in ("modDate", "creationDate"):
+        if key in raw_metadata:
+            metadata[key] = raw_metadata[key]
+    return metadata
+
+
+def _parse_pdf_page_range(file_path, start, end):
+    """
+    在子进程中运行：打开pdf文件，提取[start, end)页的文本
+    返回 [(页码, 文本, 元数据)]，元数据和PyMuPDFLoader逐页加载的一致
+    """
+    import pymupdf
+
+    with pymupdf.open(file_path) as doc:
+        doc_metadata = _pdf_document_metadata(doc, file_path)
+
+        pages = []
+        for page_number in range(start, end):
+            text = doc[page_number].get_text().strip()
+            pages.append((page_number, text, doc_metadata | {"page": page_number}))
+        return pages
+
+
+def pdf_page_count(file_path):
+    import pymupdf
+
+    with pymupdf.open(file_path) as doc:
+        return doc.page_count
+
+
+def should_parse_pdf_in_parallel(page_count):
+    """
+    开启了并行解析(PDF_PARSE_WORKERS>1)且页数达到PDF_PARALLEL_MIN_PAGES时并行解析
+    """
+    return Config.PDF_PARSE_WORKERS > 1 and page_count >= Config.PDF_PARALLEL_MIN_PAGES
+
+
+def iter_pdf_pages_parallel(file_path, page_count=None):
+    """
+    把页码范围切分成若干段，交给进程池中的多个进程同时解析，按页码顺序逐页产出Document
+    同时提交的段数不超过进程数的2倍，前面的段解析完就可以产出，不用等整个文件解析完
+    """
+    if page_count is None:
+        page_count = pdf_page_count(file_path)
+    pages_per_task = max(1, Config.PDF_PARSE_PAGES_PER_TASK)
+    ranges = [
+        (start, min(page_count, start + pages_per_task))
+        for start in range(0, page_count, pages_per_task)
+    ]
+    logger.info(
+        f"并行解析pdf,页数={page_count},分为{len(ranges)}段,进程数={Config.PDF_PARSE_WORKERS}"
+    )
+
+    pool = _get_pdf_process_pool()
+    max_in_flight = Config.PDF_PARSE_WORKERS * 2
+    futures = []
+    next_range = 0
+    try:
+        while next_range < len(ranges) or futures:
+            while next_range < len(ranges) and len(futures) < max_in_flight:
+                start, end = ranges[next_range]
+                futures.append(pool.submit(_parse_pdf_page_range, file_path, start, end))
+                next_range += 1
+            # 按提交顺序取结果，保证页码顺序
+            for _, text, metadata in futures.pop(0).result():
+                yield Document(page_content=text, metadata=metadata)
+    except BrokenProcessPool:
+        _reset_pdf_process_pool()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _iter_pdf_pages(doc, source):
+    """
+    逐页提取已经打开的pdf的文本，结束后关闭文档
+    """
+    try:
+        doc_metadata = _pdf_document_metadata(doc, source)
+        for page in doc:
+            yield Document(
+                page_content=page.get_text().strip(),
+                metadata=doc_metadata | {"page": page.number},
+            )
+    finally:
+        doc.close()
+
+
 class DocumentLoader:
 
+    # 文档类型 -> (临时文件后缀, langchain加载器)，内存中解析失败时写入临时文件后用langchain加载器解析
+    LAZY_LOADERS = {
+        "pdf": (".pdf", PyMuPDFLoader),
+        "docx": (".docx", Docx2txtLoader),
+        "txt": (".txt", TextLoader),
+        "md": (".md", TextLoader),
+    }
+
+    # 文本文件依次尝试的编码
+    TEXT_ENCODINGS = ("utf-8-sig", "gb18030")
+
     @staticmethod
     def loader(file_data, file_type):
         """
@@ -35,91 +202,105 @@ class DocumentLoader:
             raise ValueError(f"不能加载的文档的类型{file_type}")
 
     @staticmethod
-    def load_pdf(file_data):
-        try:
-            # delete=False表示 创建不自动删除的临时文件，delete=True
-            with NamedTemporaryFile(delete=False, suffix=".pdf") as tempfile:
-                # 把file_data二进制文件写入到临时文件中
-                tempfile.write(file_data)
-                temp_path = tempfile.name
+    def lazy_loader(file_data, file_type):
+        """
+        逐页加载文档的生成器，pdf每解析完一页就产出一页，不需要等整个文件解析完
+        docx、txt、md本身只有一个文档对象，产出一次
+        file_data 可以是 bytes 或 memoryview，直接在内存中解析，不写临时文件；
+        内存中打开失败时才写入临时文件，用langchain的加载器解析
+        """
+        if file_type not in DocumentLoader.LAZY_LOADERS:
+            raise ValueError(f"不能加载的文档的类型{file_type}")
 
-            """
-            这里要在with NamedTemporaryFile的外面访问临时文件，如果delete=True，则表示离开
-            后，就自动删除了临时文件，后面的语句块没法访问到临时文件了
-            """
+        try:
+            documents = DocumentLoader.open_in_memory(file_data, file_type)
+        except Exception as e:
+            logger.warning(f"在内存中打开{file_type}文档失败,改为写入临时文件后加载:{e}")
+            documents = None
 
+        if documents is not None:
             try:
-                pyMuPDFLoader = PyMuPDFLoader(temp_path)
-                documents = pyMuPDFLoader.load()
-                return documents
+                yield from documents
             except Exception as e:
-                logger.error(f"通过PyMuPDFLoader工具load:{temp_path} 失败")
-                raise ValueError(f"通过PyMuPDFLoader工具load {temp_path} 失败")
-            finally:
-                # 手动删除临时文件
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
+                logger.error(f"在内存中加载{file_type}文档失败:{e}")
+                raise ValueError(f"加载{file_type}文档出错{str(e)}")
+            return
 
-        except Exception as e:
-            logger.info(f"加载pdf文档出错{str(e)}")
-            raise ValueError(f"加载pdf文档出错{str(e)}")
+        yield from DocumentLoader.lazy_load_with_temp_file(file_data, file_type)
 
     @staticmethod
-    def load_docx(file_data):
-        try:
-            # delete=False表示 创建不自动删除的临时文件，delete=True
-            with NamedTemporaryFile(delete=False, suffix=".docx") as tempfile:
-                # 把file_data二进制文件写入到临时文件中
-                tempfile.write(file_data)
-                temp_path = tempfile.name
+    def open_in_memory(file_data, file_type):
+        """
+        在内存中打开文档，返回Document的迭代器；打开失败时抛出异常，由调用方改用临时文件
+        pdf页数达到并行解析的条件时返回None，并行解析需要各个进程都能读取的临时文件
+        """
+        if file_type == "pdf":
+            import pymupdf
 
-            """
-            这里要在with NamedTemporaryFile的外面访问临时文件，如果delete=True，则表示离开
-            后，就自动删除了临时文件，后面的语句块没法访问到临时文件了
-            """
+            doc = pymupdf.open(stream=file_data, filetype="pdf")
+            if should_parse_pdf_in_parallel(doc.page_count):
+                doc.close()
+                return None
+            return _iter_pdf_pages(doc, "")
+        elif file_type == "docx":
+            import docx2txt
 
-            try:
-                docx2txtLoader = Docx2txtLoader(temp_path)
-                documents = docx2txtLoader.load()
-                return documents
-            except Exception as e:
-                logger.error(f"通过Docx2txtLoader工具load{temp_path}失败")
-                raise ValueError(f"通过Docx2txtLoader工具load{temp_path}失败")
-            finally:
-                # 手动删除临时文件
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
+            # docx是zip文件，zipfile可以直接读取内存中的文件对象
+            text = docx2txt.process(io.BytesIO(file_data))
+            return [Document(page_content=text, metadata={"source": ""})]
+        else:
+            return [
+                Document(
+                    page_content=DocumentLoader.decode_text(file_data),
+                    metadata={"source": ""},
+                )
+            ]
 
-        except Exception as e:
-            logger.info(f"加载docx文档出错{str(e)}")
-            raise ValueError(f"加载docx文档出错{str(e)}")
+    @staticmethod
+    def decode_text(file_data):
+        for encoding in DocumentLoader.TEXT_ENCODINGS:
+            try:
+                return codecs.decode(file_data, encoding)
+            except UnicodeDecodeError:
+                continue
+        raise ValueError(f"无法识别文本文件的编码,支持的编码为{DocumentLoader.TEXT_ENCODINGS}")
 
     @staticmethod
-    def load_txt(file_data):
+    def lazy_load_with_temp_file(file_data, file_type):
+        """
+        把文件内容写入临时文件，再用langchain的加载器逐页加载，加载结束后删除临时文件
+        """
+        suffix, loader_class = DocumentLoader.LAZY_LOADERS[file_type]
+
+        # delete=False表示 创建不自动删除的临时文件，离开with后还要用加载器读取它
+        with NamedTemporaryFile(delete=False, suffix=suffix) as tempfile:
+            tempfile.write(file_data)
+            temp_path = tempfile.name
+
         try:
-            # delete=False表示 创建不自动删除的临时文件，delete=True
-            with NamedTemporaryFile(delete=False, suffix=".docx") as tempfile:
-                # 把file_data二进制文件写入到临时文件中
-                tempfile.write(file_data)
-                temp_path = tempfile.name
+            if file_type == "pdf":
+                page_count = pdf_page_count(temp_path)
+                if should_parse_pdf_in_parallel(page_count):
+                    # 页数多的pdf用进程池按页并行解析
+                    yield from iter_pdf_pages_parallel(temp_path, page_count)
+                    return
+            yield from loader_class(temp_path).lazy_load()
+        except Exception as e:
+            logger.error(f"通过{loader_class.__name__}工具逐页加载{temp_path}失败:{e}")
+            raise ValueError(f"加载{file_type}文档出错{str(e)}")
+        finally:
+            # 生成器结束或者被关闭时删除临时文件
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
 
-            """
-            这里要在with NamedTemporaryFile的外面访问临时文件，如果delete=True，则表示离开
-            后，就自动删除了临时文件，后面的语句块没法访问到临时文件了
-            """
+    @staticmethod
+    def load_pdf(file_data):
+        return list(DocumentLoader.lazy_loader(file_data, "pdf"))
 
-            try:
-                textLoader = TextLoader(temp_path)
-                documents = textLoader.load()
-                return documents
-            except Exception as e:
-                logger.error(f"通过TextLoader工具load{temp_path}失败")
-                raise ValueError(f"通过TextLoader工具load{temp_path}失败")
-            finally:
-                # 手动删除临时文件
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
+    @staticmethod
+    def load_docx(file_data):
+        return list(DocumentLoader.lazy_loader(file_data, "docx"))
 
-        except Exception as e:
-            logger.info(f"加载txt文档出错{str(e)}")
-            raise ValueError(f"加载txt文档出错{str(e)}")
+    @staticmethod
+    def load_txt(file_data):
+        return list(DocumentLoader.lazy_loader(file_data, "txt"))
@@ -1,10 +1,6 @@
 from app.services.settings_service import settings_service
 from app.utils.logger import get_logger
 
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.embeddings import OllamaEmbeddings
-
 
 logger = get_logger(__name__)
 
@@ -24,7 +20,10 @@ class EmbeddingFactory:
             f"开始创建嵌入向量embeddings,embedding_provider={embedding_provider},embedding_model_name={embedding_model_name},"
         )
 
+        # 嵌入模型的依赖比较重，只在创建对应的嵌入模型时导入
         if embedding_provider == "huggingface":
+            from langchain_huggingface import HuggingFaceEmbeddings
+
             embeddings = HuggingFaceEmbeddings(
                 model_name=embedding_model_name,
                 model_kwargs={"device": "cpu"},
@@ -33,18 +32,24 @@ class EmbeddingFactory:
             )
         elif embedding_provider == "openai":
             # 不需要baseUrl,但需要apikey
+            from langchain_openai import OpenAIEmbeddings
+
             embeddings = OpenAIEmbeddings(
                 model_name=embedding_model_name, openai_api_key=embedding_api_key
             )
             logger.info("创建HuggingFaceEmbeddings的嵌入向量成功")
 
         elif embedding_provider == "ollma":
+            from langchain_community.embeddings import OllamaEmbeddings
+
             embeddings = OllamaEmbeddings(
                 model_name=embedding_model_name, base_url=embedding_base_url
             )
             logger.info("创建OpenAIEmbeddings的嵌入向量成功")
         else:
             # 没有，默认走本地模型
+            from langchain_huggingface import HuggingFaceEmbeddings
+
             embeddings = HuggingFaceEmbeddings(
                 model_name=embedding_model_name,
                 model_kwargs={"device": "cpu"},
@@ -0,0 +1,37 @@
+"""
+跨进程的文件锁
+web服务的多个进程和文档处理worker进程会读写同一份磁盘上的索引，读-改-写的过程用文件锁串行化
+POSIX系统用fcntl.flock，Windows用msvcrt.locking；同一个进程内的不同线程各自打开锁文件，也会互相等待
+"""
+
+import contextlib
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    对 path + ".lock" 加排他锁，with块结束后释放，其它进程对同一个path加锁时阻塞等待
+    """
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
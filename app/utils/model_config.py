@@ -8,7 +8,6 @@ from pathlib import Path
 定义可用的 Embedding 模型和 LLM 模型列表
 """
 root_dir = os.getcwd()
-print("root_dir",type(root_dir))
 
 # 使用os.path.join构建路径
 local_embeddings_path = os.path.join(root_dir, "embeddingModels", "all-MiniLM-L6-v2")
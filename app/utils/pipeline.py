@@ -0,0 +1,126 @@
+"""
+用有界队列连接的流水线
+每个阶段在自己的线程中运行，从上一个阶段的队列取数据、处理后放入下一个阶段的队列
+队列满时上游阻塞等待，内存中同时存在的数据量由队列长度决定，和输入的总量无关
+任何一个阶段出错，其它阶段尽快停止，错误在调用方线程中重新抛出
+"""
+
+import queue
+import threading
+
+from app.utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# 队列结束标记
+_END = object()
+
+
+class PipelineCancelled(Exception):
+    """
+    其它阶段出错后，用于中断当前阶段的内部异常
+    """
+
+
+class StreamingPipeline:
+
+    def __init__(self, name, queue_size=4):
+        """
+        name: 流水线名称，用于日志和线程名
+        queue_size: 每两个阶段之间的队列最多缓存的数据个数
+        """
+        self.name = name
+        self.queue_size = queue_size
+        # [(阶段名称, 处理函数)]
+        self._stages = []
+        self._error = None
+        self._cancelled = threading.Event()
+
+    def add_stage(self, name, func):
+        """
+        添加一个阶段，func(上游数据的迭代器) 返回一个迭代器，产出的每个数据交给下一个阶段
+        第一个阶段的参数是 iter(())，一般忽略参数，自己产生数据
+        """
+        self._stages.append((name, func))
+        return self
+
+    def _fail(self, stage_name, error):
+        if self._error is None and not isinstance(error, PipelineCancelled):
+            self._error = error
+            logger.error(f"流水线{self.name}的阶段{stage_name}出错:{error}")
+        self._cancelled.set()
+
+    def _get_iter(self, source):
+        """
+        把上游队列包装成迭代器，遇到结束标记时结束
+        """
+        while True:
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                if self._cancelled.is_set():
+                    raise PipelineCancelled()
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def _put(self, target, item):
+        while True:
+            if self._cancelled.is_set():
+                raise PipelineCancelled()
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _run_stage(self, stage_name, func, source, target):
+        try:
+            items = self._get_iter(source) if source is not None else iter(())
+            for item in func(items):
+                self._put(target, item)
+            self._put(target, _END)
+        except BaseException as e:
+            self._fail(stage_name, e)
+
+    def run(self):
+        """
+        启动所有阶段并等待结束，最后一个阶段在调用方线程中运行，返回它产出的所有数据的个数
+        """
+        if not self._stages:
+            return 0
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self._stages[:-1]]
+        threads = []
+        for idx, (stage_name, func) in enumerate(self._stages[:-1]):
+            source = queues[idx - 1] if idx > 0 else None
+            thread = threading.Thread(
+                target=self._run_stage,
+                args=(stage_name, func, source, queues[idx]),
+                name=f"{self.name}-{stage_name}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+        stage_name, func = self._stages[-1]
+        count = 0
+        try:
+            source = queues[-1] if queues else None
+            items = self._get_iter(source) if source is not None else iter(())
+            for _ in func(items):
+                count += 1
+        except BaseException as e:
+            self._fail(stage_name, e)
+        finally:
+            if self._error is not None:
+                self._cancelled.set()
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+        return count
@@ -1,6 +1,8 @@
 import os
+import time
+from app.config import Config
 from app.utils.logger import get_logger
-from sentence_transformers import CrossEncoder
+from app.services.cache_service import rerank_score_cache
 
 
 root_dir = os.getcwd()
@@ -15,57 +17,295 @@ logger = get_logger(__name__)
 
 
 class BaseReranker:
-    def rerank(self, query, documents, top_k):
+    # 重排序后端名称，用于区分不同后端的分数缓存
+    backend = "base"
+
+    def predict(self, pairs):
+        """
+        用模型计算 [[问题, 文档内容]] 每一对的相关性原始分数
+        """
         raise NotImplementedError
 
+    def score(self, query, documents):
+        """
+        计算查询和每个文档的相关性原始分数
+        返回 (分数列表, 实际交给模型计算的文档对数)
+        """
+        # 先从缓存中获取已经计算过的(问题, 分块)分数
+        cache_keys = [
+            rerank_score_cache.make_key(query, doc, self.backend) for doc in documents
+        ]
+        scores_float = [rerank_score_cache.get(key) for key in cache_keys]
 
-class LocalReranker(BaseReranker):
-    def __init__(self):
-        self.reranker = CrossEncoder(RERANK_MODEL_NAME)
-
-    def rerank(self, query, documents, top_k):
-        if not documents:
-            return []
-        top_k = top_k or len(documents)
-        try:
-            # 构建输入对，每个文档和查询组成一组
-            pairs = [[query, doc.page_content] for doc in documents]
+        # 只把没有缓存分数的文档和查询组成输入对
+        missing_indices = [idx for idx, score in enumerate(scores_float) if score is None]
+        if missing_indices:
+            pairs = [[query, documents[idx].page_content] for idx in missing_indices]
             # 用cross-encoder这个模型计算每个对的相关性分数
-            scores = self.reranker.predict(pairs)
+            scores = self.predict(pairs)
             # 把分数转成列表
             scores = list(scores)
 
             logger.info(f"对{len(pairs)}个文档对进行重排序，分数为：{scores}")
 
+            for idx, score in zip(missing_indices, scores):
+                scores_float[idx] = float(score)
+                rerank_score_cache.set(cache_keys[idx], float(score))
 
-            scores_float = [float(score) for score in scores]
-            # 计算分数是最小值
-            min_score = min(scores_float) if scores_float else 0.0
-            # 计算分数中的最大值
-            max_score = max(scores_float) if scores_float else 1.0
-            # 对分数进行归一化
-            normalized_scores = [
-                (
-                    (score - min_score) / (max_score - min_score)
-                    if max_score > min_score
-                    else 0.0
-                )
-                for score in scores_float
-            ]
-            doc_scores = [
-                (doc, max(0.0, min(1.0, score)))
-                for doc, score in zip(documents, normalized_scores)
-            ]
+        logger.info(
+            f"重排序{len(documents)}个文档，命中缓存{len(documents) - len(missing_indices)}个"
+        )
+        return scores_float, len(missing_indices)
+
+    def rerank(self, query, documents, top_k):
+        if not documents:
+            return []
+        top_k = top_k or len(documents)
+        try:
+            scores_float, _ = self.score(query, documents)
+            doc_scores = self._normalize(documents, scores_float)
             doc_scores.sort(key=lambda x: x[1], reverse=True)
-            logger.info(f"CrossEncoder重排序：已经重排序了{len(doc_scores)}个文档")
+            logger.info(f"{self.__class__.__name__}重排序：已经重排序了{len(doc_scores)}个文档")
             return doc_scores[:top_k]
         except Exception as e:
-            logger.error(f"CrossEncoder重排序出错:{str(e)}")
+            logger.error(f"{self.__class__.__name__}重排序出错:{str(e)}")
             return [(doc, 0.5) for doc in documents[:top_k]]
 
+    # 每个文档对模型耗时的估计值(毫秒)，按时间预算重排序时用来决定每批的文档个数
+    pair_ms_estimate = None
+
+    def _update_pair_ms(self, batch_ms, batch_pairs):
+        """
+        用最近一批的实际耗时更新每个文档对耗时的估计值（指数移动平均）
+        """
+        if batch_pairs <= 0:
+            return
+        pair_ms = batch_ms / batch_pairs
+        if self.pair_ms_estimate is None:
+            self.pair_ms_estimate = pair_ms
+        else:
+            self.pair_ms_estimate = 0.7 * self.pair_ms_estimate + 0.3 * pair_ms
+
+    def rerank_with_budget(self, query, documents, top_k, budget_ms, batch_size):
+        """
+        有时间预算的重排序
+        按第一阶段检索的顺序分批交给模型打分，每批的文档个数按剩余预算和每个文档对的耗时估计值计算，
+        剩余预算不够给一个文档对打分时停止；还没有耗时估计值时第一批只打分一个文档对，用来测量耗时
+        耗时估计值来自之前的实际耗时，单批的实际耗时可能比估计值长，预算是一个软限制
+        打过分的文档按重排序分数排在前面，没来得及打分的文档保持第一阶段的顺序排在后面
+        返回 ([(Document, 重排序分数或None)], {"rerank_ms": 耗时, "rerank_pairs": 模型计算的文档对数})
+        """
+        start_time = time.perf_counter()
+        top_k = top_k or len(documents)
+
+        scored_docs = []
+        scores_float = []
+        pairs_scored = 0
+        try:
+            start = 0
+            while start < len(documents):
+                remaining_ms = budget_ms - (time.perf_counter() - start_time) * 1000
+                if self.pair_ms_estimate is None:
+                    size = 1
+                else:
+                    size = min(batch_size, int(remaining_ms / self.pair_ms_estimate))
+                if size < 1:
+                    break
+                batch = documents[start : start + size]
+                batch_start = time.perf_counter()
+                batch_scores, batch_pairs = self.score(query, batch)
+                self._update_pair_ms((time.perf_counter() - batch_start) * 1000, batch_pairs)
+                scored_docs.extend(batch)
+                scores_float.extend(batch_scores)
+                pairs_scored += batch_pairs
+                start += len(batch)
+        except Exception as e:
+            logger.error(f"{self.__class__.__name__}按时间预算重排序出错:{str(e)}")
+
+        doc_scores = self._normalize(scored_docs, scores_float)
+        doc_scores.sort(key=lambda x: x[1], reverse=True)
+
+        # 没来得及打分的文档保持第一阶段的顺序
+        doc_scores.extend((doc, None) for doc in documents[len(scored_docs) :])
+
+        stats = {
+            "rerank_ms": (time.perf_counter() - start_time) * 1000,
+            "rerank_pairs": pairs_scored,
+        }
+        logger.info(
+            f"按时间预算{budget_ms}ms重排序：候选{len(documents)}个，打分{len(scored_docs)}个，"
+            f"模型计算{pairs_scored}对，耗时{stats['rerank_ms']:.1f}ms"
+        )
+        return doc_scores[:top_k], stats
+
+    @staticmethod
+    def _normalize(documents, scores_float):
+        """
+        把原始分数min-max归一化到[0,1]，返回 [(Document, 归一化分数)]
+        """
+        # 计算分数是最小值
+        min_score = min(scores_float) if scores_float else 0.0
+        # 计算分数中的最大值
+        max_score = max(scores_float) if scores_float else 1.0
+        # 对分数进行归一化
+        normalized_scores = [
+            (
+                (score - min_score) / (max_score - min_score)
+                if max_score > min_score
+                else 0.0
+            )
+            for score in scores_float
+        ]
+        return [
+            (doc, max(0.0, min(1.0, score)))
+            for doc, score in zip(documents, normalized_scores)
+        ]
+
+
+class LocalReranker(BaseReranker):
+    backend = "local"
+
+    def __init__(self):
+        # sentence_transformers会加载torch，只在创建重排序模型时导入
+        from sentence_transformers import CrossEncoder
+
+        self.reranker = CrossEncoder(RERANK_MODEL_NAME)
+
+    def predict(self, pairs):
+        return self.reranker.predict(pairs)
+
+
+class OnnxReranker(BaseReranker):
+    """
+    用ONNX Runtime运行int8动态量化后的ms-marco-MiniLM-L6-v2交叉编码器
+    第一次使用时把本地模型导出为ONNX并做动态量化，保存在模型目录的onnx子目录下，之后直接加载
+    """
+
+    backend = "onnx"
+
+    def __init__(
+        self,
+        model_path=RERANK_MODEL_NAME,
+        num_threads=None,
+        batch_size=None,
+        max_length=None,
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_path = model_path
+        self.batch_size = batch_size or Config.RERANK_ONNX_BATCH_SIZE
+        self.max_length = max_length or Config.RERANK_ONNX_MAX_LENGTH
+        num_threads = Config.RERANK_ONNX_THREADS if num_threads is None else num_threads
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if num_threads > 0:
+            session_options.intra_op_num_threads = num_threads
+        session_options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            self._get_quantized_model(),
+            sess_options=session_options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        logger.info(
+            f"ONNX重排序模型加载成功,线程数={num_threads or 'auto'},批大小={self.batch_size}"
+        )
+
+    def _get_quantized_model(self):
+        """
+        返回int8量化后的ONNX模型路径，不存在时先导出再量化
+        """
+        onnx_dir = os.path.join(self.model_path, "onnx")
+        fp32_path = os.path.join(onnx_dir, "model.onnx")
+        int8_path = os.path.join(onnx_dir, "model_qint8.onnx")
+        if os.path.exists(int8_path):
+            return int8_path
+
+        os.makedirs(onnx_dir, exist_ok=True)
+        if not os.path.exists(fp32_path):
+            self._export_onnx(fp32_path)
+
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # 先写到临时文件再重命名，避免多个进程同时量化时读到写了一半的模型
+        tmp_path = f"{int8_path}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+        logger.info(f"重排序模型int8动态量化完成:{int8_path}")
+        return int8_path
+
+    def _export_onnx(self, fp32_path):
+        """
+        把本地的HuggingFace交叉编码器导出为ONNX模型，batch和序列长度都是动态维度
+        """
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_path)
+        model.eval()
+
+        features = self.tokenizer(
+            [["query", "document"]], padding=True, return_tensors="pt"
+        )
+        input_names = list(features.keys())
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+
+        tmp_path = f"{fp32_path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                args=tuple(features[name] for name in input_names),
+                f=tmp_path,
+                input_names=input_names,
+                output_names=["logits"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+            )
+        os.replace(tmp_path, fp32_path)
+        logger.info(f"重排序模型导出ONNX完成:{fp32_path}")
+
+    def predict(self, pairs):
+        """
+        分批推理，先按文本长度排序让同一批的长度接近，减少padding的计算量，最后按原顺序返回分数
+        """
+        order = sorted(range(len(pairs)), key=lambda idx: len(pairs[idx][1]))
+        scores = [0.0] * len(pairs)
+        for start in range(0, len(order), self.batch_size):
+            batch_indices = order[start : start + self.batch_size]
+            features = self.tokenizer(
+                [pairs[idx] for idx in batch_indices],
+                padding=True,
+                truncation="only_second",
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            inputs = {
+                name: value.astype("int64")
+                for name, value in features.items()
+                if name in self.input_names
+            }
+            logits = self.session.run(None, inputs)[0]
+            for idx, logit in zip(batch_indices, logits[:, 0]):
+                scores[idx] = float(logit)
+        return scores
+
 
 class RerankFactory:
 
     @staticmethod
     def create_reranker(settings):
+        backend = (settings or {}).get("rerank_backend") or Config.RERANK_BACKEND
+        if backend == "onnx":
+            try:
+                return OnnxReranker()
+            except Exception as e:
+                logger.error(f"创建ONNX重排序模型失败，使用本地CrossEncoder重排序:{e}")
         return LocalReranker()
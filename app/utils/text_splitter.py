@@ -1,6 +1,8 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
+from app.utils.tokenizer import tokenize_chinese
+
 
 class TextSplitter:
     def __init__(self, chunk_size: int, chunk_overlap: int):
@@ -17,20 +19,25 @@ class TextSplitter:
         """
         利用RecursiveCharacterTextSplitter分割分档列表
         返回chunk列表
+        每个分块在入库时就完成分词(tokens)，BM25建索引直接使用，查询时只需要对问题分词
         """
-        chunks = self.splitter.split_documents(documents_list)
+        return list(self.iter_split(documents_list, doc_id))
 
-        split_result = []
-        for idx, chunk in enumerate(chunks, 1):
-            # 分块id = 'xxxxx_1,xxxx_2'
-            chunk_id = f"{doc_id}_{idx}" if doc_id else idx
-            split_result.append(
-                {
+    def iter_split(self, documents, doc_id: str):
+        """
+        逐个文档（页）分割，每分割完一页就产出该页的分块，documents可以是生成器
+        每一页单独分割，和 split_documents 一次分割所有页的结果相同，分块编号在所有页之间连续
+        """
+        idx = 0
+        for document in documents:
+            for chunk in self.splitter.split_documents([document]):
+                idx += 1
+                # 分块id = 'xxxxx_1,xxxx_2'
+                chunk_id = f"{doc_id}_{idx}" if doc_id else idx
+                yield {
                     "id": chunk_id,
                     "chunk_index": idx,
                     "text": chunk.page_content,
                     "metadata": chunk.metadata,
+                    "tokens": tokenize_chinese(chunk.page_content),
                 }
-            )
-
-        return split_result
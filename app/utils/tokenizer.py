@@ -0,0 +1,52 @@
+"""
+中文分词工具
+关键词检索(BM25)在入库建索引和查询时共用同一套分词规则，保证词项一致
+"""
+
+import jieba
+
+
+# 停用词，模块加载时创建一次，不再每次分词都重新构建
+STOPWORDS = frozenset(
+    [
+        "的",
+        "了",
+        "在",
+        "是",
+        "和",
+        "有",
+        "与",
+        "对",
+        "等",
+        "为",
+        "也",
+        "就",
+        "都",
+        "要",
+        "可以",
+        "会",
+        "能",
+        "而",
+        "及",
+        "或",
+    ]
+)
+
+
+def tokenize_chinese(text: str) -> list[str]:
+    """
+    中文分词（使用 jieba）
+    Args:
+        text: 输入文本
+    Returns:
+        分词后的词列表
+    """
+    # 使用 jieba 分词
+    words = jieba.lcut(text or "")
+    # 去除停用词和单字
+    tokens = []
+    for word in words:
+        word = word.strip()
+        if len(word) > 1 and word not in STOPWORDS:
+            tokens.append(word)
+    return tokens
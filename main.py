@@ -1,5 +1,8 @@
 import os
+import sys
+import threading
 from app import create_app, Config
+from app.init import warmup_services, start_embedded_worker
 
 # 导入日志获取方法（日志系统会在首次使用时自动从 Config 获取配置并初始化）
 from app.utils.logger import get_logger
@@ -10,8 +13,25 @@ logger = get_logger(__name__)
 
 if __name__ == "__main__":
 
+    # python main.py warmup 只预热服务后退出，可以用来提前导出/下载模型或检查依赖是否可用
+    if len(sys.argv) > 1 and sys.argv[1] == "warmup":
+        results = warmup_services()
+        sys.exit(0 if all(result["ok"] for result in results.values()) else 1)
+
     app = create_app()
 
+    # 服务启动后在后台预热，不阻塞监听端口；debug模式下只在重载后的子进程中预热
+    if Config.WARMUP_ON_STARTUP and (
+        not Config.APP_DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    ):
+        threading.Thread(target=warmup_services, name="warmup", daemon=True).start()
+
+    # 在web进程内领取并处理文档任务；单独部署worker时设置DOCUMENT_WORKER_IN_WEB=false
+    if Config.DOCUMENT_WORKER_IN_WEB and (
+        not Config.APP_DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    ):
+        start_embedded_worker()
+
     # 记录应用启动的信息到日志
     logger.info(f"正在启动raglite，服务在{Config.APP_HOST}:{Config.APP_PORT}")
 
@@ -0,0 +1,38 @@
+import argparse
+import signal
+
+from app.config import Config
+from app.utils.db import init_db
+from app.services.document_worker import DocumentWorker
+
+# 导入日志获取方法（日志系统会在首次使用时自动从 Config 获取配置并初始化）
+from app.utils.logger import get_logger
+
+# 获取当前模块日志记录器（会自动初始化日志系统）
+logger = get_logger(__name__)
+
+
+if __name__ == "__main__":
+    # 文档处理worker，从document_job表领取任务处理，可以启动多个进程或部署到多台机器
+    # python worker.py --concurrency 2
+    parser = argparse.ArgumentParser(description="raglite 文档处理worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=Config.DOCUMENT_WORKER_CONCURRENCY,
+        help="同时处理的任务数",
+    )
+    args = parser.parse_args()
+
+    init_db()
+    worker = DocumentWorker(concurrency=args.concurrency)
+
+    # 收到退出信号后不再领取新任务，等正在处理的任务结束后退出
+    def handle_signal(signum, frame):
+        logger.info(f"收到信号{signum},等待正在处理的任务结束后退出")
+        worker.request_stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    worker.run_forever()